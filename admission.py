@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import deque
+
+from fastapi.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+# Сколько запросов поиска/чата обрабатывается одновременно
+ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", "32"))
+# Сколько запросов может ждать свободного места; остальные сразу получают 503
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "64"))
+# Сколько запрос ждет в очереди, прежде чем получить 503
+ADMISSION_MAX_WAIT_SECONDS = float(os.getenv("ADMISSION_MAX_WAIT", "2"))
+# Границы подсказки Retry-After
+RETRY_AFTER_MIN_SECONDS = 1
+RETRY_AFTER_MAX_SECONDS = 30
+# Вес нового замера в скользящем среднем времени обработки
+SERVICE_TIME_SMOOTHING = 0.1
+ADMISSION_PATHS = ('/search', '/chat')
+ADMISSION_PREFIXES = ('/gateway/',)
+
+OVERLOADED_MESSAGE = "Сервис перегружен, попробуйте позже"
+
+
+class AdmissionController:
+    """Bounded concurrency with a bounded FIFO queue and a maximum wait
+
+    A request either gets a slot right away, waits in the queue for at most
+    max_wait seconds, or is rejected at once when the queue is full. The
+    Retry-After hint comes from the queue depth and the average time a
+    request holds its slot.
+    """
+
+    def __init__(self, max_concurrent=ADMISSION_MAX_CONCURRENT, max_queue=ADMISSION_MAX_QUEUE,
+                 max_wait=ADMISSION_MAX_WAIT_SECONDS):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._active = 0
+        self._waiters = deque()
+        self.service_time = 1.0
+        self.admitted = 0
+        self.rejected = {'queue_full': 0, 'timeout': 0}
+
+    async def acquire(self):
+        """True when the caller got a slot (release it afterwards), False when rejected"""
+        if self._active < self.max_concurrent and not self._waiters:
+            self._active += 1
+            self.admitted += 1
+            return True
+        if len(self._waiters) >= self.max_queue:
+            self.rejected['queue_full'] += 1
+            return False
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.max_wait)
+        except asyncio.TimeoutError:
+            self._remove(waiter)
+            self.rejected['timeout'] += 1
+            return False
+        except BaseException:
+            # Клиент ушел: место, если уже передано, возвращаем следующему
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            self._remove(waiter)
+            raise
+        self.admitted += 1
+        return True
+
+    def _remove(self, waiter):
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def release(self, held_seconds=None):
+        if held_seconds is not None:
+            self.service_time += SERVICE_TIME_SMOOTHING * (held_seconds - self.service_time)
+        # Место переходит первому живому ожидающему, счетчик не меняется
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(True)
+                return
+        self._active -= 1
+
+    def retry_after(self):
+        """Seconds until a slot is likely free"""
+        backlog = (len(self._waiters) + 1) / self.max_concurrent
+        seconds = math.ceil(backlog * self.service_time)
+        return max(RETRY_AFTER_MIN_SECONDS, min(RETRY_AFTER_MAX_SECONDS, seconds))
+
+    def stats(self):
+        return {
+            'active': self._active,
+            'queued': len(self._waiters),
+            'max_concurrent': self.max_concurrent,
+            'max_queue': self.max_queue,
+            'admitted': self.admitted,
+            'rejected': dict(self.rejected),
+            'service_time': round(self.service_time, 3),
+            'retry_after': self.retry_after(),
+        }
+
+
+class AdmissionMiddleware:
+    """Admission control for the search and chat endpoints; 503 + Retry-After when overloaded"""
+
+    def __init__(self, app, controller, paths=ADMISSION_PATHS, prefixes=ADMISSION_PREFIXES):
+        self.app = app
+        self.controller = controller
+        self.paths = paths
+        self.prefixes = prefixes
+
+    def _guarded(self, scope):
+        if scope['type'] != 'http' or scope['method'] != 'POST':
+            return False
+        return scope['path'] in self.paths or scope['path'].startswith(self.prefixes)
+
+    async def __call__(self, scope, receive, send):
+        if not self._guarded(scope):
+            await self.app(scope, receive, send)
+            return
+        if not await self.controller.acquire():
+            retry_after = self.controller.retry_after()
+            logger.warning(f"Request to {scope['path']} rejected by admission control, retry after {retry_after}s")
+            response = JSONResponse(
+                status_code=503, content={"error": OVERLOADED_MESSAGE}, headers={'Retry-After': str(retry_after)}
+            )
+            await response(scope, receive, send)
+            return
+        started = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(time.monotonic() - started)
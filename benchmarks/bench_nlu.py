@@ -0,0 +1,172 @@
+"""Speed and accuracy of TourChatbot turns on a labeled corpus
+
+Every case puts a fresh TourChatbot in a dialog state, sends one user
+message and checks what the bot understood. OpenAI is replaced by a stub
+that answers from the corpus `llm_answers` (recorded answers of the real
+model, 'неизвестно' otherwise), and the TourVisor dictionaries come from
+the corpus `reference`, so runs are offline and repeatable.
+
+    python benchmarks/bench_nlu.py [--corpus benchmarks/nlu_corpus.json]
+                                   [--repeat 20] [--llm-latency-ms 0] [--no-llm] [--errors]
+
+Per state it reports turn latency (p50/p95/max), how often the LLM
+fallback was called and the share of cases understood correctly; with
+--no-llm the stub never recognizes anything, which shows the accuracy of
+the local matchers alone.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from chatbot import TourChatbot, ChatSession, ConversationState  # noqa: E402
+from reference_data import reference_store  # noqa: E402
+
+CORPUS_PATH = os.path.join(REPO_DIR, 'benchmarks', 'nlu_corpus.json')
+
+# Слоты предыдущих шагов (проверяемый шаг перезаписывает свой слот)
+FILLED_SLOTS = {
+    'departure': '1', 'departures': ['1'], 'country': '4', 'countries': ['4'],
+    'nights_from': 7, 'nights_to': 10, 'adults': 2, 'children': 0,
+}
+
+
+class StubLLM:
+    """Answers from recorded LLM replies to the user message and counts calls"""
+
+    def __init__(self, answers, latency=0.0):
+        self.answers = {text.lower().strip(): answer for text, answer in answers.items()}
+        self.latency = latency
+        self.calls = 0
+
+    async def __call__(self, messages, temperature, max_tokens):
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self.answers.get(messages[-1]['content'].lower().strip(), 'неизвестно')
+
+
+def understood(state, chatbot, reply):
+    """What the bot took from the message in `state`, None if it did not accept it"""
+    session = chatbot.session
+    if state == ConversationState.ASK_DEPARTURE:
+        return session.user_data['departures'] if session.state == ConversationState.ASK_COUNTRY else None
+    if state == ConversationState.ASK_COUNTRY:
+        return session.user_data['countries'] if session.state == ConversationState.ASK_TRIP_LENGTH else None
+    if state == ConversationState.ASK_TRIP_LENGTH:
+        if session.state != ConversationState.ASK_ADULTS:
+            return None
+        nights = (session.user_data['nights_from'], session.user_data['nights_to'])
+        return next(key for key, value in chatbot.catalog.trip_length_mapping.items() if value == nights)
+    if state == ConversationState.ASK_ADULTS:
+        return session.user_data['adults'] if session.state == ConversationState.ASK_CHILDREN else None
+    if state == ConversationState.ASK_CHILDREN:
+        return session.user_data['children'] if session.state == ConversationState.ASK_FILTERS else None
+    if state == ConversationState.ASK_FILTERS:
+        return session.user_data['filters'] if session.state == ConversationState.CONFIRM else None
+    if state == ConversationState.CONFIRM:
+        if isinstance(reply, tuple) and reply[0] == "SEARCH_READY":
+            return 'yes'
+        return 'no' if session.state == ConversationState.INIT else None
+    raise ValueError(f"no check for state {state.name}")
+
+
+async def run_case(case, llm):
+    state = ConversationState[case['state']]
+    chatbot = TourChatbot(llm=llm, session=ChatSession(state, dict(FILLED_SLOTS)))
+    calls = llm.calls
+    started = time.perf_counter()
+    reply = await chatbot.aget_next_message(case['input'])
+    elapsed = time.perf_counter() - started
+    return elapsed, llm.calls > calls, understood(state, chatbot, reply)
+
+
+def use_reference(data):
+    """Run against the corpus' reference tables (regions) instead of the local snapshot"""
+    with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False, encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    reference_store.path = f.name
+    reference_store.reload_if_changed()
+    os.unlink(f.name)
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(int(len(values) * share), len(values) - 1)]
+
+
+async def run(corpus, repeat, llm_latency, llm_answers=True):
+    llm = StubLLM(corpus.get('llm_answers', {}) if llm_answers else {}, llm_latency)
+    # Прогрев: справочники, варианты названий стран и ленивые импорты
+    await run_case({'state': 'ASK_COUNTRY', 'input': 'турцыя'}, StubLLM({}))
+
+    latencies = defaultdict(list)
+    fallbacks = defaultdict(int)
+    correct = defaultdict(int)
+    totals = defaultdict(int)
+    errors = []
+    for case in corpus['cases']:
+        state = case['state']
+        for number in range(repeat):
+            elapsed, used_llm, got = await run_case(case, llm)
+            latencies[state].append(elapsed)
+            if number > 0:
+                continue
+            totals[state] += 1
+            fallbacks[state] += used_llm
+            if got == case['expected']:
+                correct[state] += 1
+            else:
+                errors.append((state, case['input'], case['expected'], got))
+    return latencies, fallbacks, correct, totals, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--corpus', default=CORPUS_PATH)
+    parser.add_argument('--repeat', type=int, default=20, help="runs of every case for the latency figures")
+    parser.add_argument('--llm-latency-ms', type=float, default=0, help="simulated OpenAI latency")
+    parser.add_argument('--no-llm', action='store_true', help="stub LLM recognizes nothing")
+    parser.add_argument('--errors', action='store_true', help="list the cases the bot got wrong")
+    args = parser.parse_args()
+
+    with open(args.corpus, encoding='utf-8') as f:
+        corpus = json.load(f)
+    if corpus.get('reference'):
+        use_reference(corpus['reference'])
+    latencies, fallbacks, correct, totals, errors = asyncio.run(
+        run(corpus, args.repeat, args.llm_latency_ms / 1000, llm_answers=not args.no_llm)
+    )
+
+    llm = "recognizes nothing" if args.no_llm else f"latency {args.llm_latency_ms:.0f} ms"
+    print(f"{len(corpus['cases'])} cases x {args.repeat} runs, stub LLM {llm}")
+    print(f"{'state':<16} {'cases':>6} {'p50 us':>9} {'p95 us':>9} {'max us':>9} {'LLM calls':>10} {'accuracy':>9}")
+    for state in totals:
+        values = latencies[state]
+        print(f"{state:<16} {totals[state]:>6} {percentile(values, 0.5) * 1e6:>9.0f} "
+              f"{percentile(values, 0.95) * 1e6:>9.0f} {max(values) * 1e6:>9.0f} "
+              f"{fallbacks[state] / totals[state]:>10.0%} {correct[state] / totals[state]:>9.0%}")
+    all_latencies = [value for values in latencies.values() for value in values]
+    total = sum(totals.values())
+    print(f"{'all':<16} {total:>6} {percentile(all_latencies, 0.5) * 1e6:>9.0f} "
+          f"{percentile(all_latencies, 0.95) * 1e6:>9.0f} {max(all_latencies) * 1e6:>9.0f} "
+          f"{sum(fallbacks.values()) / total:>10.0%} {sum(correct.values()) / total:>9.0%}")
+    print(f"mean turn {statistics.mean(all_latencies) * 1e6:.0f} us")
+
+    if args.errors:
+        print("\nmisunderstood:")
+        for state, text, expected, got in errors:
+            print(f"  {state:<16} {text!r:<24} expected {expected!r}, got {got!r}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,122 @@
+"""Memory of chat sessions: RSS of 100k simulated conversations
+
+Each layout runs in a fresh interpreter that builds the shared catalog,
+then holds N sessions mid-conversation (slots filled, a short chat history)
+and reports the RSS growth per session.
+
+    python benchmarks/bench_sessions.py [--sessions 100000] [--history 2]
+
+Layouts:
+  previous  - TourChatbot as it was: per-instance __dict__ with its own copies
+              of departure cities and trip length tables
+  chatbot   - TourChatbot with a slotted ChatSession and the shared ChatCatalog
+  session   - the ChatSession records alone
+  saved     - the to_state() dicts the in-memory state backend keeps
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LAYOUTS = ('previous', 'chatbot', 'session', 'saved')
+
+PROBE = """
+import json, sys
+sys.path.insert(0, {repo!r})
+from chatbot import TourChatbot, ChatSession, ChatCatalog, ConversationState, FEATURED_DEPARTURES, openai_complete
+from reference_data import get_reference
+
+
+class PreviousChatbot:
+    def __init__(self):
+        self.state = ConversationState.INIT
+        self.llm = openai_complete
+        self.user_data = {{}}
+        self.chat_history = []
+        self.reference = get_reference()
+        self.departure_cities = {{
+            id: self.reference.departures[id]
+            for id in FEATURED_DEPARTURES if id in self.reference.departures
+        }} or dict(self.reference.departures)
+        self.countries = self.reference.countries
+        self.trip_lengths = {{
+            "1": "Короткая (5-7 ночей)",
+            "2": "Средняя (7-10 ночей)",
+            "3": "Длинная (10-14 ночей)",
+            "4": "Очень длинная (14-21 ночь)"
+        }}
+        self.trip_length_mapping = {{"1": (5, 7), "2": (7, 10), "3": (10, 14), "4": (14, 21)}}
+        self.country_variations = catalog.country_variations
+
+
+def rss_kb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+
+
+def fill(number, session):
+    session.state = ConversationState.CONFIRM
+    session.user_data = {{
+        'departure': '1', 'departures': ['1'], 'country': str(number % 40 + 1), 'countries': [str(number % 40 + 1)],
+        'nights_from': 7, 'nights_to': 10, 'adults': 2, 'children': number % 3,
+    }}
+    session.chat_history = [
+        {{'role': 'user' if turn % 2 == 0 else 'assistant', 'content': f"сообщение {{turn}} сессии {{number}}"}}
+        for turn in range({history})
+    ]
+
+
+catalog = ChatCatalog.for_reference(get_reference())
+TourChatbot()
+before = rss_kb()
+sessions = []
+for number in range({sessions}):
+    if {layout!r} == 'previous':
+        record = PreviousChatbot()
+        fill(number, record)
+    elif {layout!r} == 'chatbot':
+        record = TourChatbot()
+        fill(number, record.session)
+    else:
+        record = ChatSession()
+        fill(number, record)
+        if {layout!r} == 'saved':
+            record = record.to_state()
+    sessions.append(record)
+print(json.dumps({{'kb': rss_kb() - before}}))
+"""
+
+
+def run_layout(layout, sessions, history, workdir):
+    code = PROBE.format(repo=REPO_DIR, layout=layout, sessions=sessions, history=history)
+    proc = subprocess.run([sys.executable, '-c', code], cwd=workdir, capture_output=True, text=True)
+    if proc.returncode != 0:
+        sys.stderr.write(proc.stderr)
+        raise SystemExit(f"{layout} probe failed with code {proc.returncode}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])['kb']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=100_000)
+    parser.add_argument('--history', type=int, default=2, help="chat messages per session")
+    parser.add_argument('--layouts', default=','.join(LAYOUTS))
+    args = parser.parse_args()
+
+    print(f"{args.sessions} sessions, {args.history} history messages each")
+    print(f"{'layout':<10} {'RSS MB':>9} {'bytes/session':>14}")
+    with tempfile.TemporaryDirectory() as workdir:
+        for layout in args.layouts.split(','):
+            kb = run_layout(layout, args.sessions, args.history, workdir)
+            print(f"{layout:<10} {kb / 1024:>9.1f} {kb * 1024 / args.sessions:>14.0f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,101 @@
+"""Startup budget for `import main`
+
+Imports main.py in fresh interpreters, reports the best time and the
+slowest modules (from -X importtime) and exits non-zero when the import
+is over budget or pulls in modules that must stay lazy.
+
+    python benchmarks/bench_startup.py [--runs 5] [--budget-ms 1200] [--top 15]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Измерено ~650 мс на dev-машине после ленивых импортов (до них ~1700 мс), бюджет с запасом
+STARTUP_BUDGET_MS = int(os.getenv("STARTUP_BUDGET_MS", "1200"))
+# Эти модули грузятся при первом обращении к LLM / распознаванию страны
+LAZY_MODULES = ('openai', 'pycountry', 'thefuzz')
+
+PROBE = f"""
+import json, sys, time
+sys.path.insert(0, {REPO_DIR!r})
+started = time.perf_counter()
+import main
+elapsed = (time.perf_counter() - started) * 1000
+print(json.dumps({{'ms': elapsed, 'loaded': [m for m in {LAZY_MODULES!r} if m in sys.modules]}}))
+"""
+
+
+def run_probe(workdir, importtime=False):
+    command = [sys.executable]
+    if importtime:
+        command += ['-X', 'importtime']
+    command += ['-c', PROBE]
+    env = dict(os.environ, PRICE_HISTORY_DIR=os.path.join(workdir, 'prices'),
+               STATE_BACKEND=f"sqlite:///{os.path.join(workdir, 'state.db')}")
+    proc = subprocess.run(command, cwd=workdir, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        sys.stderr.write(proc.stderr)
+        raise SystemExit(f"import main failed with code {proc.returncode}")
+    return json.loads(proc.stdout.strip().splitlines()[-1]), proc.stderr
+
+
+def slowest_modules(importtime_log, top):
+    """(cumulative us, module) of the slowest modules imported by main.py"""
+    rows = []
+    for line in importtime_log.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative_us, name = line[len('import time:'):].split('|')
+        # Уровень вложенности задается отступом: берем прямые импорты main.py
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1:
+            rows.append((int(cumulative_us), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-ms', type=int, default=STARTUP_BUDGET_MS)
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # Шаблоны main.py ищет относительно рабочего каталога
+        os.symlink(os.path.join(REPO_DIR, 'templates'), os.path.join(workdir, 'templates'))
+
+        timings = []
+        loaded = []
+        for _ in range(args.runs):
+            result, _ = run_probe(workdir)
+            timings.append(result['ms'])
+            loaded = result['loaded']
+        _, importtime_log = run_probe(workdir, importtime=True)
+        created = sorted(set(os.listdir(workdir)) - {'templates'})
+
+    best = min(timings)
+    print(f"import main: best {best:.0f} ms, median {sorted(timings)[len(timings) // 2]:.0f} ms "
+          f"over {args.runs} runs (budget {args.budget_ms} ms)")
+    print("slowest imports of main.py (cumulative):")
+    for cumulative_us, name in slowest_modules(importtime_log, args.top):
+        print(f"  {cumulative_us / 1000:8.1f} ms  {name}")
+
+    failures = []
+    if best > args.budget_ms:
+        failures.append(f"startup {best:.0f} ms is over the {args.budget_ms} ms budget")
+    if loaded:
+        failures.append(f"modules imported eagerly: {', '.join(loaded)}")
+    if created:
+        failures.append(f"import created files: {', '.join(created)}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,216 @@
+"""Latency and price regret of search polling termination policies
+
+Replays search timelines (the status and hotel prices seen at every poll of
+a TourVisor search) through termination.TerminationPolicy and compares it
+with waiting for state=finished.
+
+    # record real timelines (needs TOURVISOR_LOGIN / TOURVISOR_PASS)
+    python benchmarks/bench_termination.py --record --country 4 --departure 1 --count 10
+    # replay everything in benchmarks/timelines/
+    python benchmarks/bench_termination.py
+    # no recordings yet: replay generated timelines instead
+    python benchmarks/bench_termination.py --synthetic 200
+
+Synthetic timelines model operators answering at log-normal times with one
+slow operator in the tail; they show how the policy behaves, the recorded
+ones show what it is worth.
+"""
+import argparse
+import glob
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from termination import TerminationPolicy, TERMINATION_TOP_N  # noqa: E402
+
+TIMELINES_DIR = os.path.join(REPO_DIR, 'benchmarks', 'timelines')
+POLL_INTERVAL_SECONDS = 2.5
+RECORD_MAX_SECONDS = 90
+# Сколько цен отелей хранить на каждый опрос
+RECORDED_PRICES = 25
+
+
+def _price(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def record(args):
+    """Poll real searches until finished, saving status and hotel prices of every poll"""
+    from tour_search import TourSearch
+
+    tour_search = TourSearch()
+    os.makedirs(TIMELINES_DIR, exist_ok=True)
+    start_date = datetime.now() + timedelta(days=1)
+    params = {
+        'departure': args.departure,
+        'country': args.country,
+        'datefrom': start_date.strftime('%Y-%m-%d'),
+        'dateto': (start_date + timedelta(days=30)).strftime('%Y-%m-%d'),
+        'nightsfrom': 7,
+        'nightsto': 14,
+        'adults': 2,
+        'child': 0,
+    }
+    for number in range(args.count):
+        response = tour_search.create_search_request(params)
+        request_id = (response or {}).get('requestid')
+        if not request_id:
+            print(f"search {number + 1}: no request id ({response})")
+            continue
+        started = time.monotonic()
+        polls = []
+        while time.monotonic() - started < RECORD_MAX_SECONDS:
+            time.sleep(args.interval)
+            results = tour_search.get_search_results(request_id) or {}
+            hotels = (results.get('result') or {}).get('hotels') or []
+            prices = sorted(p for p in (_price(hotel.get('price')) for hotel in hotels) if p > 0)
+            polls.append({
+                't': round(time.monotonic() - started, 2),
+                'status': results.get('status') or {},
+                'prices': prices[:RECORDED_PRICES],
+            })
+            if (results.get('status') or {}).get('state') == 'finished':
+                break
+        path = os.path.join(TIMELINES_DIR, f"{datetime.now():%Y%m%d-%H%M%S}-{args.country}-{request_id}.json")
+        with open(path, 'w') as f:
+            json.dump({'params': params, 'interval': args.interval, 'polls': polls}, f)
+        print(f"search {number + 1}: {len(polls)} polls, {polls[-1]['t'] if polls else 0}s -> {path}")
+
+
+def synthetic_timeline(rng, interval=POLL_INTERVAL_SECONDS):
+    operators = rng.randint(6, 20)
+    base = rng.uniform(40000, 150000)
+    answers = []
+    for number in range(operators):
+        # Один оператор из выборки обычно сильно опаздывает
+        delay = rng.uniform(15, 45) if number == 0 else rng.lognormvariate(1.0, 0.7)
+        prices = [base * rng.lognormvariate(0.15, 0.25) for _ in range(rng.randint(3, 25))]
+        answers.append((delay, prices))
+    finished_at = max(delay for delay, _ in answers)
+
+    polls = []
+    t = interval
+    while True:
+        done = [prices for delay, prices in answers if delay <= t]
+        prices = sorted(price for chunk in done for price in chunk)
+        finished = t >= finished_at
+        polls.append({
+            't': round(t, 2),
+            'status': {
+                'state': 'finished' if finished else 'searching',
+                'progress': int(100 * len(done) / operators),
+                'hotelsfound': len(prices),
+                'minprice': int(prices[0]) if prices else 0,
+            },
+            'prices': [int(price) for price in prices[:RECORDED_PRICES]],
+        })
+        if finished:
+            return {'params': {'synthetic': True}, 'interval': interval, 'polls': polls}
+        t += interval
+
+
+def load_timelines(pattern):
+    timelines = []
+    for path in sorted(glob.glob(pattern)):
+        with open(path) as f:
+            timelines.append(json.load(f))
+    return [timeline for timeline in timelines if timeline.get('polls')]
+
+
+def snapshot(poll, with_hotels):
+    result = {'status': poll['status']}
+    if with_hotels:
+        result['result'] = {'hotels': [{'price': price} for price in poll['prices']]}
+    return result
+
+
+def replay(timeline, make_policy, with_hotels, top_n):
+    """(seconds until the policy stopped, relative price regret, cheapest offer missed)"""
+    policy = make_policy()
+    polls = timeline['polls']
+    stopped = polls[-1]
+    for poll in polls:
+        if policy.observe(snapshot(poll, with_hotels)) is not None:
+            stopped = poll
+            break
+    final = polls[-1]['prices'][:top_n]
+    got = stopped['prices'][:top_n]
+    if not final:
+        return stopped['t'], 0.0, False
+    if len(got) < len(final):
+        # Недостающие места в топе считаем по худшей итоговой цене
+        got = got + [final[-1]] * (len(final) - len(got))
+    regret = (sum(got) - sum(final)) / sum(final)
+    return stopped['t'], max(regret, 0.0), (got[0] if got else float('inf')) > final[0]
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(int(len(values) * share), len(values) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--record', action='store_true', help="record real search timelines")
+    parser.add_argument('--country', default='4')
+    parser.add_argument('--departure', default='1')
+    parser.add_argument('--count', type=int, default=10)
+    parser.add_argument('--interval', type=float, default=POLL_INTERVAL_SECONDS)
+    parser.add_argument('--timelines', default=os.path.join(TIMELINES_DIR, '*.json'))
+    parser.add_argument('--synthetic', type=int, default=0, help="replay this many generated timelines")
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--top-n', type=int, default=TERMINATION_TOP_N)
+    args = parser.parse_args()
+
+    if args.record:
+        record(args)
+        return 0
+
+    if args.synthetic:
+        rng = random.Random(args.seed)
+        timelines = [synthetic_timeline(rng, args.interval) for _ in range(args.synthetic)]
+        source = f"{len(timelines)} synthetic timelines (seed {args.seed})"
+    else:
+        timelines = load_timelines(args.timelines)
+        source = f"{len(timelines)} recorded timelines from {args.timelines}"
+    if not timelines:
+        print("No timelines: record some with --record or use --synthetic N")
+        return 1
+
+    top_n = args.top_n
+    policies = [
+        ("wait for finished", lambda: TerminationPolicy(enabled=False), False),
+        ("status minprice, no progress gate", lambda: TerminationPolicy(min_progress=0), False),
+        ("status minprice, 2 stable polls", lambda: TerminationPolicy(), False),
+        (f"top-{top_n} prices, 2 stable polls", lambda: TerminationPolicy(top_n=top_n), True),
+        (f"top-{top_n} prices, 3 stable polls", lambda: TerminationPolicy(top_n=top_n, stable_polls=3), True),
+        (f"top-{top_n} prices, unchanged only", lambda: TerminationPolicy(top_n=top_n, min_gain=0), True),
+    ]
+
+    print(source)
+    print(f"regret: how much more the top-{top_n} offers cost at the stop than at the end of the search")
+    print(f"{'policy':<34} {'p50 s':>7} {'p95 s':>7} {'saved':>7} {'regret':>8} {'missed cheapest':>16}")
+    baseline = None
+    for name, make_policy, with_hotels in policies:
+        runs = [replay(timeline, make_policy, with_hotels, top_n) for timeline in timelines]
+        latencies = [latency for latency, _, _ in runs]
+        mean_latency = statistics.mean(latencies)
+        baseline = baseline or mean_latency
+        print(f"{name:<34} {percentile(latencies, 0.5):>7.1f} {percentile(latencies, 0.95):>7.1f} "
+              f"{1 - mean_latency / baseline:>7.0%} {statistics.mean(r for _, r, _ in runs):>8.2%} "
+              f"{sum(missed for _, _, missed in runs) / len(runs):>16.0%}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,24 +2,57 @@ from datetime import datetime, timedelta
 import logging
 from enum import Enum, auto
 import json
-from thefuzz import fuzz
-from thefuzz import process
-import pycountry
+import re
 from typing import Dict, Tuple
-import openai
 import os
+import asyncio
+import weakref
+from types import MappingProxyType
 from dotenv import load_dotenv
+from reference_data import get_reference
+from search_filters import build_filters, describe_filters, parse_filters_text, FilterError
+from tracing import span
 
 # Load environment variables
 load_dotenv()
 
-# Configure OpenAI
-openai.api_key = os.getenv('OPENAI_API_KEY')
+# openai, pycountry и thefuzz тяжелые - импортируются при первом использовании,
+# чтобы не замедлять запуск воркеров (ключ OpenAI берется из OPENAI_API_KEY)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Города вылета, которые чатбот предлагает списком (остальные можно ввести названием)
+FEATURED_DEPARTURES = os.getenv("CHATBOT_DEPARTURES", "1,2,3").split(",")
+
+# Разделители для нескольких вариантов: "Турция или Египет", "1, 2"
+CHOICE_SEPARATORS = re.compile(r'\s*(?:,|;|/|\bили\b|\bor\b)\s*', re.IGNORECASE)
+
+def split_user_choices(user_input: str):
+    """Split 'Турция или Египет' / '1, 2' into separate choices"""
+    return [part for part in CHOICE_SEPARATORS.split(user_input.strip()) if part]
+
+# Клиенты OpenAI привязаны к циклу событий (синхронная обертка запускает свой цикл)
+_openai_clients = weakref.WeakKeyDictionary()
+
+async def openai_complete(messages, temperature, max_tokens):
+    """Chat completion text from OpenAI without blocking the event loop"""
+    import openai
+
+    loop = asyncio.get_running_loop()
+    client = _openai_clients.get(loop)
+    if client is None:
+        client = _openai_clients[loop] = openai.AsyncOpenAI()
+    with span('openai.complete', max_tokens=max_tokens):
+        response = await client.chat.completions.create(
+            model="gpt-3.5-turbo",
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens
+        )
+    return response.choices[0].message.content
+
 class ConversationState(Enum):
     INIT = auto()
     ASK_DEPARTURE = auto()
@@ -27,113 +60,82 @@ class ConversationState(Enum):
     ASK_TRIP_LENGTH = auto()
     ASK_ADULTS = auto()
     ASK_CHILDREN = auto()
+    ASK_FILTERS = auto()
     CONFIRM = auto()
     SEARCHING = auto()
     GENERAL_CHAT = auto()  # New state for general chat
     DONE = auto()
 
-class TourChatbot:
-    def __init__(self):
-        self.state = ConversationState.INIT
-        self.user_data = {}
-        self.chat_history = []  # Store chat history for context
-        self.departure_cities = {
-            "1": "Москва",
-            "2": "Санкт-Петербург",
-            "3": "Казань"
-        }
-        self.countries = {
-            "46": "Абхазия",
-            "31": "Австрия",
-            "55": "Азербайджан",
-            "71": "Албания",
-            "17": "Андорра",
-            "88": "Аргентина",
-            "53": "Армения",
-            "72": "Аруба",
-            "59": "Бахрейн",
-            "57": "Беларусь",
-            "20": "Болгария",
-            "39": "Бразилия",
-            "44": "Великобритания",
-            "37": "Венгрия",
-            "90": "Венесуэла",
-            "16": "Вьетнам",
-            "38": "Германия",
-            "6": "Греция",
-            "54": "Грузия",
-            "11": "Доминикана",
-            "1": "Египет",
-            "30": "Израиль",
-            "3": "Индия",
-            "7": "Индонезия",
-            "29": "Иордания",
-            "92": "Иран",
-            "14": "Испания",
-            "24": "Италия",
-            "78": "Казахстан",
-            "40": "Камбоджа",
-            "79": "Катар",
-            "51": "Кения",
-            "15": "Кипр",
-            "60": "Киргизия",
-            "13": "Китай",
-            "10": "Куба",
-            "80": "Ливан",
-            "27": "Маврикий",
-            "36": "Малайзия",
-            "8": "Мальдивы",
-            "50": "Мальта",
-            "23": "Марокко",
-            "18": "Мексика",
-            "81": "Мьянма",
-            "82": "Непал",
-            "9": "ОАЭ",
-            "64": "Оман",
-            "87": "Панама",
-            "35": "Португалия",
-            "47": "Россия",
-            "93": "Саудовская Аравия",
-            "28": "Сейшелы",
-            "58": "Сербия",
-            "25": "Сингапур",
-            "43": "Словения",
-            "2": "Таиланд",
-            "41": "Танзания",
-            "5": "Тунис",
-            "4": "Турция",
-            "56": "Узбекистан",
-            "26": "Филиппины",
-            "34": "Финляндия",
-            "32": "Франция",
-            "22": "Хорватия",
-            "21": "Черногория",
-            "19": "Чехия",
-            "52": "Швейцария",
-            "12": "Шри-Ланка",
-            "69": "Эстония",
-            "70": "Южная Корея",
-            "33": "Ямайка",
-            "49": "Япония"
-        }
-        self.trip_lengths = {
-            "1": "Короткая (5-7 ночей)",
-            "2": "Средняя (7-10 ночей)",
-            "3": "Длинная (10-14 ночей)",
-            "4": "Очень длинная (14-21 ночь)"
-        }
-        self.trip_length_mapping = {
-            "1": (5, 7),
-            "2": (7, 10),
-            "3": (10, 14),
-            "4": (14, 21)
+# Длительности поездки общие для всех сессий
+TRIP_LENGTHS = MappingProxyType({
+    "1": "Короткая (5-7 ночей)",
+    "2": "Средняя (7-10 ночей)",
+    "3": "Длинная (10-14 ночей)",
+    "4": "Очень длинная (14-21 ночь)"
+})
+TRIP_LENGTH_MAPPING = MappingProxyType({
+    "1": (5, 7),
+    "2": (7, 10),
+    "3": (10, 14),
+    "4": (14, 21)
+})
+# Сколько сообщений истории хранится в сессии
+SESSION_HISTORY_LIMIT = 20
+
+class ChatSession:
+    """Per-user conversation state: dialog state, slot values and recent chat history"""
+    __slots__ = ('state', 'user_data', 'chat_history')
+
+    def __init__(self, state=ConversationState.INIT, user_data=None, chat_history=None):
+        self.state = state
+        self.user_data = user_data if user_data is not None else {}
+        self.chat_history = chat_history if chat_history is not None else []
+
+    def to_state(self):
+        """Session as a JSON-serializable dict"""
+        return {
+            'state': self.state.name,
+            'user_data': self.user_data,
+            'chat_history': self.chat_history[-SESSION_HISTORY_LIMIT:],
         }
-        
-        # Create reverse mapping and common variations
-        self.country_variations = self._create_country_variations()
+
+    @classmethod
+    def from_state(cls, state):
+        """Session saved with to_state()"""
+        return cls(ConversationState[state['state']], state.get('user_data', {}), state.get('chat_history', []))
+
+class ChatCatalog:
+    """Read-only conversation data shared by all sessions of a reference snapshot
+
+    Departure cities, countries, trip lengths and country name variations
+    are built once per snapshot of the TourVisor dictionaries, not per user.
+    """
+    __slots__ = ('reference', 'departure_cities', 'countries', 'trip_lengths', 'trip_length_mapping',
+                 'country_variations')
+    _cache = weakref.WeakKeyDictionary()
+
+    def __init__(self, reference):
+        self.reference = reference
+        self.departure_cities = MappingProxyType({
+            id: reference.departures[id]
+            for id in FEATURED_DEPARTURES if id in reference.departures
+        } or dict(reference.departures))
+        self.countries = MappingProxyType(reference.countries)
+        self.trip_lengths = TRIP_LENGTHS
+        self.trip_length_mapping = TRIP_LENGTH_MAPPING
+        self.country_variations = MappingProxyType(self._create_country_variations())
+
+    @classmethod
+    def for_reference(cls, reference):
+        catalog = cls._cache.get(reference)
+        if catalog is None:
+            catalog = cls._cache[reference] = cls(reference)
+        return catalog
 
     def _create_country_variations(self) -> Dict[str, str]:
         """Create a dictionary of country name variations mapping to their IDs"""
+        import pycountry
+
         variations = {}
         
         # Common variations and abbreviations
@@ -173,11 +175,31 @@ class TourChatbot:
             if country := pycountry.countries.get(name=name):
                 variations[country.name.lower()] = id
             
-        # Add special cases
-        variations.update(special_cases)
+        # Add special cases (only for countries present in the reference data)
+        variations.update({k: v for k, v in special_cases.items() if v in self.countries})
         
         return variations
 
+class TourChatbot:
+    """Conversation logic over a per-user ChatSession and the shared ChatCatalog"""
+    __slots__ = ('session', 'catalog', 'llm')
+
+    def __init__(self, llm=None, session=None):
+        self.session = session or ChatSession()
+        # Справочники TourVisor (снимок на диске, см. reference_data.py) и производные от них
+        self.catalog = ChatCatalog.for_reference(get_reference())
+        # async (messages, temperature, max_tokens) -> text
+        self.llm = llm or openai_complete
+
+    def to_state(self):
+        """Conversation state as a JSON-serializable dict"""
+        return self.session.to_state()
+
+    def load_state(self, state):
+        """Restore a conversation saved with to_state()"""
+        self.session = ChatSession.from_state(state)
+        return self
+
     async def _detect_country(self, user_input: str) -> Tuple[str, float]:
         """
         Detect country from user input using multiple methods:
@@ -188,38 +210,39 @@ class TourChatbot:
         user_input = user_input.lower().strip()
         
         # 1. Direct match with variations
-        if user_input in self.country_variations:
-            return self.country_variations[user_input], 1.0
+        if user_input in self.catalog.country_variations:
+            return self.catalog.country_variations[user_input], 1.0
             
         # 2. Fuzzy matching
-        matches = process.extractBests(
-            user_input,
-            self.country_variations.keys(),
-            scorer=fuzz.ratio,
-            score_cutoff=80
-        )
+        from thefuzz import fuzz, process
+
+        with span('chatbot.fuzzy_match', candidates=len(self.catalog.country_variations)):
+            matches = process.extractBests(
+                user_input,
+                self.catalog.country_variations.keys(),
+                scorer=fuzz.ratio,
+                score_cutoff=80
+            )
         
         if matches:
             best_match = matches[0]
-            return self.country_variations[best_match[0]], best_match[1] / 100
+            return self.catalog.country_variations[best_match[0]], best_match[1] / 100
             
         # 3. AI interpretation as fallback
         try:
-            client = openai.OpenAI()
-            response = client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": f"Вы - туристический ассистент. Получив ввод пользователя о стране, сопоставьте его с одной из этих стран: {', '.join(self.countries.values())}. Отвечайте ТОЛЬКО точным названием страны из списка или 'неизвестно', если совпадений нет. Всегда отвечайте на русском языке."},
+            response = await self.llm(
+                [
+                    {"role": "system", "content": f"Вы - туристический ассистент. Получив ввод пользователя о стране, сопоставьте его с одной из этих стран: {', '.join(self.catalog.countries.values())}. Отвечайте ТОЛЬКО точным названием страны из списка или 'неизвестно', если совпадений нет. Всегда отвечайте на русском языке."},
                     {"role": "user", "content": user_input}
                 ],
                 temperature=0.3,
                 max_tokens=50
             )
             
-            suggested_country = response.choices[0].message.content.strip()
+            suggested_country = response.strip()
             
-            if suggested_country.lower() in self.country_variations:
-                return self.country_variations[suggested_country.lower()], 0.8
+            if suggested_country.lower() in self.catalog.country_variations:
+                return self.catalog.country_variations[suggested_country.lower()], 0.8
                 
         except Exception as e:
             logging.error(f"Error using OpenAI API: {e}")
@@ -230,7 +253,7 @@ class TourChatbot:
         """Handle general chat after tour search is complete"""
         try:
             # Add user message to history
-            self.chat_history.append({"role": "user", "content": user_input})
+            self.session.chat_history.append({"role": "user", "content": user_input})
             
             # Prepare the messages with context
             messages = [
@@ -244,27 +267,19 @@ class TourChatbot:
                     "5. Что взять с собой и как подготовиться\n"
                     "6. Визовые требования\n"
                     "7. Местные достопримечательности и развлечения\n\n"
-                    f"Пользователь только что искал туры в {self.countries.get(self.user_data.get('country', ''), 'направление')}. "
+                    f"Пользователь только что искал туры в {self.catalog.countries.get(self.session.user_data.get('country', ''), 'направление')}. "
                     "Будьте полезны и дружелюбны, предоставляйте конкретную и актуальную информацию. "
                     "Всегда отвечайте на русском языке."
                 )}
             ]
             
             # Add relevant chat history (last 5 exchanges)
-            messages.extend(self.chat_history[-10:])
-            
-            client = openai.OpenAI()
-            response = client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=messages,
-                temperature=0.7,
-                max_tokens=500
-            )
+            messages.extend(self.session.chat_history[-10:])
             
-            assistant_response = response.choices[0].message.content
+            assistant_response = await self.llm(messages, temperature=0.7, max_tokens=500)
             
             # Add assistant response to history
-            self.chat_history.append({"role": "assistant", "content": assistant_response})
+            self.session.chat_history.append({"role": "assistant", "content": assistant_response})
             
             # Add helpful suggestions for continuing the conversation
             suggestions = [
@@ -286,59 +301,82 @@ class TourChatbot:
             return "Извините, произошла ошибка. Давайте попробуем еще раз или начнем новый поиск туров?"
 
     def get_next_message(self, user_input=None):
+        """Synchronous wrapper around aget_next_message for code without an event loop"""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.aget_next_message(user_input))
+        raise RuntimeError("get_next_message() called from a running event loop, await aget_next_message() instead")
+
+    async def aget_next_message(self, user_input=None):
         """Process user input and return next message"""
         if user_input and user_input.lower() in ['новый поиск', 'new search']:
-            self.state = ConversationState.INIT
-            self.user_data = {}
-            self.chat_history = []
+            self.session.state = ConversationState.INIT
+            self.session.user_data = {}
+            self.session.chat_history = []
             return self._format_departure_question()
 
-        if self.state == ConversationState.INIT:
-            self.state = ConversationState.ASK_DEPARTURE
+        if self.session.state == ConversationState.INIT:
+            self.session.state = ConversationState.ASK_DEPARTURE
             return self._format_departure_question()
 
         if user_input is None:
             return self._get_current_question()
 
         try:
-            if self.state == ConversationState.ASK_DEPARTURE:
+            if self.session.state == ConversationState.ASK_DEPARTURE:
                 return self._handle_departure(user_input)
-            elif self.state == ConversationState.ASK_COUNTRY:
-                return self._handle_country(user_input)
-            elif self.state == ConversationState.ASK_TRIP_LENGTH:
+            elif self.session.state == ConversationState.ASK_COUNTRY:
+                return await self._handle_country(user_input)
+            elif self.session.state == ConversationState.ASK_TRIP_LENGTH:
                 return self._handle_trip_length(user_input)
-            elif self.state == ConversationState.ASK_ADULTS:
+            elif self.session.state == ConversationState.ASK_ADULTS:
                 return self._handle_adults(user_input)
-            elif self.state == ConversationState.ASK_CHILDREN:
+            elif self.session.state == ConversationState.ASK_CHILDREN:
                 return self._handle_children(user_input)
-            elif self.state == ConversationState.CONFIRM:
+            elif self.session.state == ConversationState.ASK_FILTERS:
+                return self._handle_filters(user_input)
+            elif self.session.state == ConversationState.CONFIRM:
                 return self._handle_confirmation(user_input)
+            elif self.session.state == ConversationState.GENERAL_CHAT:
+                return await self.handle_general_chat(user_input)
         except ValueError as e:
             return str(e)
 
         return "Извините, я не понял ваш ответ. Попробуйте еще раз."
 
     def _format_departure_question(self):
-        options = "\n".join([f"{k}: {v}" for k, v in self.departure_cities.items()])
-        return f"👋 Привет! Я помогу вам найти идеальный тур.\n\nОткуда вы хотите вылететь?\n{options}\n\nВведите номер города:"
+        options = "\n".join([f"{k}: {v}" for k, v in self.catalog.departure_cities.items()])
+        return f"👋 Привет! Я помогу вам найти идеальный тур.\n\nОткуда вы хотите вылететь?\n{options}\n\nВведите номер города (можно несколько через запятую):"
 
     def _handle_departure(self, user_input):
-        if user_input not in self.departure_cities:
+        choices = [
+            choice if choice in self.catalog.departure_cities else self.catalog.reference.departure_id(choice)
+            for choice in split_user_choices(user_input)
+        ]
+        choices = list(dict.fromkeys(choices))
+        if not choices or None in choices:
             return f"Пожалуйста, выберите город из списка:\n{self._format_departure_question()}"
         
-        self.user_data['departure'] = user_input
-        self.state = ConversationState.ASK_COUNTRY
+        self.session.user_data['departure'] = choices[0]
+        self.session.user_data['departures'] = choices
+        self.session.state = ConversationState.ASK_COUNTRY
         
         return (
             "🌍 В какую страну хотите поехать?\n\n"
             "Просто напишите название страны, например:\n"
             "- Турция\n"
             "- ОАЭ\n"
-            "- Таиланд\n\n"
+            "- Таиланд\n"
+            "- Турция или Египет\n\n"
             "Я пойму даже неточные названия и сокращения!"
         )
 
     async def _handle_country(self, user_input):
+        choices = split_user_choices(user_input)
+        if len(choices) > 1:
+            return await self._handle_countries(choices)
+
         country_id, confidence = await self._detect_country(user_input)
         
         if not country_id or confidence < 0.6:
@@ -349,24 +387,49 @@ class TourChatbot:
             )
         
         if confidence < 0.8:
-            country_name = self.countries[country_id]
+            country_name = self.catalog.countries[country_id]
             return f"🤔 Вы имели в виду {country_name}? (да/нет)"
             
-        self.user_data['country'] = country_id
-        self.state = ConversationState.ASK_TRIP_LENGTH
+        self.session.user_data['country'] = country_id
+        self.session.user_data['countries'] = [country_id]
+        self.session.state = ConversationState.ASK_TRIP_LENGTH
         
-        options = "\n".join([f"{k}: {v}" for k, v in self.trip_lengths.items()])
+        return self._format_trip_length_question()
+
+    async def _handle_countries(self, choices):
+        """Handle several countries at once, e.g. 'Турция или Египет'"""
+        country_ids = []
+        # Варианты распознаются параллельно - запросы к OpenAI не ждут друг друга
+        detected = await asyncio.gather(*(self._detect_country(choice) for choice in choices))
+        for choice, (country_id, confidence) in zip(choices, detected):
+            if not country_id or confidence < 0.8:
+                return (
+                    f"🤔 Извините, я не уверен, какую страну вы имели в виду под «{choice}».\n"
+                    "Пожалуйста, перечислите страны через запятую или 'или'.\n"
+                    "Например: Турция или Египет"
+                )
+            if country_id not in country_ids:
+                country_ids.append(country_id)
+
+        self.session.user_data['country'] = country_ids[0]
+        self.session.user_data['countries'] = country_ids
+        self.session.state = ConversationState.ASK_TRIP_LENGTH
+
+        return self._format_trip_length_question()
+
+    def _format_trip_length_question(self):
+        options = "\n".join([f"{k}: {v}" for k, v in self.catalog.trip_lengths.items()])
         return f"⌛ Какой длительности тур вы предпочитаете?\n{options}\n\nВведите номер варианта:"
 
     def _handle_trip_length(self, user_input):
-        if user_input not in self.trip_lengths:
-            options = "\n".join([f"{k}: {v}" for k, v in self.trip_lengths.items()])
+        if user_input not in self.catalog.trip_lengths:
+            options = "\n".join([f"{k}: {v}" for k, v in self.catalog.trip_lengths.items()])
             return f"Пожалуйста, выберите длительность из списка:\n{options}"
         
-        nights_from, nights_to = self.trip_length_mapping[user_input]
-        self.user_data['nights_from'] = nights_from
-        self.user_data['nights_to'] = nights_to
-        self.state = ConversationState.ASK_ADULTS
+        nights_from, nights_to = self.catalog.trip_length_mapping[user_input]
+        self.session.user_data['nights_from'] = nights_from
+        self.session.user_data['nights_to'] = nights_to
+        self.session.state = ConversationState.ASK_ADULTS
         
         return "👥 Сколько взрослых поедет? (введите число от 1 до 6):"
 
@@ -376,8 +439,8 @@ class TourChatbot:
             if adults < 1 or adults > 6:
                 return "Количество взрослых должно быть от 1 до 6. Попробуйте еще раз:"
             
-            self.user_data['adults'] = adults
-            self.state = ConversationState.ASK_CHILDREN
+            self.session.user_data['adults'] = adults
+            self.session.state = ConversationState.ASK_CHILDREN
             
             return "👶 Сколько детей поедет? (введите число от 0 до 4):"
         except ValueError:
@@ -389,31 +452,64 @@ class TourChatbot:
             if children < 0 or children > 4:
                 return "Количество детей должно быть от 0 до 4. Попробуйте еще раз:"
             
-            self.user_data['children'] = children
-            self.state = ConversationState.CONFIRM
+            self.session.user_data['children'] = children
+            self.session.state = ConversationState.ASK_FILTERS
             
-            return self._format_confirmation_message()
+            return self._format_filters_question()
         except ValueError:
             return "Пожалуйста, введите число от 0 до 4:"
 
+    def _format_filters_question(self):
+        return (
+            "⭐ Есть пожелания к отелю? Например:\n"
+            "- 5 звезд, всё включено\n"
+            "- 4*, завтраки, до 150000\n"
+            "- рейтинг от 4.5\n\n"
+            "Или напишите 'нет', чтобы искать все отели:"
+        )
+
+    def _handle_filters(self, user_input):
+        """Optional filters that TourVisor applies on its side (stars, meal, regions, price, rating)"""
+        countries = self.session.user_data.get('countries', [self.session.user_data['country']])
+        choices = parse_filters_text(user_input, self.catalog.reference, countries)
+        if choices is None:
+            return "Не удалось разобрать пожелания.\n" + self._format_filters_question()
+        try:
+            filters = build_filters(self.catalog.reference, countries, **choices)
+        except FilterError as e:
+            return f"{e}. Попробуйте еще раз или напишите 'нет':"
+
+        self.session.user_data['filters'] = filters
+        self.session.state = ConversationState.CONFIRM
+        return self._format_confirmation_message()
+
     def _format_confirmation_message(self):
         start_date = datetime.now() + timedelta(days=1)  # Tomorrow
         end_date = start_date + timedelta(days=30)       # Tomorrow + 30 days
+        departures = " или ".join(
+            self.catalog.reference.departures.get(d, d) for d in self.session.user_data.get('departures', [self.session.user_data['departure']])
+        )
+        countries = " или ".join(
+            self.catalog.countries[c] for c in self.session.user_data.get('countries', [self.session.user_data['country']])
+        )
+        filters = describe_filters(self.session.user_data.get('filters') or {}, self.catalog.reference)
+        filters_line = f"⭐ Пожелания: {filters}\n" if filters else ""
         
         return (
             "🎉 Отлично! Проверьте данные для поиска тура:\n\n"
-            f"✈️ Вылет из: {self.departure_cities[self.user_data['departure']]}\n"
-            f"🌍 Страна: {self.countries[self.user_data['country']]}\n"
+            f"✈️ Вылет из: {departures}\n"
+            f"🌍 Страна: {countries}\n"
             f"📅 Даты поиска: {start_date.strftime('%d.%m.%Y')} - {end_date.strftime('%d.%m.%Y')}\n"
-            f"🌙 Ночей: {self.user_data['nights_from']}-{self.user_data['nights_to']}\n"
-            f"👥 Взрослых: {self.user_data['adults']}\n"
-            f"👶 Детей: {self.user_data['children']}\n\n"
+            f"🌙 Ночей: {self.session.user_data['nights_from']}-{self.session.user_data['nights_to']}\n"
+            f"👥 Взрослых: {self.session.user_data['adults']}\n"
+            f"👶 Детей: {self.session.user_data['children']}\n"
+            f"{filters_line}\n"
             "Начать поиск туров? (да/нет)"
         )
 
     def _handle_confirmation(self, user_input):
         if user_input.lower() in ['да', 'yes', 'y', '+']:
-            self.state = ConversationState.SEARCHING
+            self.session.state = ConversationState.SEARCHING
             
             # Format dates for the search
             start_date = datetime.now() + timedelta(days=1)  # Tomorrow
@@ -421,58 +517,63 @@ class TourChatbot:
             
             # Prepare search parameters
             search_params = {
-                'departure': self.user_data['departure'],
-                'country': self.user_data['country'],
+                'departure': self.session.user_data['departure'],
+                'country': self.session.user_data['country'],
+                'departures': self.session.user_data.get('departures', [self.session.user_data['departure']]),
+                'countries': self.session.user_data.get('countries', [self.session.user_data['country']]),
                 'date_from': start_date.strftime('%Y-%m-%d'),
                 'date_to': end_date.strftime('%Y-%m-%d'),
-                'nights_from': self.user_data['nights_from'],
-                'nights_to': self.user_data['nights_to'],
-                'adults': self.user_data['adults'],
-                'children': self.user_data['children']
+                'nights_from': self.session.user_data['nights_from'],
+                'nights_to': self.session.user_data['nights_to'],
+                'adults': self.session.user_data['adults'],
+                'children': self.session.user_data['children'],
+                'filters': self.session.user_data.get('filters') or {}
             }
             
             # Return signal to start search with parameters
             return "SEARCH_READY", search_params
             
         elif user_input.lower() in ['нет', 'no', 'n', '-']:
-            self.state = ConversationState.INIT
-            self.user_data = {}
+            self.session.state = ConversationState.INIT
+            self.session.user_data = {}
             return "Хорошо, давайте начнем сначала.\n" + self._format_departure_question()
         else:
             return "Пожалуйста, ответьте 'да' или 'нет':"
 
     def _get_current_question(self):
         """Get the current question based on state"""
-        if self.state == ConversationState.ASK_DEPARTURE:
+        if self.session.state == ConversationState.ASK_DEPARTURE:
             return self._format_departure_question()
-        elif self.state == ConversationState.ASK_COUNTRY:
-            options = "\n".join([f"{k}: {v}" for k, v in self.countries.items()])
+        elif self.session.state == ConversationState.ASK_COUNTRY:
+            options = "\n".join([f"{k}: {v}" for k, v in self.catalog.countries.items()])
             return f"🌍 В какую страну хотите поехать?\n{options}"
-        elif self.state == ConversationState.ASK_TRIP_LENGTH:
-            options = "\n".join([f"{k}: {v}" for k, v in self.trip_lengths.items()])
+        elif self.session.state == ConversationState.ASK_TRIP_LENGTH:
+            options = "\n".join([f"{k}: {v}" for k, v in self.catalog.trip_lengths.items()])
             return f"⌛ Какой длительности тур вы предпочитаете?\n{options}"
-        elif self.state == ConversationState.ASK_ADULTS:
+        elif self.session.state == ConversationState.ASK_ADULTS:
             return "👥 Сколько взрослых поедет? (введите число от 1 до 6):"
-        elif self.state == ConversationState.ASK_CHILDREN:
+        elif self.session.state == ConversationState.ASK_CHILDREN:
             return "👶 Сколько детей поедет? (введите число от 0 до 4):"
-        elif self.state == ConversationState.CONFIRM:
+        elif self.session.state == ConversationState.ASK_FILTERS:
+            return self._format_filters_question()
+        elif self.session.state == ConversationState.CONFIRM:
             return self._format_confirmation_message()
         return "Извините, произошла ошибка. Давайте начнем сначала."
 
     def reset(self):
         """Reset the conversation state"""
-        self.state = ConversationState.INIT
-        self.user_data = {}
+        self.session.state = ConversationState.INIT
+        self.session.user_data = {}
 
     def start_tour_search(self, departure, country, datefrom, dateto, trip_length, adults, children):
         # Set user data based on input
-        self.user_data['departure'] = departure
-        self.user_data['country'] = country
-        self.user_data['date_from'] = datefrom
-        self.user_data['date_to'] = dateto
-        self.user_data['nights_from'], self.user_data['nights_to'] = self.trip_length_mapping[trip_length]
-        self.user_data['adults'] = adults
-        self.user_data['children'] = children
+        self.session.user_data['departure'] = departure
+        self.session.user_data['country'] = country
+        self.session.user_data['date_from'] = datefrom
+        self.session.user_data['date_to'] = dateto
+        self.session.user_data['nights_from'], self.session.user_data['nights_to'] = self.catalog.trip_length_mapping[trip_length]
+        self.session.user_data['adults'] = adults
+        self.session.user_data['children'] = children
 
         # Proceed to search
         return self._handle_confirmation("да")  # Automatically confirm for demonstration
@@ -480,14 +581,14 @@ class TourChatbot:
     async def handle_tour_search(self, chat_id: str):
         """Handle tour search requests"""
         search_params = {
-            'departure': self.user_data['departure'],
-            'country': self.user_data['country'],
-            'date_from': self.user_data['date_from'],
-            'date_to': self.user_data['date_to'],
-            'nights_from': self.user_data['nights_from'],
-            'nights_to': self.user_data['nights_to'],
-            'adults': self.user_data['adults'],
-            'children': self.user_data['children']
+            'departure': self.session.user_data['departure'],
+            'country': self.session.user_data['country'],
+            'date_from': self.session.user_data['date_from'],
+            'date_to': self.session.user_data['date_to'],
+            'nights_from': self.session.user_data['nights_from'],
+            'nights_to': self.session.user_data['nights_to'],
+            'adults': self.session.user_data['adults'],
+            'children': self.session.user_data['children']
         }
 
         logger.info(f"Starting tour search for chat {chat_id} with params: {search_params}")
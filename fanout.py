@@ -0,0 +1,209 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+from functools import partial
+
+from governor import Priority
+from tracing import span
+from termination import TerminationPolicy, poll_until_done
+
+logger = logging.getLogger(__name__)
+
+# Сколько поисков TourVisor можно запускать одновременно
+MAX_CONCURRENT_SEARCHES = int(os.getenv("FANOUT_MAX_CONCURRENCY", "4"))
+# Сколько максимум ждать перед запросом результатов (как в /search и /chat)
+RESULT_WAIT_SECONDS = 5
+# Как часто за это время проверять статус поиска
+RESULT_POLL_INTERVAL_SECONDS = 1.5
+# Фоновые поиски (прогрев кэша, слежение за ценами) ждут state=finished, но не дольше этого
+BACKGROUND_WAIT_SECONDS = int(os.getenv("BACKGROUND_SEARCH_WAIT", "60"))
+
+
+def hotel_price(hotel):
+    """Return hotel price as float, unknown prices sort last"""
+    try:
+        return float(hotel.get('price') or 'inf')
+    except (TypeError, ValueError):
+        return float('inf')
+
+
+def split_choices(value):
+    """Split a comma separated form value like '1,2' into a list of ids"""
+    if isinstance(value, (list, tuple)):
+        return [str(v) for v in value]
+    return [part.strip() for part in str(value).split(',') if part.strip()]
+
+
+async def run_search(tour_search, params, wait=None, priority=Priority.INTERACTIVE):
+    """Create a TourVisor search, wait up to `wait` seconds and fetch the first results
+
+    Background searches wait for state=finished (up to BACKGROUND_WAIT_SECONDS)
+    instead of stopping early: nobody waits for them, and their results
+    should be cached as final.
+    Returns the parsed results with the 'requestid' added, or {"error": ...}.
+    """
+    loop = asyncio.get_running_loop()
+    background = priority == Priority.BACKGROUND
+    if wait is None:
+        wait = BACKGROUND_WAIT_SECONDS if background else RESULT_WAIT_SECONDS
+
+    with span('tourvisor.search', country=params.get('country'), departure=params.get('departure')):
+        search_response = await loop.run_in_executor(
+            None, partial(tour_search.create_search_request, params, priority=priority)
+        )
+    if not search_response:
+        return {"error": "Ошибка при создании поискового запроса"}
+    if "error" in search_response:
+        return {"error": f"API вернула ошибку: {search_response['error']}"}
+
+    request_id = search_response.get('requestid')
+    if not request_id:
+        logger.error(f"No request ID in response: {search_response}")
+        return {"error": "Не удалось получить ID запроса"}
+
+    logger.info(f"Got request ID: {request_id}")
+
+    async def poll_status():
+        with span('tourvisor.status'):
+            return await loop.run_in_executor(
+                None, partial(tour_search.get_search_results, request_id, 'status', priority=Priority.POLL)
+            )
+
+    # Ждем не больше `wait`, но забираем результаты раньше, если поиск закончен или цены устоялись
+    with span('search.wait') as waiting:
+        _, reason = await poll_until_done(
+            poll_status, TerminationPolicy(enabled=not background), RESULT_POLL_INTERVAL_SECONDS, wait
+        )
+        waiting.set(reason=reason)
+
+    with span('tourvisor.result'):
+        results = await loop.run_in_executor(
+            None, partial(tour_search.get_search_results, request_id, priority=priority)
+        )
+    if not results:
+        return {"error": "Не удалось получить результаты поиска"}
+
+    results['requestid'] = request_id
+    if reason != 'finished':
+        # Поиск в TourVisor еще идет - кэш хранит такие результаты недолго
+        results['partial'] = True
+    return results
+
+
+class FanOutSearch:
+    """Runs several TourVisor searches concurrently and merges them by price"""
+
+    def __init__(self, tour_search, max_concurrency=MAX_CONCURRENT_SEARCHES, wait=RESULT_WAIT_SECONDS, search_one=None):
+        self.tour_search = tour_search
+        self.max_concurrency = max(1, max_concurrency)
+        self.wait = wait
+        # Optional async callable params -> results (e.g. a cache-aware search)
+        self.search_one = search_one
+
+    @staticmethod
+    def combinations(departures, countries):
+        """All (departure, country) pairs in a stable order without duplicates"""
+        departures = list(dict.fromkeys(departures))
+        countries = list(dict.fromkeys(countries))
+        return list(itertools.product(departures, countries))
+
+    async def _run_one(self, semaphore, base_params, departure, country):
+        """Run one sub-search of the fan-out"""
+        params = dict(base_params, departure=departure, country=country)
+        outcome = {'departure': departure, 'country': country, 'hotels': []}
+
+        async with semaphore:
+            logger.info(f"Fan-out sub-search started: departure={departure}, country={country}")
+            if self.search_one is not None:
+                results = await self.search_one(params)
+            else:
+                results = await run_search(self.tour_search, params, self.wait)
+
+        if "error" in results:
+            outcome['error'] = results['error']
+            return outcome
+        if results.get('requestid'):
+            outcome['requestid'] = results['requestid']
+        if results.get('partial'):
+            outcome['partial'] = True
+
+        hotels = [
+            dict(hotel, departure=departure)
+            for hotel in results.get('result', {}).get('hotels', [])
+        ]
+        outcome['status'] = results.get('status', {})
+        outcome['hotels'] = sorted(hotels, key=hotel_price)
+        logger.info(f"Fan-out sub-search finished: departure={departure}, country={country}, hotels={len(hotels)}")
+        return outcome
+
+    @staticmethod
+    def _merge(outcomes, pending):
+        """Merge finished sub-searches into one price-ordered result"""
+        hotels = list(heapq.merge(*(o['hotels'] for o in outcomes), key=hotel_price))
+
+        hotels_found = 0
+        tours_found = 0
+        min_price = None
+        for outcome in outcomes:
+            status = outcome.get('status') or {}
+            try:
+                hotels_found += int(status.get('hotelsfound') or 0)
+                tours_found += int(status.get('toursfound') or 0)
+                price = float(status.get('minprice') or 0)
+            except (TypeError, ValueError):
+                continue
+            if price and (min_price is None or price < min_price):
+                min_price = price
+
+        merged = {
+            'status': {
+                'state': 'searching' if pending else 'finished',
+                'hotelsfound': str(hotels_found),
+                'toursfound': str(tours_found),
+                'minprice': str(min_price) if min_price is not None else None,
+            },
+            'result': {'hotels': hotels},
+            'searches': [
+                {k: v for k, v in o.items() if k not in ('hotels', 'status')}
+                for o in outcomes
+            ],
+        }
+        # Хоть один подпоиск остановлен досрочно - весь результат кэшируется как частичный
+        if any(o.get('partial') for o in outcomes):
+            merged['partial'] = True
+        return merged
+
+    async def stream(self, base_params, departures, countries):
+        """Yield a merged snapshot each time one of the sub-searches finishes"""
+        pairs = self.combinations(departures, countries)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        tasks = [
+            asyncio.create_task(self._run_one(semaphore, base_params, departure, country))
+            for departure, country in pairs
+        ]
+        logger.info(f"Fan-out search over {len(pairs)} combinations (concurrency {self.max_concurrency})")
+
+        outcomes = []
+        try:
+            for done, future in enumerate(asyncio.as_completed(tasks), start=1):
+                try:
+                    outcomes.append(await future)
+                except Exception as e:
+                    logger.error(f"Fan-out sub-search failed: {e}")
+                    continue
+                yield self._merge(outcomes, pending=len(pairs) - done)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def search(self, base_params, departures, countries):
+        """Run every combination and return the final merged result"""
+        merged = None
+        async for merged in self.stream(base_params, departures, countries):
+            pass
+        if not merged or not any('error' not in s for s in merged['searches']):
+            errors = [s.get('error') for s in (merged or {}).get('searches', []) if s.get('error')]
+            return {"error": errors[0] if errors else "Не удалось получить результаты поиска"}
+        return merged
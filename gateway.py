@@ -0,0 +1,96 @@
+import os
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+# Общий токен мессенджер-адаптеров; если не задан, шлюз открыт (только для локального запуска)
+GATEWAY_TOKEN = os.getenv("GATEWAY_TOKEN")
+
+# Максимальная длина одного сообщения в канале
+CHANNEL_MESSAGE_LIMITS = {
+    'instagram': 1800,
+    'whatsapp': 4000,
+    'telegram': 4000,
+}
+# Сколько отелей показывать в мессенджерах
+MESSENGER_TOP_HOTELS = 5
+
+HOTEL_SEPARATOR = "─" * 30
+NEW_SEARCH_HINT = "Для нового поиска напишите 'новый поиск'"
+
+
+class GatewayMessage(BaseModel):
+    text: str
+
+
+class GatewayReply(BaseModel):
+    messages: List[str]
+    job_id: Optional[str] = None
+    status: Optional[str] = None
+
+
+class GatewayNotification(BaseModel):
+    """Messages the adapter should send to a user on its own, then acknowledge by `ids`"""
+    user_id: str
+    messages: List[str]
+    ids: List[str]
+
+
+class GatewayNotifications(BaseModel):
+    notifications: List[GatewayNotification]
+
+
+class NotificationAck(BaseModel):
+    ids: List[str]
+
+
+def _number(value, default=0):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def format_hotel(number, hotel):
+    """One hotel as a plain text block"""
+    stars = "⭐" * int(_number(hotel.get('hotelstars')))
+    rating = _number(hotel.get('hotelrating'))
+    text = f"{number}. {hotel.get('hotelname') or 'Отель'} {stars}\n"
+    if rating > 0:
+        text += f"📊 Рейтинг: {rating:.1f}/5\n"
+    text += f"📍 {hotel.get('countryname') or ''}, {hotel.get('regionname') or ''}\n"
+    text += f"💰 От {int(_number(hotel.get('price'))):,} ₽\n"
+    description = hotel.get('hoteldescription') or ''
+    if description and len(description) < 100:
+        text += f"ℹ️ {description}\n"
+    return text
+
+
+def format_results(results, limit, top=MESSENGER_TOP_HOTELS):
+    """Search results as messenger messages no longer than `limit` characters"""
+    hotels = ((results or {}).get('result') or {}).get('hotels') or []
+    if not hotels:
+        return ["🔍 По вашему запросу туров не найдено.", NEW_SEARCH_HINT]
+
+    hotels = sorted(hotels, key=lambda hotel: _number(hotel.get('price'), float('inf')))
+    status = results.get('status') or {}
+    header = (
+        f"🎯 Найдено {status.get('hotelsfound') or len(hotels)} отелей и "
+        f"{status.get('toursfound') or 0} туров!\n"
+        f"💰 Цены от {int(_number(status.get('minprice') or hotels[0].get('price'))):,} ₽\n"
+    )
+    if results.get('stale'):
+        header += "⚠️ Результаты могут быть неактуальны, сервис поиска временно недоступен\n"
+
+    messages = []
+    current = header
+    for number, hotel in enumerate(hotels[:top], 1):
+        block = f"\n{format_hotel(number, hotel)}{HOTEL_SEPARATOR}\n"
+        if len(current) + len(block) > limit:
+            messages.append(current.strip())
+            current = block
+        else:
+            current += block
+    messages.append(current.strip())
+    messages.append(NEW_SEARCH_HINT)
+    return messages
@@ -0,0 +1,115 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from enum import IntEnum
+
+logger = logging.getLogger(__name__)
+
+# Лимиты обращений к TourVisor
+UPSTREAM_MAX_CONCURRENCY = int(os.getenv("TOURVISOR_MAX_CONCURRENCY", "8"))
+UPSTREAM_RATE_PER_SECOND = float(os.getenv("TOURVISOR_RATE", "5"))
+UPSTREAM_BURST = int(os.getenv("TOURVISOR_BURST", "10"))
+# Слоты и доля токенов, которые фоновые запросы не трогают, чтобы пользователи не ждали
+BACKGROUND_RESERVED_SLOTS = 2
+BACKGROUND_RESERVED_TOKEN_SHARE = 0.5
+# Сколько запрос может ждать своей очереди
+UPSTREAM_MAX_WAIT_SECONDS = 30
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0  # поиски из чата и /search
+    POLL = 1         # опрос статуса поиска
+    BACKGROUND = 2   # прогрев кэша, справочники, /test
+
+
+class GovernorTimeout(Exception):
+    pass
+
+
+class UpstreamGovernor:
+    """Concurrency semaphore + token bucket with priority classes
+
+    Thread-safe: TourSearch is synchronous and runs in executor threads.
+    A request waits while a higher priority request is waiting; background
+    requests additionally leave a reserve of slots and tokens untouched.
+    """
+
+    def __init__(self, max_concurrency=UPSTREAM_MAX_CONCURRENCY, rate=UPSTREAM_RATE_PER_SECOND,
+                 burst=UPSTREAM_BURST, max_wait=UPSTREAM_MAX_WAIT_SECONDS):
+        self.max_concurrency = max_concurrency
+        self.rate = rate
+        self.burst = burst
+        self.max_wait = max_wait
+        self.reserved_slots = min(BACKGROUND_RESERVED_SLOTS, max_concurrency - 1)
+        self.reserved_tokens = min(burst * BACKGROUND_RESERVED_TOKEN_SHARE, burst - 1)
+        self._cond = threading.Condition()
+        self._tokens = float(burst)
+        self._last_refill = time.monotonic()
+        self._in_flight = 0
+        self._waiting = {p: 0 for p in Priority}
+        self.granted = {p.name.lower(): 0 for p in Priority}
+        self.timeouts = {p.name.lower(): 0 for p in Priority}
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def _can_run(self, priority):
+        if any(self._waiting[p] for p in Priority if p < priority):
+            return False
+        if priority == Priority.BACKGROUND:
+            return (self._in_flight < self.max_concurrency - self.reserved_slots
+                    and self._tokens >= 1 + self.reserved_tokens)
+        return self._in_flight < self.max_concurrency and self._tokens >= 1
+
+    def acquire(self, priority=Priority.INTERACTIVE, timeout=None):
+        deadline = time.monotonic() + (self.max_wait if timeout is None else timeout)
+        with self._cond:
+            self._waiting[priority] += 1
+            try:
+                while True:
+                    self._refill()
+                    if self._can_run(priority):
+                        self._tokens -= 1
+                        self._in_flight += 1
+                        self.granted[priority.name.lower()] += 1
+                        return
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timeouts[priority.name.lower()] += 1
+                        raise GovernorTimeout(f"Upstream busy, {priority.name.lower()} request not admitted")
+                    # Ждем освобождения слота или появления следующего токена
+                    needed = 1 + (self.reserved_tokens if priority == Priority.BACKGROUND else 0)
+                    next_token = (needed - self._tokens) / self.rate if self.rate else remaining
+                    self._cond.wait(min(remaining, max(next_token, 0.01)))
+            finally:
+                self._waiting[priority] -= 1
+                # Запросы с меньшим приоритетом могли ждать именно нас
+                self._cond.notify_all()
+
+    def release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, priority=Priority.INTERACTIVE, timeout=None):
+        self.acquire(priority, timeout)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self):
+        with self._cond:
+            self._refill()
+            return {
+                'in_flight': self._in_flight,
+                'tokens': round(self._tokens, 2),
+                'waiting': {p.name.lower(): n for p, n in self._waiting.items()},
+                'granted': dict(self.granted),
+                'timeouts': dict(self.timeouts),
+            }
@@ -0,0 +1,118 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from state_backend import MemoryBackend
+
+logger = logging.getLogger(__name__)
+
+# Статические поля отеля - одинаковые во всех поисках, хранятся один раз в каталоге
+STATIC_FIELDS = (
+    'hotelname', 'hotelstars', 'hotelrating', 'hoteldescription',
+    'countrycode', 'countryname', 'regioncode', 'regionname',
+    'picturelink', 'fulldesclink', 'reviewlink', 'seadistance',
+    'isphoto', 'iscoords', 'isdescription', 'isreviews',
+)
+# Сколько хранить запись отеля, который больше не встречается в поисках
+CATALOG_TTL_SECONDS = int(os.getenv("HOTEL_CATALOG_TTL", str(30 * 24 * 3600)))
+# Сколько записей держать в памяти процесса
+CATALOG_MEMORY_ENTRIES = 5000
+
+
+def static_version(static):
+    """Short content hash of the static hotel fields"""
+    payload = json.dumps(static, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:12]
+
+
+class HotelCatalog:
+    """Static hotel data keyed by TourVisor hotel code
+
+    Cached search results keep only hotelcode, price and tours; split()
+    moves the rest into the catalog (rewriting an entry only when it
+    changed) and join() puts it back when results are sent to a client.
+    """
+
+    NAMESPACE = 'hotel_catalog'
+
+    def __init__(self, backend=None, ttl=CATALOG_TTL_SECONDS, memory_entries=CATALOG_MEMORY_ENTRIES):
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.ttl = ttl
+        self.memory_entries = memory_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.updated = 0
+
+    def _remember(self, code, entry):
+        with self._lock:
+            self._memory[code] = entry
+            self._memory.move_to_end(code)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, code, version=None):
+        """Catalog entry of a hotel; `version` forces a re-read if the local copy is older"""
+        with self._lock:
+            entry = self._memory.get(code)
+        if entry is None or (version is not None and entry['version'] != version):
+            entry = self.backend.get(self.NAMESPACE, code)
+            if entry is not None:
+                self._remember(code, entry)
+        return entry
+
+    def update(self, code, static):
+        """Store the static fields if they differ from the catalog; returns the version"""
+        version = static_version(static)
+        entry = self.get(code)
+        if entry is None or entry['version'] != version:
+            entry = {'version': version, 'fields': static, 'updated_at': time.time()}
+            self.backend.set(self.NAMESPACE, code, entry, ttl=self.ttl)
+            self._remember(code, entry)
+            self.updated += 1
+        return version
+
+    def split(self, results):
+        """Results with static hotel fields moved into the catalog"""
+        hotels = ((results or {}).get('result') or {}).get('hotels')
+        if not hotels:
+            return results
+        normalized = []
+        for hotel in hotels:
+            code = hotel.get('hotelcode')
+            if not code:
+                normalized.append(hotel)
+                continue
+            static = {k: hotel[k] for k in STATIC_FIELDS if k in hotel}
+            dynamic = {k: v for k, v in hotel.items() if k not in STATIC_FIELDS}
+            dynamic['catalog_version'] = self.update(code, static)
+            normalized.append(dynamic)
+        return dict(results, result=dict(results['result'], hotels=normalized))
+
+    def join(self, results):
+        """Results with static hotel fields filled back in from the catalog"""
+        hotels = ((results or {}).get('result') or {}).get('hotels')
+        if not hotels:
+            return results
+        joined = []
+        for hotel in hotels:
+            entry = self.get(hotel['hotelcode'], hotel.get('catalog_version')) if hotel.get('hotelcode') else None
+            joined.append(dict(entry['fields'], **hotel) if entry else hotel)
+        return dict(results, result=dict(results['result'], hotels=joined))
+
+    def entries(self, codes):
+        """Public catalog entries for the given hotel codes"""
+        found = {}
+        for code in codes:
+            entry = self.get(code)
+            if entry is not None:
+                found[code] = dict(entry['fields'], hotelcode=code, catalog_version=entry['version'])
+        return found
+
+    def stats(self):
+        with self._lock:
+            in_memory = len(self._memory)
+        return {'in_memory': in_memory, 'updated': self.updated}
@@ -1,12 +1,10 @@
-from chatbot import TourChatbot, ConversationState
 import asyncio
 import logging
-from datetime import datetime, timedelta
-import json
 import os
 from dotenv import load_dotenv
 from instagrapi import Client
-import time
+import requests
+from tracing import span, traceparent, TRACEPARENT_HEADER
 
 # Configure logging with more detailed format
 logging.basicConfig(
@@ -22,325 +20,188 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
+# Диалог, поиск и кэш живут в основном сервисе (main.py), бот только пересылает сообщения
+GATEWAY_URL = os.getenv("GATEWAY_URL", "http://127.0.0.1:3000")
+GATEWAY_TOKEN = os.getenv("GATEWAY_TOKEN")
+CHANNEL = "instagram"
+JOB_POLL_SECONDS = 2.5
+JOB_MAX_WAIT_SECONDS = 90
+# Как часто забирать из шлюза уведомления о снижении цен
+NOTIFICATION_POLL_SECONDS = 60
+
 class InstagramTourBot:
     def __init__(self):
-        self.chatbot = TourChatbot()
-        self.memory = {}  # Store conversation state for each user
-        self.tour_search = None
+        self.memory = {}  # thread_id -> id of the last processed message
+        self.tasks = set()  # фоновые задачи: цикл событий хранит на них только слабые ссылки
         self.client = Client()
-        self.last_check = datetime.now()
-        
+        self.gateway = requests.Session()
+        if GATEWAY_TOKEN:
+            self.gateway.headers['X-Gateway-Token'] = GATEWAY_TOKEN
+
         # Login to Instagram
         username = os.getenv('INSTAGRAM_USERNAME')
         password = os.getenv('INSTAGRAM_PASSWORD')
         if not username or not password:
             raise ValueError("Instagram credentials not found in environment variables")
-            
+
         print(f"🔄 Attempting to login as {username}...")
         self.client.login(username, password)
         print(f"✅ Successfully logged in as {username}")
         logger.info(f"Bot initialized and logged in as {username}")
 
-    def _get_user_state(self, user_id):
-        """Get or create state for a user"""
-        if user_id not in self.memory:
-            logger.info(f"Creating new state for user {user_id}")
-            print(f"👤 New user detected (ID: {user_id})")
-            self.memory[user_id] = {
-                'chatbot': TourChatbot(),
-                'last_message': None
-            }
-        return self.memory[user_id]
+    async def _call_gateway(self, method, path, **kwargs):
+        """Request to the message gateway without blocking the event loop"""
+        loop = asyncio.get_running_loop()
+        with span('gateway.call', method=method):
+            # Шлюз продолжает нашу трассу
+            parent = traceparent()
+            headers = {TRACEPARENT_HEADER: parent} if parent else None
+            response = await loop.run_in_executor(
+                None, lambda: self.gateway.request(method, f"{GATEWAY_URL}{path}", timeout=30, headers=headers, **kwargs)
+            )
+            response.raise_for_status()
+            return response.json()
+
+    def _spawn(self, coroutine):
+        """Run a background task, keeping it referenced until it finishes; its errors are logged"""
+        task = asyncio.create_task(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self._task_done)
+        return task
+
+    def _task_done(self, task):
+        self.tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Background task failed: {task.exception()!r}", exc_info=task.exception())
+
+    async def _send(self, thread_id, messages, user_id=None):
+        """Send messages one by one with a small delay to avoid rate limits
+
+        Without thread_id the messages go to the direct thread with user_id.
+        Returns False if some message could not be sent.
+        """
+        recipients = {'thread_ids': [thread_id]} if thread_id else {'user_ids': [int(user_id)]}
+        sent = True
+        for text in messages:
+            try:
+                self.client.direct_send(text, **recipients)
+            except Exception as e:
+                print(f"Error sending message: {e}")
+                await asyncio.sleep(5)  # Longer delay if there's an error
+                try:
+                    self.client.direct_send(text, **recipients)
+                except Exception:
+                    print("Failed to send message after retry")
+                    sent = False
+            await asyncio.sleep(1)
+        return sent
 
     async def _handle_message(self, thread_id, user_id, message_text):
-        """Handle a single message from a user"""
+        """Relay a single message to the gateway and send back its replies"""
+        with span('instagram.message'):
+            await self._relay(thread_id, user_id, message_text)
+
+    async def _relay(self, thread_id, user_id, message_text):
         print(f"\n📩 Received message from user {user_id} in thread {thread_id}")
         print(f"Message content: '{message_text}'")
-        
-        user_state = self._get_user_state(user_id)
-        chatbot = user_state['chatbot']
-        
-        print(f"Current chat state: {chatbot.state}")
-        
-        # Handle "new search" command
-        if message_text.lower() in ['новый поиск', 'new search']:
-            print("🔄 User requested new search")
-            chatbot.reset()
-            response = chatbot.get_next_message()
-            print(f"🤖 Sending response: '{response}'")
-            self.client.direct_answer(thread_id, response)
-            return
 
-        # Handle different states appropriately
-        if chatbot.state == ConversationState.ASK_COUNTRY:
-            print("🌍 Processing country input")
-            response = await chatbot._handle_country(message_text)
-        elif chatbot.state == ConversationState.GENERAL_CHAT:
-            print("💭 Processing general chat")
-            response = await chatbot.handle_general_chat(message_text)
-        else:
-            print(f"⚡ Processing state: {chatbot.state}")
-            response = chatbot.get_next_message(message_text)
-
-        # Handle search initiation
-        if isinstance(response, tuple) and response[0] == "SEARCH_READY":
-            print("🔍 Starting tour search...")
-            self.client.direct_answer(thread_id, "🔍 Начинаю поиск туров...")
-            
-            search_params = response[1]
-            print(f"Search parameters: {json.dumps(search_params, indent=2, ensure_ascii=False)}")
-            
-            search_result = await self._search_tours(search_params)
-            
-            # Split long messages if needed (Instagram has character limits)
-            if len(search_result) > 2000:
-                print("📝 Splitting long message into chunks")
-                # First send the intro message
-                intro_message = "🏨 Вот что я нашел для вас! Отправляю результаты частями..."
-                self.client.direct_send(intro_message, thread_ids=[thread_id])
-                
-                # Split message into smaller chunks, being careful with the splits
-                chunks = []
-                current_chunk = ""
-                
-                # Split by hotel (split by the separator line)
-                hotels = search_result.split("─" * 30)
-                
-                for hotel in hotels:
-                    if not hotel.strip():
-                        continue
-                        
-                    # If current chunk plus this hotel would be too long, save current chunk
-                    if len(current_chunk) + len(hotel) > 1800:  # Using 1800 to be safe
-                        if current_chunk:
-                            chunks.append(current_chunk.strip())
-                        current_chunk = hotel
-                    else:
-                        current_chunk += hotel + "\n" + "─" * 30 + "\n"
-                
-                # Add the last chunk if it exists
-                if current_chunk:
-                    chunks.append(current_chunk.strip())
-                
-                # Send each chunk with a delay to avoid rate limits
-                for i, chunk in enumerate(chunks, 1):
-                    print(f"Sending chunk {i}/{len(chunks)}")
-                    try:
-                        # Add chunk number for better readability
-                        numbered_chunk = f"Часть {i}/{len(chunks)}:\n\n{chunk}"
-                        self.client.direct_send(numbered_chunk, thread_ids=[thread_id])
-                        await asyncio.sleep(1)  # Small delay between chunks
-                    except Exception as e:
-                        print(f"Error sending chunk {i}: {e}")
-                        await asyncio.sleep(5)  # Longer delay if there's an error
-                        try:
-                            # Try one more time
-                            self.client.direct_send(numbered_chunk, thread_ids=[thread_id])
-                        except:
-                            print(f"Failed to send chunk {i} after retry")
-                
-                # Send final message
-                self.client.direct_send("Это все результаты! Для нового поиска напишите 'новый поиск'", thread_ids=[thread_id])
-            else:
-                print("📤 Sending search results")
-                self.client.direct_send(search_result, thread_ids=[thread_id])
-            
-            # Reset chatbot for new search
-            chatbot.reset()
-            new_response = chatbot.get_next_message()
-            self.client.direct_send("\nДля нового поиска напишите 'новый поиск'", thread_ids=[thread_id])
-        else:
-            # Send normal response
-            print(f"🤖 Sending response: '{response}'")
-            self.client.direct_answer(thread_id, response)
-
-    async def _search_tours(self, search_params):
-        """Execute tour search and return formatted results"""
         try:
-            print("\n🔍 Starting tour search with parameters:")
-            print(json.dumps(search_params, indent=2, ensure_ascii=False))
-            
-            # Create initial search request
-            from tour_search import TourSearch
-            if not self.tour_search:
-                self.tour_search = TourSearch()
-            
-            # Format dates in DD.MM.YYYY format
-            now = datetime.now()
-            tomorrow = now + timedelta(days=1)
-            end_date = tomorrow + timedelta(days=30)
-            
-            search_request = {
-                'departure': search_params['departure'],
-                'country': search_params['country'],
-                'datefrom': tomorrow.strftime('%d.%m.%Y'),
-                'dateto': end_date.strftime('%d.%m.%Y'),
-                'nightsfrom': search_params.get('nights_from', 7),
-                'nightsto': search_params.get('nights_to', 14),
-                'adults': search_params.get('adults', 2),
-                'child': search_params.get('children', 0),
-                'format': 'xml'
-            }
-            
-            print("📤 Making API request for tour search")
-            logger.info(f"Search request: {search_request}")
-            
-            # Create search request
-            request_id = self.tour_search.create_search_request(search_request)
-            if not request_id:
-                print("❌ Failed to create search request")
-                return "😔 Извините, не удалось выполнить поиск. Попробуйте позже."
-            
-            if isinstance(request_id, dict) and "error" in request_id:
-                print(f"❌ Error in search request: {request_id['error']}")
-                return f"❌ Ошибка при поиске: {request_id['error']}"
-            
-            print(f"✅ Search request created with ID: {request_id}")
-            
-            # Wait and check status until search is complete or timeout
-            max_attempts = 24
-            min_hotels_threshold = 10
-            min_tours_threshold = 30
-            
-            for attempt in range(max_attempts):
-                await asyncio.sleep(2.5)
-                print(f"\r⏳ Checking search status (attempt {attempt + 1}/{max_attempts})", end='')
-                
+            reply = await self._call_gateway('POST', f"/gateway/{CHANNEL}/{user_id}", json={'text': message_text})
+        except Exception as e:
+            logger.error(f"Gateway request failed: {e}")
+            await self._send(thread_id, ["😔 Произошла ошибка. Попробуйте позже."])
+            return
+
+        await self._send(thread_id, reply['messages'])
+
+        # Поиск идет в фоне - результаты пересылаем, не задерживая другие диалоги
+        job_id = reply.get('job_id')
+        if job_id and reply.get('status') not in ('done', 'error'):
+            self._spawn(self._deliver_results(thread_id, user_id, job_id))
+
+    async def _deliver_results(self, thread_id, user_id, job_id):
+        with span('instagram.deliver_results', job_id=job_id):
+            await self._send(thread_id, await self._wait_for_job(user_id, job_id))
+
+    async def _wait_for_job(self, user_id, job_id):
+        waited = 0
+        while waited < JOB_MAX_WAIT_SECONDS:
+            await asyncio.sleep(JOB_POLL_SECONDS)
+            waited += JOB_POLL_SECONDS
+            try:
+                job = await self._call_gateway('GET', f"/gateway/{CHANNEL}/{user_id}/jobs/{job_id}")
+            except Exception as e:
+                logger.error(f"Error checking search job {job_id}: {e}")
+                continue
+            print(f"\r🔄 Search job {job_id}: {job['status']}", end='')
+            if job['status'] in ('done', 'error'):
+                print()
+                return job['messages']
+        return ["⏳ Поиск занял слишком много времени. Попробуйте позже."]
+
+    async def _deliver_notifications(self):
+        """Price drop notifications of the gateway, sent to the users on their own"""
+        while True:
+            await asyncio.sleep(NOTIFICATION_POLL_SECONDS)
+            try:
+                reply = await self._call_gateway('GET', f"/gateway/{CHANNEL}/notifications")
+            except Exception as e:
+                logger.error(f"Failed to fetch notifications: {e}")
+                continue
+            for notification in reply['notifications']:
+                print(f"🔔 Sending price alert to user {notification['user_id']}")
+                if not await self._send(None, notification['messages'], user_id=notification['user_id']):
+                    continue  # не подтверждаем - шлюз отдаст уведомление снова
                 try:
-                    status = self.tour_search.get_search_status(request_id)
-                    if not status:
-                        continue
-                    
-                    state = status.get('state')
-                    hotels_found = int(status.get('hotelsfound', '0'))
-                    tours_found = int(status.get('toursfound', '0'))
-                    
-                    print(f"\r🔄 Status: {state} | Hotels: {hotels_found} | Tours: {tours_found}")
-                    
-                    if state == 'finished' or (
-                        hotels_found >= min_hotels_threshold and 
-                        tours_found >= min_tours_threshold
-                    ):
-                        print("\n✅ Search completed successfully")
-                        break
-                    elif state == 'error':
-                        print("\n❌ Search ended with error")
-                        return "😔 Произошла ошибка при поиске туров."
-                    
-                    if attempt == max_attempts - 1:
-                        print("\n⌛ Search timed out")
-                        return "⏳ Поиск занял слишком много времени. Попробуйте позже."
+                    await self._call_gateway('POST', f"/gateway/{CHANNEL}/notifications/ack",
+                                             json={'ids': notification['ids']})
                 except Exception as e:
-                    logger.error(f"Error checking status: {e}")
-                    print(f"\n⚠️ Error checking status: {e}")
-                    continue
-            
-            # Get final results
-            print("📥 Fetching search results")
-            results = self.tour_search.get_search_results(request_id)
-
-
-            if not results or 'result' not in results or 'hotels' not in results['result']:
-                print("❌ No results found in response")
-                return "😔 Не удалось получить результаты поиска."
-            
-            hotels = results['result']['hotels']
-            if not hotels:
-                print("🔍 No hotels found in search results")
-                return "🔍 По вашему запросу туров не найдено."
-            
-            print(f"✅ Found {len(hotels)} hotels")
-            
-            # Sort hotels by price
-            hotels.sort(key=lambda x: float(x.get('price', '999999999')))
-            
-            # Format results message
-            status = results.get('status', {})
-            message = (
-                f"🎯 Найдено {status.get('hotelsfound', len(hotels))} отелей и "
-                f"{status.get('toursfound', '0')} туров!\n"
-                f"💰 Цены от {int(float(status.get('minprice', '0'))):,} ₽\n\n"
-            )
-            
-            # Show top 5 hotels
-            print("📝 Formatting top 5 hotels")
-            for i, hotel in enumerate(hotels[:5], 1):
-                name = hotel.get('hotelname', 'Отель')
-                stars = "⭐" * int(hotel.get('hotelstars', '0'))
-                price = int(float(hotel.get('price', '0')))
-                country = hotel.get('countryname', '')
-                region = hotel.get('regionname', '')
-                rating = float(hotel.get('hotelrating', '0'))
-                
-                print(f"Processing hotel {i}: {name}")
-                
-                message += f"{i}. {name} {stars}\n"
-                if rating > 0:
-                    message += f"📊 Рейтинг: {rating:.1f}/5\n"
-                message += f"📍 {country}, {region}\n"
-                message += f"💰 От {price:,} ₽\n"
-                
-                # Only add description if it's short
-                desc = hotel.get('hoteldescription', '')
-                if desc and len(desc) < 100:  # Only include short descriptions
-                    message += f"ℹ️ {desc[:100]}...\n"
-                
-                message += "\n" + "─" * 30 + "\n\n"
-            
-            print("✅ Results formatted successfully")
-            return message
-            
-        except Exception as e:
-            logger.error(f"Error in _search_tours: {e}", exc_info=True)
-            print(f"❌ Error during tour search: {e}")
-            return "😔 Произошла ошибка при поиске туров. Попробуйте позже."
+                    logger.error(f"Failed to acknowledge notifications: {e}")
 
     async def run(self):
         """Main loop to check and respond to Instagram messages"""
         print("🚀 Starting Instagram bot...")
         logger.info("Bot started")
-        
+        self._spawn(self._deliver_notifications())
+
         while True:
             try:
                 print("\n👀 Checking for new messages...")
                 # Get unread threads
                 threads = self.client.direct_threads(selected_filter="unread")
-                
+
                 if not threads:
                     print("📭 No new messages")
                 else:
                     print(f"📬 Found {len(threads)} unread threads")
-                
+
                 for thread in threads:
                     print(f"\n💬 Processing thread {thread.id}")
                     # Get messages in thread
                     messages = self.client.direct_messages(thread.id, amount=1)
-                    
+
                     if not messages:
                         print("No messages in thread")
                         continue
-                        
+
                     message = messages[0]
-                    
+
                     # Skip if we've already processed this message
-                    if thread.id in self.memory and self.memory[thread.id].get('last_message') == message.id:
+                    if self.memory.get(thread.id) == message.id:
                         print(f"⏭️ Skipping already processed message {message.id}")
                         continue
-                    
+
                     # Process message if it's text
                     if message.text:
                         print(f"📝 Processing text message: '{message.text}'")
                         await self._handle_message(thread.id, message.user_id, message.text)
-                        
+
                     # Update last processed message
-                    if thread.id in self.memory:
-                        self.memory[thread.id]['last_message'] = message.id
-                        print(f"✅ Updated last processed message for thread {thread.id}")
-                
+                    self.memory[thread.id] = message.id
+
                 # Sleep to avoid hitting rate limits
-                print("😴 Sleeping for 10 seconds...")
                 await asyncio.sleep(1)
-                
+
             except Exception as e:
                 logger.error(f"Error in main loop: {e}", exc_info=True)
                 print(f"❌ Error in main loop: {e}")
@@ -354,4 +215,4 @@ async def main():
 
 if __name__ == "__main__":
     print("🚀 Starting application...")
-    asyncio.run(main()) 
+    asyncio.run(main())
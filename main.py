@@ -1,17 +1,46 @@
-from fastapi import FastAPI, Request, Form
+from fastapi import FastAPI, Request, Form, WebSocket, WebSocketDisconnect
 from fastapi.templating import Jinja2Templates
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, JSONResponse
-import requests
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse, Response
 from datetime import datetime, timedelta
 import os
 from dotenv import load_dotenv
-import json
 import asyncio
 import logging
-import xml.etree.ElementTree as ET
-from urllib.parse import urlencode
+import re
+import time
+import socket
+import uuid
+from functools import partial
 from chatbot import TourChatbot
+from fanout import FanOutSearch, run_search, split_choices
+from search_cache import SearchCache, CacheWarmer, WARMER_ENABLED
+from reference_data import reference_store, get_reference, REFERENCE_CHECK_SECONDS
+from search_jobs import SearchJobQueue, QueueFullError
+from governor import Priority
+from state_backend import create_backend
+from hotel_catalog import HotelCatalog
+from price_history import PriceHistory, PRICE_HISTORY_ENABLED
+from tour_search import TourSearch, TOURVISOR_LOGIN, TOURVISOR_PASS, TOURVISOR_BASE_URL
+from gateway import (
+    GatewayMessage, GatewayReply, GatewayNotification, GatewayNotifications, NotificationAck, CHANNEL_MESSAGE_LIMITS,
+    GATEWAY_TOKEN, NEW_SEARCH_HINT, format_results
+)
+from static_assets import AssetPipeline
+from status_poller import StatusPoller
+from search_filters import build_filters, FilterError
+from tracing import span, parse_traceparent, TRACEPARENT_HEADER
+from admission import AdmissionController, AdmissionMiddleware, OVERLOADED_MESSAGE
+from profiling import RequestProfiler, ProfilingMiddleware
+from thumbnails import ThumbnailProxy, THUMBNAIL_DEFAULT_WIDTH
+from price_watch import (
+    PriceWatch, WatchLimitError, PRICE_WATCH_ENABLED, WATCH_HINT, NO_SEARCH_MESSAGE, UNWATCH_HINT,
+    parse_watch_command, describe_spec, watch_condition
+)
+from ws_chat import ChatConnection, SlowConsumerError, hotel_batches, WS_JOB_POLL_SECONDS
+from responses import (
+    CompactJSONResponse, CompressionMiddleware, JobResponse, ChatResponse, ChatEvent, SearchResults, project_results,
+    dumps_line, UI_FIELDS
+)
 
 # Настройка более детального логирования
 logging.basicConfig(
@@ -23,12 +52,26 @@ logger = logging.getLogger(__name__)
 load_dotenv()
 
 app = FastAPI()
-app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
-
-TOURVISOR_LOGIN = os.getenv("TOURVISOR_LOGIN")
-TOURVISOR_PASS = os.getenv("TOURVISOR_PASS")
-TOURVISOR_BASE_URL = "http://tourvisor.ru/xml"
+# Статика с хэшем в имени, заранее сжатая; HTML-оболочка рендерится один раз
+static_assets = AssetPipeline()
+templates.env.globals['asset_url'] = static_assets.asset_url
+
+# Несколько воркеров uvicorn делят сессии, кэш и задачи через STATE_BACKEND
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", "1"))
+WORKER_ID = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+LEADER_LEASE_SECONDS = 60
+COORDINATION_INTERVAL_SECONDS = 15
+SESSION_COOKIE = "session_id"
+# Cookie веб-чата - только id, выданные сервером; ключи сессий с префиксом не пересекаются с "канал:пользователь"
+SESSION_TOKEN_PATTERN = re.compile(r'[0-9a-f]{32}')
+WEB_SESSION_PREFIX = "web:"
+SESSION_TTL_SECONDS = int(os.getenv("CHAT_SESSION_TTL", str(24 * 3600)))
+# Как часто WebSocket-чат проверяет уведомления о снижении цен
+PRICE_ALERT_POLL_SECONDS = 30
+# Каналы, которые доставляют уведомления о ценах (WebSocket или цикл опроса в адаптере);
+# в остальных "следить" не предлагается
+WATCH_CHANNELS = {'web', 'instagram', 'whatsapp'}
 
 # Add CORS middleware to allow all origins
 from fastapi.middleware.cors import CORSMiddleware
@@ -39,280 +82,190 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(CompressionMiddleware)
+# Профиль отдельных запросов /chat и /search по заголовку X-Profile или доле запросов
+request_profiler = RequestProfiler()
+app.add_middleware(ProfilingMiddleware, profiler=request_profiler)
+# Ограничение одновременных /search, /chat и сообщений шлюза: лишние сразу получают 503
+admission = AdmissionController()
+app.add_middleware(AdmissionMiddleware, controller=admission)
 
-class TourSearch:
-    def __init__(self):
-        self.base_url = TOURVISOR_BASE_URL
-        self.auth = {
-            'authlogin': TOURVISOR_LOGIN,
-            'authpass': TOURVISOR_PASS
-        }
-        logger.info(f"Initialized TourSearch with login: {TOURVISOR_LOGIN}")
-
-        # Test API connection on initialization
-        self.test_connection()
-
-    def test_connection(self):
-        """Test API connection with credentials"""
-        now = datetime.now()
-        date_from = f"{now.day:02d}.{now.month:02d}.{now.year}"
-        date_to = (now + timedelta(days=7))
-        date_to = f"{date_to.day:02d}.{date_to.month:02d}.{date_to.year}"
-        
-        url = (
-            f"{self.base_url}/search.php"
-            f"?authlogin={self.auth['authlogin']}"
-            f"&authpass={self.auth['authpass']}"
-            f"&departure=1"  # Moscow
-            f"&country=1"    # Egypt
-            f"&datefrom={date_from}"
-            f"&dateto={date_to}"
-            f"&nightsfrom=7"
-            f"&nightsto=14"
-            f"&adults=2"
-            f"&child=0"
-        )
-        
+tour_search = TourSearch()
+shared_state = create_backend()
+search_cache = SearchCache(shared_state)
+hotel_catalog = HotelCatalog(shared_state)
+status_poller = StatusPoller(partial(tour_search.get_search_results, result_type='status'), shared_state)
+thumbnails = ThumbnailProxy()
+price_history = PriceHistory() if PRICE_HISTORY_ENABLED else None
+
+def store_results(search_params, results):
+    """Fill local reference names, move static hotel data to the catalog and cache the rest"""
+    get_reference().describe_hotels(results)
+    if price_history is not None:
         try:
-            logger.info(f"Testing connection with URL: {url}")
-            response = requests.get(url, verify=False)
-            logger.info(f"Test connection response: {response.text}")
-            if response.status_code != 200:
-                logger.error(f"API test failed with status code: {response.status_code}")
-            if 'error' in response.text.lower():
-                logger.error(f"API test failed with error: {response.text}")
-        except Exception as e:
-            logger.error(f"API test connection failed: {e}")
-
-    def _parse_xml_to_dict(self, element):
-        """Рекурсивно преобразует XML элемент в словарь"""
-        result = {}
-        for child in element:
-            if len(child) > 0:
-                if child.tag == 'tours':
-                    result[child.tag] = [self._parse_xml_to_dict(tour) for tour in child]
-                else:
-                    result[child.tag] = self._parse_xml_to_dict(child)
-            else:
-                result[child.tag] = child.text
-        return result
+            price_history.record(search_params, results)
+        except OSError as e:
+            logger.error(f"Failed to record price history: {e}")
+    results = hotel_catalog.split(results)
+    search_cache.set(search_params, results)
+    return results
 
-    def create_search_request(self, params):
-        """Создает поисковый запрос в системе Tourvisor"""
-        try:
-            # Convert and validate dates
-            try:
-                # Parse input dates
-                date_from = datetime.strptime(params['datefrom'], '%Y-%m-%d')
-                date_to = datetime.strptime(params['dateto'], '%Y-%m-%d')
-                
-                # Format dates in simple format (dd.mm.yyyy without URL encoding)
-                date_from_str = f"{date_from.day:02d}.{date_from.month:02d}.{date_from.year}"
-                date_to_str = f"{date_to.day:02d}.{date_to.month:02d}.{date_to.year}"
-                
-                logger.info(f"Converted dates: from {date_from_str} to {date_to_str}")
-            except ValueError as e:
-                logger.error(f"Date parsing error: {e}")
-                return {"error": "Неверный формат даты"}
-            
-            # Construct URL directly without using urlencode
-            url = (
-                f"{self.base_url}/search.php"
-                f"?authlogin={self.auth['authlogin']}"
-                f"&authpass={self.auth['authpass']}"
-                f"&departure={params['departure']}"
-                f"&country={params['country']}"
-                f"&datefrom={date_from_str}"
-                f"&dateto={date_to_str}"
-                f"&nightsfrom={params['nightsfrom']}"
-                f"&nightsto={params['nightsto']}"
-                f"&adults={params['adults']}"
-                f"&child={params['child']}"
-            )
-            
-            logger.info(f"Sending request to URL: {url}")
-            
-            # Make request
-            response = requests.get(url, verify=False, timeout=30)
-            logger.info(f"Response status code: {response.status_code}")
-            logger.info(f"Response headers: {response.headers}")
-            logger.info(f"Raw response text: {response.text}")
-            
-            if response.status_code != 200:
-                logger.error(f"API returned non-200 status code: {response.status_code}")
-                return None
-            
-            # Check if response is empty
-            if not response.text.strip():
-                logger.error("Empty response received from API")
-                return None
-            
-            # Parse XML response
-            try:
-                root = ET.fromstring(response.text)
-                
-                # Check for error first
-                error_elem = root.find('.//errormessage')
-                if error_elem is not None:
-                    error_text = error_elem.text
-                    logger.error(f"API returned error: {error_text}")
-                    return {"error": error_text}
-                
-                request_id_elem = root.find('.//requestid')
-                if request_id_elem is not None:
-                    request_id = request_id_elem.text
-                    logger.info(f"Successfully parsed request ID from XML: {request_id}")
-                    return {'requestid': request_id}
-                else:
-                    logger.error("No requestid element found in XML response")
-                    return None
-                    
-            except ET.ParseError as e:
-                logger.error(f"Failed to parse XML: {e}")
-                logger.error(f"XML content: {response.text}")
-                return None
-                
-        except requests.exceptions.RequestException as e:
-            logger.error(f"API request error: {e}")
-            logger.error(f"Response content: {response.text if 'response' in locals() else 'No response'}")
-            return None
-        except Exception as e:
-            logger.error(f"Unexpected error: {e}")
-            logger.error(f"Error type: {type(e)}")
-            import traceback
-            logger.error(f"Traceback: {traceback.format_exc()}")
-            return None
-
-    def get_search_results(self, request_id, result_type='result'):
-        """Получает результаты поиска"""
-        url = f"{self.base_url}/result.php"
-        
-        # Format parameters exactly as in example
-        params = {
-            'authlogin': self.auth['authlogin'],
-            'authpass': self.auth['authpass'],
-            'requestid': request_id,
-            'type': result_type,
-            'page': '1',
-            'onpage': '25'
-        }
-        
-        try:
-            # Create URL exactly as in example
-            full_url = f"{url}?{urlencode(params)}"
-            logger.info(f"Getting search results from URL: {full_url}")
-            
-            response = requests.get(full_url, verify=False)
-            logger.info(f"Response status code: {response.status_code}")
-            logger.info(f"Response headers: {response.headers}")
-            logger.info(f"Raw response text: {response.text}")
-            
-            response.raise_for_status()
-            
-            # Parse XML response
-            try:
-                root = ET.fromstring(response.text)
-                if root.tag != 'data':
-                    logger.error(f"Unexpected root tag: {root.tag}")
-                    return None
-
-                result = {}
-                
-                # Parse status block
-                status_elem = root.find('status')
-                if status_elem is not None:
-                    result['status'] = self._parse_xml_to_dict(status_elem)
-                
-                # Parse result block if present
-                result_elem = root.find('result')
-                if result_elem is not None:
-                    hotels = []
-                    for hotel_elem in result_elem.findall('hotel'):
-                        hotel_data = self._parse_xml_to_dict(hotel_elem)
-                        hotels.append(hotel_data)
-                    result['result'] = {'hotels': hotels}
-                
-                return result
-                
-            except ET.ParseError as e:
-                logger.error(f"Failed to parse XML: {e}")
-                return None
-                
-        except Exception as e:
-            logger.error(f"Error getting results: {e}")
-            logger.error(f"Error type: {type(e)}")
-            import traceback
-            logger.error(f"Traceback: {traceback.format_exc()}")
-            return None
-
-    def make_test_request(self, test_params=None):
-        """Make a test request to the API with provided or default parameters"""
-        if test_params is None:
-            now = datetime.now()
-            date_from = f"{now.day:02d}.{now.month:02d}.{now.year}"
-            date_to = (now + timedelta(days=7))
-            date_to = f"{date_to.day:02d}.{date_to.month:02d}.{date_to.year}"
-            
-            url = (
-                f"{self.base_url}/search.php"
-                f"?authlogin={self.auth['authlogin']}"
-                f"&authpass={self.auth['authpass']}"
-                f"&departure=1"  # Moscow
-                f"&country=1"    # Egypt
-                f"&datefrom={date_from}"
-                f"&dateto={date_to}"
-                f"&nightsfrom=7"
-                f"&nightsto=14"
-                f"&adults=2"
-                f"&child=0"
-            )
+def present_results(results, fields=None, normalized=False):
+    """Results as sent to clients: hotels joined with the catalog and projected to `fields`"""
+    if not normalized:
+        results = hotel_catalog.join(results)
+    return project_results(results, fields)
+
+async def cached_search(search_params):
+    """Search through the results cache and count the query for pre-warming"""
+    results = search_cache.get(search_params)
+    if results is not None:
+        logger.info(f"Serving search from cache: {search_cache.key(search_params)}")
+    else:
+        results = await run_search(tour_search, search_params)
+        if "error" not in results:
+            with span('search.store'):
+                results = store_results(search_params, results)
         else:
-            url = f"{self.base_url}/search.php?{urlencode(test_params)}"
-        
-        logger.debug(f"Making test request to URL: {url}")
-        
+            # TourVisor недоступен - лучше устаревшие результаты, чем ничего
+            stale = search_cache.get(search_params, allow_stale=True)
+            if stale is not None:
+                logger.warning(f"Serving stale results: {results['error']}")
+                return dict(stale, stale=True)
+
+    # Record after the cache is filled so the warmer does not race the user search
+    cache_warmer.record(search_params)
+    return results
+
+cache_warmer = CacheWarmer(
+    search_cache,
+    lambda params: run_search(tour_search, params, priority=Priority.BACKGROUND),
+    store=store_results
+)
+# Подписки на цены: один фоновый поиск на всех подписчиков одинакового запроса
+price_watch = PriceWatch(
+    search_cache,
+    lambda params: run_search(tour_search, params, priority=Priority.BACKGROUND),
+    store=store_results,
+    describe=lambda params: describe_spec(params, get_reference())
+)
+fanout_search = FanOutSearch(tour_search, search_one=cached_search)
+search_jobs = SearchJobQueue(
+    tour_search, shared_state, cache=search_cache, on_results=store_results, fanout=fanout_search,
+    owner=WORKER_ID, status_poller=status_poller
+)
+
+def submit_search(search_params, departures, countries):
+    """Queue a search job; returns the job or None when the queue is full"""
+    try:
+        with span('search.submit', searches=len(departures) * len(countries)):
+            job = search_jobs.submit(search_params, departures, countries)
+    except QueueFullError:
+        logger.warning("Search queue is full, rejecting search")
+        return None
+    if len(departures) == 1 and len(countries) == 1:
+        cache_warmer.record(search_params)
+    return job
+
+def job_view(job, fields=None, normalized=False):
+    """Public representation of a search job, hotels projected to `fields`"""
+    return JobResponse(
+        job_id=job['id'],
+        status=job['status'],
+        requestid=job.get('requestid'),
+        progress=job.get('progress'),
+        error=job.get('error'),
+        result=present_results(job.get('result'), fields, normalized),
+    )
+
+def web_session_id(cookies):
+    """Session key of a web client, None without a cookie issued by this server"""
+    token = cookies.get(SESSION_COOKIE)
+    if token and SESSION_TOKEN_PATTERN.fullmatch(token):
+        return f"{WEB_SESSION_PREFIX}{token}"
+    return None
+
+def web_session(cookies):
+    """(cookie value, session key); a missing or foreign cookie gets a new id"""
+    session_id = web_session_id(cookies)
+    if session_id is None:
+        session_id = f"{WEB_SESSION_PREFIX}{uuid.uuid4().hex}"
+    return session_id[len(WEB_SESSION_PREFIX):], session_id
+
+def load_chatbot(session_id):
+    """Chatbot with the conversation of this session restored"""
+    chatbot = TourChatbot()
+    saved = shared_state.get('chat_sessions', session_id)
+    if saved:
+        chatbot.load_state(saved)
+    return chatbot
+
+def save_chatbot(session_id, chatbot):
+    shared_state.set('chat_sessions', session_id, chatbot.to_state(), ttl=SESSION_TTL_SECONDS)
+
+async def coordinate_workers():
+    """Heartbeat and leader election between uvicorn workers
+
+    The leader refreshes reference data, pre-warms the cache, re-checks watched
+    prices, resumes jobs of stopped workers and purges expired state; the
+    others reload the snapshot.
+    """
+    loop = asyncio.get_running_loop()
+    last_reference_check = None
+    while True:
         try:
-            response = requests.get(url, verify=False, timeout=30)
-            
-            result = {
-                'url': url,
-                'status_code': response.status_code,
-                'headers': dict(response.headers),
-                'text': response.text,
-                'encoding': response.encoding
-            }
-            
-            # Try to parse XML
-            try:
-                root = ET.fromstring(response.text)
-                result['xml_valid'] = True
-                result['xml_root_tag'] = root.tag
-                if root.find('.//error') is not None:
-                    result['xml_error'] = root.find('.//error').text
-                if root.find('.//requestid') is not None:
-                    result['xml_requestid'] = root.find('.//requestid').text
-            except ET.ParseError as e:
-                result['xml_valid'] = False
-                result['xml_error'] = str(e)
-            
-            return result
-            
+            search_jobs.heartbeat()
+            if shared_state.acquire_lease('leader', WORKER_ID, LEADER_LEASE_SECONDS):
+                if WARMER_ENABLED and not cache_warmer.running:
+                    logger.info(f"Worker {WORKER_ID} is the leader")
+                    cache_warmer.start()
+                if PRICE_WATCH_ENABLED and not price_watch.running:
+                    price_watch.start()
+                search_jobs.resume_orphans()
+                if last_reference_check is None or time.monotonic() - last_reference_check >= REFERENCE_CHECK_SECONDS:
+                    last_reference_check = time.monotonic()
+                    await loop.run_in_executor(None, reference_store.refresh_if_stale, tour_search.get_reference_lists)
+                shared_state.purge_expired()
+            else:
+                if cache_warmer.running:
+                    await cache_warmer.stop()
+                if price_watch.running:
+                    await price_watch.stop()
+                last_reference_check = None
+                reference_store.reload_if_changed()
         except Exception as e:
-            return {
-                'url': url,
-                'error': str(e),
-                'error_type': type(e).__name__
-            }
-
-tour_search = TourSearch()
-chatbot = TourChatbot()
+            logger.error(f"Worker coordination error: {e}")
+        await asyncio.sleep(COORDINATION_INTERVAL_SECONDS)
+
+background_tasks = []
+
+@app.on_event("startup")
+async def start_background_tasks():
+    await search_jobs.start()
+    # Проверка доступа к TourVisor не задерживает запуск воркера
+    asyncio.get_running_loop().run_in_executor(None, tour_search.test_connection)
+    background_tasks.append(asyncio.create_task(coordinate_workers()))
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    for task in background_tasks:
+        task.cancel()
+    await cache_warmer.stop()
+    await price_watch.stop()
+    await search_jobs.stop()
 
 @app.get("/", response_class=HTMLResponse)
 async def home(request: Request):
-    return templates.TemplateResponse(
-        "index.html",
-        {"request": request}
-    )
+    return static_assets.shell_response(request, templates.get_template("index.html"), hotel_fields=UI_FIELDS)
+
+@app.api_route("/static/{path:path}", methods=["GET", "HEAD"])
+async def static_file(request: Request, path: str):
+    return static_assets.static_response(request, path)
+
+@app.get("/thumbnails")
+async def thumbnail(request: Request, url: str, w: int = THUMBNAIL_DEFAULT_WIDTH):
+    """Resized hotel picture from TourVisor, cached on disk"""
+    return await thumbnails.response(request, url, w)
 
 @app.post("/search")
 async def search_tours(
@@ -324,7 +277,15 @@ async def search_tours(
     nights_from: int = Form(...),
     nights_to: int = Form(...),
     adults: int = Form(2),
-    children: int = Form(0)
+    children: int = Form(0),
+    stars: int = Form(None),
+    meal: str = Form(None),
+    regions: str = Form(None),
+    price_from: int = Form(None),
+    price_to: int = Form(None),
+    rating: float = Form(None),
+    stream: bool = Form(False),
+    fields: str = Form(None)
 ):
     # Log the incoming request data
     logger.info(f"""
@@ -351,46 +312,85 @@ async def search_tours(
     }
 
     logger.info(f"Starting search with params: {search_params}")
-    
-    # Создаем поисковый запрос
-    search_response = tour_search.create_search_request(search_params)
-    if not search_response:
-        logger.error("Failed to create search request")
-        return {"error": "Ошибка при создании поискового запроса"}
-    
-    if "error" in search_response:
-        return {"error": f"API вернула ошибку: {search_response['error']}"}
 
-    request_id = search_response.get('requestid')
-    if not request_id:
-        logger.error(f"No request ID in response: {search_response}")
-        return {"error": "Не удалось получить ID запроса"}
-
-    logger.info(f"Got request ID: {request_id}")
-
-    # Ждем несколько секунд и получаем первые результаты
-    await asyncio.sleep(5)
-    
-    results = tour_search.get_search_results(request_id)
-    if not results:
-        logger.error("Failed to get search results")
-        return {"error": "Не удалось получить результаты поиска"}
-
-    return results
+    # Несколько стран или городов вылета через запятую - параллельный поиск
+    departures = split_choices(departure)
+    countries = split_choices(country)
+
+    # Проверяем коды по локальным справочникам, не обращаясь к TourVisor
+    reference = get_reference()
+    unknown = [d for d in departures if reference.departure_id(d) != d]
+    if unknown:
+        return {"error": f"Неизвестный город вылета: {', '.join(unknown)}"}
+    unknown = [c for c in countries if reference.country_id(c) != c]
+    if unknown:
+        return {"error": f"Неизвестная страна: {', '.join(unknown)}"}
+    # Фильтры уходят в TourVisor, чтобы не скачивать лишние отели
+    try:
+        search_params.update(build_filters(
+            reference, countries, stars=stars, meal=meal, regions=regions,
+            price_from=price_from, price_to=price_to, rating=rating
+        ))
+    except FilterError as e:
+        return {"error": str(e)}
+    if stream:
+        async def snapshots():
+            async for merged in fanout_search.stream(search_params, departures, countries):
+                # Та же схема, что у GET /jobs/{id}: числа - числами
+                yield dumps_line(SearchResults.model_validate(present_results(merged, fields)))
+        return StreamingResponse(snapshots(), media_type="application/x-ndjson")
+
+    # Ставим поиск в очередь и сразу возвращаем ID задачи, результаты - в GET /jobs/{id}
+    job = submit_search(search_params, departures, countries)
+    if job is None:
+        return JSONResponse(
+            status_code=503, content={"error": OVERLOADED_MESSAGE}, headers={'Retry-After': str(admission.retry_after())}
+        )
+    return CompactJSONResponse(job_view(job, fields))
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, fields: str = None, normalized: bool = False):
+    """Статус и результаты поисковой задачи
+
+    fields=hotelname,price,tours.price - только нужные поля;
+    normalized=true - без статических данных отелей (они в GET /hotels)
+    """
+    job = search_jobs.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "Задача не найдена"})
+    return CompactJSONResponse(job_view(job, fields, normalized))
+
+@app.get("/hotels")
+async def get_hotels(codes: str):
+    """Каталог отелей по кодам: codes=123,456"""
+    return CompactJSONResponse({'hotels': hotel_catalog.entries(split_choices(codes))})
+
+@app.get("/hotels/{hotel_code}")
+async def get_hotel(request: Request, hotel_code: str):
+    """Запись каталога отеля; ETag - версия записи"""
+    hotel = hotel_catalog.entries([hotel_code]).get(hotel_code)
+    if hotel is None:
+        return JSONResponse(status_code=404, content={"error": "Отель не найден"})
+    etag = f'"{hotel["catalog_version"]}"'
+    if request.headers.get('if-none-match') == etag:
+        return Response(status_code=304, headers={'ETag': etag})
+    return CompactJSONResponse(hotel, headers={'ETag': etag, 'Cache-Control': 'no-cache'})
 
 @app.get("/status/{request_id}")
 async def get_status(request_id: str):
     """Получение статуса поиска"""
-    results = tour_search.get_search_results(request_id, 'status')
-    return results
+    # Все вкладки и опросчики одного поиска делят один запрос статуса в TourVisor
+    return await status_poller.aget(request_id)
 
 @app.get("/test", response_class=JSONResponse)
 async def test_api():
     """Test endpoint to check API connectivity"""
     logger.info("Starting API test")
     
+    loop = asyncio.get_running_loop()
+
     # Test with default parameters
-    default_test = tour_search.make_test_request()
+    default_test = await loop.run_in_executor(None, tour_search.make_test_request)
     
     # Test with minimal parameters
     minimal_params = {
@@ -403,7 +403,7 @@ async def test_api():
         'nightsfrom': '7',
         'nightsto': '14'
     }
-    minimal_test = tour_search.make_test_request(minimal_params)
+    minimal_test = await loop.run_in_executor(None, tour_search.make_test_request, minimal_params)
     
     return {
         'credentials': {
@@ -430,12 +430,61 @@ async def test_country(country_id: str):
         'nightsto': '14'
     }
     
-    return tour_search.make_test_request(test_params)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, tour_search.make_test_request, test_params)
 
 @app.post("/chat")
-async def chat(request: Request, message: str = Form(...)):
+async def chat(request: Request, message: str = Form(...), fields: str = Form(None)):
     """Handle chat messages and return bot response"""
-    response = chatbot.get_next_message(message)
+    token, session_id = web_session(request.cookies)
+    with span('chat.turn', channel='web'):
+        chatbot = load_chatbot(session_id)
+        reply = await chat_reply(chatbot, message, session_id)
+        save_chatbot(session_id, chatbot)
+
+    if reply.get('data') is not None:
+        reply['data'] = present_results(reply['data'], fields)
+    response = CompactJSONResponse(ChatResponse(**reply))
+    response.set_cookie(SESSION_COOKIE, token, max_age=SESSION_TTL_SECONDS, httponly=True, samesite="lax")
+    return response
+
+def watch_reply(command, target, session_id, channel, user_id):
+    """Reply to a price watch command of the chat"""
+    if command == 'list':
+        subscriptions = price_watch.subscriptions(session_id)
+        if not subscriptions:
+            return "У вас нет подписок на цены. " + WATCH_HINT
+        lines = [f"{number}. {describe_spec(s['params'], get_reference())}: {watch_condition(s)}"
+                 for number, s in enumerate(subscriptions, 1)]
+        return "🔔 Ваши подписки на цены:\n" + "\n".join(lines) + f"\n{UNWATCH_HINT}"
+    if command == 'unwatch':
+        if price_watch.unsubscribe(session_id):
+            return "🔕 Подписки на цены отменены"
+        return "У вас нет подписок на цены"
+
+    searches = shared_state.get('last_search', session_id)
+    if not searches:
+        return NO_SEARCH_MESSAGE
+    try:
+        subscriptions = [
+            price_watch.subscribe(session_id, channel, params, target=target, user_id=user_id) for params in searches
+        ]
+    except WatchLimitError as e:
+        return str(e)
+    lines = [describe_spec(s['params'], get_reference()) for s in subscriptions]
+    return (
+        "🔔 Слежу за ценами:\n" + "\n".join(lines) +
+        f"\nСообщу, когда {watch_condition(subscriptions[0])}. {UNWATCH_HINT}"
+    )
+
+async def chat_reply(chatbot, message, session_id, channel='web', user_id=None):
+    """Next bot reply for the message; queues the search when the dialog is complete"""
+    command = parse_watch_command(message) if watch_enabled(channel) else None
+    if command is not None:
+        return {"message": watch_reply(*command, session_id, channel, user_id), "type": "message"}
+
+    with span('chatbot.reply', state=chatbot.session.state.name):
+        response = await chatbot.aget_next_message(message)
     
     # If the response is a tuple with "SEARCH_READY" and user_data
     if isinstance(response, tuple) and response[0] == "SEARCH_READY":
@@ -450,43 +499,329 @@ async def chat(request: Request, message: str = Form(...)):
             'nightsfrom': user_data['nights_from'],
             'nightsto': user_data['nights_to'],
             'adults': user_data['adults'],
-            'child': user_data['children']
+            'child': user_data['children'],
+            **user_data.get('filters', {})
         }
-        
-        # Perform the search
-        search_response = tour_search.create_search_request(search_params)
-        
-        if not search_response:
-            return {"message": "Ошибка при создании поискового запроса", "type": "error"}
-        
-        if "error" in search_response:
-            return {"message": f"API вернула ошибку: {search_response['error']}", "type": "error"}
 
-        request_id = search_response.get('requestid')
-        if not request_id:
-            return {"message": "Не удалось получить ID запроса", "type": "error"}
-
-        # Wait a few seconds for results
-        await asyncio.sleep(5)
-
-        # Get initial results
-        results = tour_search.get_search_results(request_id)
-        if not results:
-            return {"message": "Не удалось получить результаты поиска", "type": "error"}
-
-        # Format the results for display
+        departures = user_data.get('departures', [user_data['departure']])
+        countries = user_data.get('countries', [user_data['country']])
+        # Последний поиск - на него подписывает команда "следить"
+        shared_state.set('last_search', session_id, [
+            dict(search_params, departure=departure, country=country)
+            for departure in departures for country in countries
+        ], ttl=SESSION_TTL_SECONDS)
+
+        # Queue the search, the page polls /jobs/{id} for results
+        job = submit_search(search_params, departures, countries)
+        if job is None:
+            return {"message": "Сервис перегружен, попробуйте чуть позже", "type": "error"}
+        if job['status'] == 'done':
+            return {
+                "message": "🎯 Вот что я нашел:",
+                "type": "search_results",
+                "data": job['result']
+            }
         return {
-            "message": "🎯 Вот что я нашел:",
-            "type": "search_results",
-            "data": results
+            "message": "🔍 Ищу туры, это займет несколько секунд...",
+            "type": "search_job",
+            "job_id": job['id']
         }
     
     return {"message": response, "type": "message"}
 
+async def send_hotels(connection, results, job_id=None, fields=None):
+    """Search results as hotel batches; the first one carries the search totals"""
+    results = present_results(results, fields) or {}
+    batches = hotel_batches((results.get('result') or {}).get('hotels') or [])
+    for number, hotels in enumerate(batches, 1):
+        await connection.send(ChatEvent(
+            type='hotels',
+            job_id=job_id,
+            hotels=hotels,
+            status=results.get('status') if number == 1 else None,
+            stale=results.get('stale'),
+            final=number == len(batches),
+        ))
+
+async def watch_search(connection, job_id, fields=None):
+    """Push progress of a search job and its hotels as soon as it finishes"""
+    try:
+        await _watch_search(connection, job_id, fields)
+    except SlowConsumerError:
+        await connection.close_slow()
+
+async def push_price_alerts(connection, session_id):
+    """Send price drop notifications of the session while the chat is open"""
+    try:
+        while True:
+            for notification in price_watch.pending(session_id):
+                await connection.send(ChatEvent(type='price_alert', message=notification['message']))
+                price_watch.acknowledge([notification['id']], f"{session_id}#")
+            await asyncio.sleep(PRICE_ALERT_POLL_SECONDS)
+    except SlowConsumerError:
+        await connection.close_slow()
+
+async def _watch_search(connection, job_id, fields):
+    last_progress = None
+    while True:
+        job = search_jobs.get(job_id)
+        if job is None:
+            await connection.send(ChatEvent(type='error', job_id=job_id, message="Задача не найдена"))
+            return
+        if job['status'] == 'done':
+            await connection.send(ChatEvent(type='message', job_id=job_id, message="🎯 Вот что я нашел:"))
+            await send_hotels(connection, job['result'], job_id, fields)
+            if PRICE_WATCH_ENABLED:
+                await connection.send(ChatEvent(type='message', job_id=job_id, message=WATCH_HINT))
+            return
+        if job['status'] == 'error':
+            await connection.send(ChatEvent(
+                type='error', job_id=job_id, message=job.get('error') or "Не удалось получить результаты поиска"
+            ))
+            return
+        progress = job.get('progress')
+        if progress and progress != last_progress:
+            connection.offer(ChatEvent(type='progress', job_id=job_id, progress=progress))
+            last_progress = progress
+        await asyncio.sleep(WS_JOB_POLL_SECONDS)
+
+@app.websocket("/ws/chat")
+async def chat_socket(websocket: WebSocket, fields: str = None):
+    """Чат через WebSocket: ответы бота, прогресс поиска и отели по одному соединению
+
+    Клиент шлет {"type": "message", "text": ...} или {"type": "reset"}.
+    Соединение привязано к сессии из cookie, как и POST /chat.
+    """
+    token, session_id = web_session(websocket.cookies)
+    cookie = f"{SESSION_COOKIE}={token}; Max-Age={SESSION_TTL_SECONDS}; Path=/; HttpOnly; SameSite=lax"
+    await websocket.accept(headers=[(b'set-cookie', cookie.encode('latin-1'))])
+
+    connection = ChatConnection(websocket)
+    sender = asyncio.create_task(connection.run_sender())
+    watchers = set()
+    if PRICE_WATCH_ENABLED:
+        watchers.add(asyncio.create_task(push_price_alerts(connection, session_id)))
+    try:
+        while True:
+            payload = await websocket.receive_json()
+            if not isinstance(payload, dict):
+                continue
+            if payload.get('type') == 'reset':
+                shared_state.delete('chat_sessions', session_id)
+                await connection.send(ChatEvent(type='reset', message="Чат сброшен. Начнем сначала!"))
+                continue
+            text = str(payload.get('text') or '').strip()
+            if not text:
+                continue
+
+            # Сообщения через WebSocket проходят тот же контроль нагрузки, что и POST /chat
+            if not await admission.acquire():
+                await connection.send(ChatEvent(type='error', message=OVERLOADED_MESSAGE))
+                continue
+            started = time.monotonic()
+            try:
+                with span('chat.turn', channel='websocket'):
+                    chatbot = load_chatbot(session_id)
+                    reply = await chat_reply(chatbot, text, session_id)
+                    save_chatbot(session_id, chatbot)
+            finally:
+                admission.release(time.monotonic() - started)
+
+            if reply['type'] == 'search_results':
+                await connection.send(ChatEvent(type='message', message=reply['message']))
+                await send_hotels(connection, reply['data'], fields=fields)
+            elif reply['type'] == 'search_job':
+                await connection.send(ChatEvent(type='search_job', job_id=reply['job_id'], message=reply['message']))
+                watcher = asyncio.create_task(watch_search(connection, reply['job_id'], fields))
+                watchers.add(watcher)
+                watcher.add_done_callback(watchers.discard)
+            else:
+                await connection.send(ChatEvent(type=reply['type'], message=reply['message']))
+    except WebSocketDisconnect:
+        pass
+    except SlowConsumerError:
+        await connection.close_slow()
+    except ValueError:
+        # Не JSON - закрываем с кодом "unsupported data"
+        await websocket.close(code=1003)
+    finally:
+        for task in [sender, *watchers]:
+            task.cancel()
+
+def check_gateway_access(request, channel):
+    """Error response if the channel is unknown or the adapter token is wrong"""
+    if channel not in CHANNEL_MESSAGE_LIMITS:
+        return JSONResponse(status_code=404, content={"error": f"Неизвестный канал: {channel}"})
+    if GATEWAY_TOKEN and request.headers.get('x-gateway-token') != GATEWAY_TOKEN:
+        return JSONResponse(status_code=403, content={"error": "Неверный токен шлюза"})
+    return None
+
+def watch_enabled(channel):
+    return PRICE_WATCH_ENABLED and channel in WATCH_CHANNELS
+
+def watch_hint(channel):
+    return [WATCH_HINT] if watch_enabled(channel) else []
+
+def gateway_job_reply(job, channel):
+    """Messenger messages for a search job: results when done, nothing while running"""
+    if job['status'] == 'done':
+        messages = format_results(hotel_catalog.join(job['result']), CHANNEL_MESSAGE_LIMITS[channel]) + watch_hint(channel)
+    elif job['status'] == 'error':
+        messages = [f"😔 {job.get('error') or 'Не удалось получить результаты поиска'}", NEW_SEARCH_HINT]
+    else:
+        messages = []
+    return GatewayReply(messages=messages, job_id=job['id'], status=job['status'])
+
+@app.post("/gateway/{channel}/{user_id}")
+async def gateway_message(request: Request, channel: str, user_id: str, payload: GatewayMessage):
+    """Сообщение из мессенджера: общий диалог, кэш и поиск для всех каналов"""
+    denied = check_gateway_access(request, channel)
+    if denied is not None:
+        return denied
+
+    session_id = f"{channel}:{user_id}"
+    # Трасса продолжает трассу адаптера из заголовка traceparent
+    with span('chat.turn', parent=parse_traceparent(request.headers.get(TRACEPARENT_HEADER)), channel=channel):
+        chatbot = load_chatbot(session_id)
+        reply = await chat_reply(chatbot, payload.text, session_id, channel=channel, user_id=user_id)
+        if reply['type'] in ('search_job', 'search_results'):
+            # Поиск запущен - следующий вопрос пользователя начинает новый диалог
+            chatbot.reset()
+        save_chatbot(session_id, chatbot)
+
+    if reply['type'] == 'search_results':
+        messages = [reply['message']] + format_results(
+            hotel_catalog.join(reply['data']), CHANNEL_MESSAGE_LIMITS[channel]
+        ) + watch_hint(channel)
+        return CompactJSONResponse(GatewayReply(messages=messages, status='done'))
+    if reply['type'] == 'search_job':
+        return CompactJSONResponse(GatewayReply(messages=[reply['message']], job_id=reply['job_id'], status='queued'))
+    return CompactJSONResponse(GatewayReply(messages=[reply['message']]))
+
+@app.get("/gateway/{channel}/notifications")
+async def gateway_notifications(request: Request, channel: str):
+    """Уведомления о снижении цен для всех пользователей канала
+
+    Адаптер рассылает их и подтверждает через POST .../notifications/ack;
+    неподтвержденные приходят снова при следующем опросе.
+    """
+    denied = check_gateway_access(request, channel)
+    if denied is not None:
+        return denied
+    users = {}
+    for notification in price_watch.pending_for_channel(channel):
+        user = users.setdefault(notification['user_id'], GatewayNotification(
+            user_id=notification['user_id'], messages=[], ids=[]
+        ))
+        user.messages.append(notification['message'])
+        user.ids.append(notification['id'])
+    return CompactJSONResponse(GatewayNotifications(notifications=list(users.values())))
+
+@app.post("/gateway/{channel}/notifications/ack")
+async def gateway_notifications_ack(request: Request, channel: str, payload: NotificationAck):
+    """Подтверждение отправки: уведомления удаляются из очереди"""
+    denied = check_gateway_access(request, channel)
+    if denied is not None:
+        return denied
+    return {'acknowledged': price_watch.acknowledge(payload.ids, f"{channel}:")}
+
+@app.get("/gateway/{channel}/{user_id}/jobs/{job_id}")
+async def gateway_job(request: Request, channel: str, user_id: str, job_id: str):
+    """Результаты поиска, отформатированные для мессенджера; адаптер опрашивает, пока status не done/error"""
+    denied = check_gateway_access(request, channel)
+    if denied is not None:
+        return denied
+    job = search_jobs.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "Задача не найдена"})
+    return CompactJSONResponse(gateway_job_reply(job, channel))
+
+@app.get("/prices/cheapest-dates")
+async def cheapest_dates(country: str, departure: str = None, days: int = 60, nights: int = None):
+    """Самые дешевые даты вылета по накопленной истории цен, без новых поисков"""
+    if price_history is None:
+        return JSONResponse(status_code=404, content={"error": "История цен отключена"})
+    return CompactJSONResponse({
+        'country': country,
+        'dates': price_history.cheapest_dates(country, departure, days, nights),
+    })
+
+@app.get("/prices/hotels/{hotel_code}")
+async def hotel_price_trend(hotel_code: str, days: int = 90, nights: int = None):
+    """Динамика минимальной цены отеля по дням наблюдения"""
+    if price_history is None:
+        return JSONResponse(status_code=404, content={"error": "История цен отключена"})
+    return CompactJSONResponse({
+        'hotelcode': hotel_code,
+        'trend': price_history.hotel_trend(hotel_code, days, nights),
+    })
+
+@app.get("/watch")
+async def list_watches(request: Request):
+    """Подписки на снижение цен текущей сессии чата"""
+    session_id = web_session_id(request.cookies)
+    subscriptions = price_watch.subscriptions(session_id) if session_id else []
+    return CompactJSONResponse({'subscriptions': [
+        {
+            'id': s['id'],
+            'search': describe_spec(s['params'], get_reference()),
+            'target': s.get('target'),
+            'baseline': s.get('baseline'),
+            'notified_price': s.get('notified_price'),
+        }
+        for s in subscriptions
+    ]})
+
+@app.delete("/watch/{watch_id}")
+async def delete_watch(request: Request, watch_id: str):
+    session_id = web_session_id(request.cookies)
+    if not session_id or not price_watch.unsubscribe(session_id, watch_id):
+        return JSONResponse(status_code=404, content={"error": "Подписка не найдена"})
+    return {"message": "🔕 Подписка отменена", "type": "message"}
+
+@app.get("/watch/notifications")
+async def watch_notifications(request: Request):
+    """Уведомления о снижении цен, которые еще не подтверждены через POST /watch/notifications/ack"""
+    session_id = web_session_id(request.cookies)
+    notifications = price_watch.pending(session_id) if session_id else []
+    return CompactJSONResponse({'notifications': notifications})
+
+@app.post("/watch/notifications/ack")
+async def watch_notifications_ack(request: Request, payload: NotificationAck):
+    session_id = web_session_id(request.cookies)
+    acknowledged = price_watch.acknowledge(payload.ids, f"{session_id}#") if session_id else 0
+    return {'acknowledged': acknowledged}
+
+@app.get("/metrics", response_class=JSONResponse)
+async def metrics():
+    """Internal counters of caches and background workers"""
+    return {
+        'search_cache': search_cache.stats(),
+        'hotel_catalog': hotel_catalog.stats(),
+        'price_history': price_history.stats() if price_history is not None else None,
+        'static_assets': static_assets.stats(),
+        'status_poller': status_poller.stats(),
+        'thumbnails': thumbnails.stats(),
+        'profiler': request_profiler.stats(),
+        'admission': admission.stats(),
+        'reference_data': {
+            'fetched_at': get_reference().fetched_at,
+            'content_hash': get_reference().content_hash,
+        },
+        'cache_warmer': cache_warmer.stats(),
+        'price_watch': price_watch.stats(),
+        'search_jobs': search_jobs.stats(),
+        'upstream': tour_search.governor.stats(),
+        'circuit_breaker': tour_search.breaker.stats(),
+        'hedging': tour_search.hedger.stats(),
+    }
+
 @app.post("/chat/reset")
-async def reset_chat():
+async def reset_chat(request: Request):
     """Reset the chat conversation"""
-    chatbot.reset()
+    session_id = web_session_id(request.cookies)
+    if session_id:
+        shared_state.delete('chat_sessions', session_id)
     return {"message": "Чат сброшен. Начнем сначала!", "type": "message"}
 
 if __name__ == "__main__":
@@ -501,9 +836,11 @@ if __name__ == "__main__":
     logger.info(f"TOURVISOR_PASS: {'*' * len(TOURVISOR_PASS) if TOURVISOR_PASS else 'Not set'}")
     logger.info(f"TOURVISOR_BASE_URL: {TOURVISOR_BASE_URL}")
     
+    # Несколько воркеров требуют импортируемой строки приложения
     uvicorn.run(
-        app,
+        "main:app",
         host="127.0.0.1",
         port=3000,
-        log_level="debug"
+        log_level="debug",
+        workers=WEB_WORKERS
     ) 
\ No newline at end of file
@@ -0,0 +1,231 @@
+import logging
+import mmap
+import os
+import threading
+import time
+from array import array
+from datetime import date, datetime, timedelta
+
+try:
+    import fcntl
+except ImportError:  # Windows: запись защищена только внутри процесса
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Каталог с колонками истории цен
+PRICE_HISTORY_DIR = os.getenv(
+    "PRICE_HISTORY_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "price_history")
+)
+PRICE_HISTORY_ENABLED = os.getenv("PRICE_HISTORY_ENABLED", "1") == "1"
+# Цены старше этого не участвуют в поиске дешевых дат
+PRICE_MAX_AGE_DAYS = 7
+
+# Колонка -> код типа array (native byte order, фиксированная ширина)
+COLUMNS = (
+    ('departure', 'H'),
+    ('country', 'H'),
+    ('hotel', 'I'),
+    ('flydate', 'H'),     # дней с 01.01.1970
+    ('nights', 'B'),
+    ('price', 'I'),
+    ('fetched_at', 'I'),  # unix time
+)
+
+EPOCH = date(1970, 1, 1)
+
+
+def day_number(value):
+    """'dd.mm.yyyy' or a date -> days since 1970-01-01"""
+    if isinstance(value, str):
+        value = datetime.strptime(value, '%d.%m.%Y').date()
+    return (value - EPOCH).days
+
+
+def day_string(number):
+    return (EPOCH + timedelta(days=number)).strftime('%d.%m.%Y')
+
+
+def _int(value):
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+class PriceHistory:
+    """Append-only columnar price history, one memory-mapped file per column
+
+    Every tour of every fetched result becomes a row. Rows are appended
+    under a file lock, so several workers can feed the same store; queries
+    read the mapped columns and in-memory indexes by country and hotel.
+    """
+
+    def __init__(self, path=PRICE_HISTORY_DIR):
+        self.path = path
+        self._lock = threading.Lock()
+        self._maps = {}
+        self._views = {}
+        self.rows = 0
+        self._by_country = {}
+        self._by_hotel = {}
+
+    def _column_path(self, name):
+        return os.path.join(self.path, f"{name}.col")
+
+    def _stored_rows(self):
+        """Complete rows on disk (a crashed append may leave some columns longer)"""
+        rows = None
+        for name, code in COLUMNS:
+            try:
+                size = os.path.getsize(self._column_path(name))
+            except OSError:
+                return 0
+            count = size // array(code).itemsize
+            rows = count if rows is None else min(rows, count)
+        return rows or 0
+
+    def rows_from_results(self, params, results, fetched_at=None):
+        """Column arrays for every tour in the results"""
+        fetched_at = int(fetched_at or time.time())
+        departure = _int(params.get('departure')) or 0
+        columns = {name: array(code) for name, code in COLUMNS}
+        for hotel in ((results or {}).get('result') or {}).get('hotels') or []:
+            hotel_code = _int(hotel.get('hotelcode'))
+            country = _int(hotel.get('countrycode')) or _int(params.get('country'))
+            if hotel_code is None or country is None:
+                continue
+            for tour in hotel.get('tours') or []:
+                price = _int(tour.get('price'))
+                nights = _int(tour.get('nights'))
+                try:
+                    flydate = day_number(tour.get('flydate') or '')
+                except ValueError:
+                    continue
+                if price is None or nights is None:
+                    continue
+                columns['departure'].append(departure)
+                columns['country'].append(country)
+                columns['hotel'].append(hotel_code)
+                columns['flydate'].append(flydate)
+                columns['nights'].append(min(nights, 255))
+                columns['price'].append(price)
+                columns['fetched_at'].append(fetched_at)
+        return columns
+
+    def record(self, params, results):
+        """Append the tours of fresh search results; returns the number of rows written"""
+        columns = self.rows_from_results(params, results)
+        count = len(columns['price'])
+        if not count:
+            return 0
+        with self._lock:
+            os.makedirs(self.path, exist_ok=True)
+            with open(os.path.join(self.path, "append.lock"), 'a') as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                # Обрезаем хвост после прерванной записи, чтобы колонки оставались выровнены
+                rows = self._stored_rows()
+                for name, code in COLUMNS:
+                    with open(self._column_path(name), 'ab') as f:
+                        f.truncate(rows * array(code).itemsize)
+                        f.write(columns[name].tobytes())
+        return count
+
+    def _release(self):
+        for view in self._views.values():
+            view.release()
+        for mapped in self._maps.values():
+            mapped.close()
+        self._views = {}
+        self._maps = {}
+
+    def refresh(self):
+        """Map rows appended since the last call and extend the indexes"""
+        with self._lock:
+            rows = self._stored_rows()
+            if rows <= self.rows:
+                return self.rows
+            self._release()
+            for name, code in COLUMNS:
+                with open(self._column_path(name), 'rb') as f:
+                    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._maps[name] = mapped
+                self._views[name] = memoryview(mapped)[:rows * array(code).itemsize].cast(code)
+
+            countries = self._views['country']
+            hotels = self._views['hotel']
+            for row in range(self.rows, rows):
+                self._by_country.setdefault(countries[row], array('I')).append(row)
+                self._by_hotel.setdefault(hotels[row], array('I')).append(row)
+            self.rows = rows
+            return rows
+
+    def cheapest_dates(self, country, departure=None, days=60, nights=None, max_age_days=PRICE_MAX_AGE_DAYS):
+        """Cheapest known price per departure date over the next `days` days"""
+        self.refresh()
+        first = day_number(date.today())
+        last = first + days
+        min_fetched = time.time() - max_age_days * 86400
+        departure = _int(departure)
+        nights = _int(nights)
+        columns = self._views
+        best = {}
+        # fetched_at ставится до взятия блокировки, поэтому строки разных воркеров
+        # не упорядочены по времени - проверяем каждую, без раннего выхода
+        for row in self._by_country.get(_int(country), ()):
+            if columns['fetched_at'][row] < min_fetched:
+                continue
+            flydate = columns['flydate'][row]
+            if flydate < first or flydate > last:
+                continue
+            if departure is not None and columns['departure'][row] != departure:
+                continue
+            if nights is not None and columns['nights'][row] != nights:
+                continue
+            price = columns['price'][row]
+            if flydate not in best or price <= best[flydate][0]:
+                best[flydate] = (price, row)
+
+        return [
+            {
+                'date': day_string(flydate),
+                'price': price,
+                'hotelcode': str(columns['hotel'][row]),
+                'nights': columns['nights'][row],
+                'departure': str(columns['departure'][row]),
+            }
+            for flydate, (price, row) in sorted(best.items())
+        ]
+
+    def hotel_trend(self, hotel, days=90, nights=None):
+        """Minimum observed price of a hotel per day of observation"""
+        self.refresh()
+        min_fetched = time.time() - days * 86400
+        nights = _int(nights)
+        columns = self._views
+        per_day = {}
+        for row in self._by_hotel.get(_int(hotel), ()):
+            fetched_at = columns['fetched_at'][row]
+            if fetched_at < min_fetched:
+                continue
+            if nights is not None and columns['nights'][row] != nights:
+                continue
+            day = int(fetched_at // 86400)
+            price = columns['price'][row]
+            low, samples = per_day.get(day, (price, 0))
+            per_day[day] = (min(low, price), samples + 1)
+
+        return [
+            {'date': day_string(day), 'min_price': low, 'samples': samples}
+            for day, (low, samples) in sorted(per_day.items())
+        ]
+
+    def stats(self):
+        self.refresh()
+        size = sum(
+            os.path.getsize(self._column_path(name))
+            for name, _ in COLUMNS if os.path.exists(self._column_path(name))
+        )
+        return {'rows': self.rows, 'bytes': size, 'countries': len(self._by_country), 'hotels': len(self._by_hotel)}
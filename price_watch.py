@@ -0,0 +1,378 @@
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import time
+import uuid
+
+from search_cache import relative_params, current_params, RELATIVE_DATES
+from search_filters import describe_filters
+
+logger = logging.getLogger(__name__)
+
+PRICE_WATCH_ENABLED = os.getenv("PRICE_WATCH_ENABLED", "1") == "1"
+# Сколько поисков в час подписки на цены могут отправить в TourVisor (все подписки вместе)
+PRICE_WATCH_SEARCHES_PER_HOUR = int(os.getenv("PRICE_WATCH_SEARCHES_PER_HOUR", "30"))
+# Как часто перепроверять один поиск, сколько бы пользователей на него ни подписались
+PRICE_WATCH_INTERVAL_SECONDS = int(os.getenv("PRICE_WATCH_INTERVAL", str(6 * 3600)))
+# Без целевой цены уведомляем, когда минимальная цена упала хотя бы на эту долю
+PRICE_WATCH_MIN_DROP = float(os.getenv("PRICE_WATCH_MIN_DROP", "0.05"))
+PRICE_WATCH_TTL_DAYS = int(os.getenv("PRICE_WATCH_TTL_DAYS", "30"))
+PRICE_WATCH_MAX_PER_USER = 5
+PRICE_WATCH_TICK_SECONDS = 60
+# После неудачного поиска проверка откладывается
+PRICE_WATCH_RETRY_SECONDS = 1800
+NOTIFICATION_TTL_SECONDS = 7 * 24 * 3600
+
+WATCH_PATTERN = re.compile(
+    r'^следить(?:\s+за\s+цен\w*)?(?:\s+до\s+(\d[\d\s]*?)\s*(к|тыс\w*)?)?\s*(?:₽|р|руб\w*)?\.?$', re.IGNORECASE
+)
+UNWATCH_COMMANDS = ('не следить', 'отписаться', 'отменить подписку')
+LIST_COMMANDS = ('подписки', 'мои подписки')
+
+WATCH_HINT = "🔔 Чтобы я сообщил о снижении цены, напишите 'следить' или 'следить до 150000'"
+NO_SEARCH_MESSAGE = "Сначала найдите туры, а потом напишите 'следить' - я сообщу, когда цены снизятся"
+UNWATCH_HINT = "Отписаться: 'не следить'"
+
+
+class WatchLimitError(Exception):
+    pass
+
+
+def parse_watch_command(text):
+    """('watch', target price or None), ('unwatch', None), ('list', None) or None for other messages"""
+    text = ' '.join(text.lower().split())
+    if text in UNWATCH_COMMANDS:
+        return 'unwatch', None
+    if text in LIST_COMMANDS:
+        return 'list', None
+    match = WATCH_PATTERN.match(text)
+    if match is None:
+        return None
+    if match.group(1) is None:
+        return 'watch', None
+    target = int(re.sub(r'\s', '', match.group(1)))
+    return 'watch', target * 1000 if match.group(2) else target
+
+
+def min_price(results):
+    """Cheapest tour price in search results, None if there are no tours"""
+    status = (results or {}).get('status') or {}
+    prices = [status.get('minprice')] + [
+        hotel.get('price') for hotel in ((results or {}).get('result') or {}).get('hotels') or []
+    ]
+    values = []
+    for price in prices:
+        try:
+            values.append(int(float(price)))
+        except (TypeError, ValueError):
+            continue
+    values = [value for value in values if value > 0]
+    return min(values) if values else None
+
+
+def should_notify(subscription, price, min_drop=PRICE_WATCH_MIN_DROP):
+    """Whether `price` really dropped since the user last saw it and passed the threshold
+
+    The baseline is the price shown when subscribing, so a target that is
+    already met does not alert until the price goes down further.
+    """
+    last = subscription.get('notified_price') or subscription.get('baseline')
+    if last is None:
+        return False
+    if subscription.get('target'):
+        return price <= subscription['target'] and price < last
+    return price <= last * (1 - min_drop)
+
+
+def _amount(value):
+    return f"{value:,} ₽".replace(',', ' ')
+
+
+def describe_spec(params, reference):
+    """Watched search as a short Russian line"""
+    departure = reference.departures.get(str(params.get('departure'))) or params.get('departure')
+    country = reference.countries.get(str(params.get('country'))) or params.get('country')
+    if params.get('datefrom') == RELATIVE_DATES:
+        dates = "ближайший месяц"
+    else:
+        dates = f"{params.get('datefrom')} - {params.get('dateto')}"
+    text = (
+        f"{departure} → {country}, {dates}, {params.get('nightsfrom')}-{params.get('nightsto')} ночей, "
+        f"{params.get('adults')} взр."
+    )
+    if int(params.get('child') or 0):
+        text += f", {params['child']} дет."
+    filters = describe_filters(params, reference)
+    return f"{text} ({filters})" if filters else text
+
+
+def watch_condition(subscription):
+    if subscription.get('target'):
+        return f"цена опустится до {_amount(subscription['target'])}"
+    return f"цена снизится хотя бы на {PRICE_WATCH_MIN_DROP:.0%}"
+
+
+class PriceWatch:
+    """Price-drop subscriptions re-checked by one background loop
+
+    Subscriptions live in the shared state backend, keyed by subscriber
+    (the chat session id) and search. Identical searches of different
+    subscribers are checked with one upstream search, at most once per
+    `interval` and no more than `searches_per_hour` in total; fresh results
+    from the search cache are used without a search. Notifications wait in a
+    per-subscriber inbox until the web chat or a messenger adapter confirms
+    it has sent them. Only one worker should run() the watcher.
+    """
+
+    SUBSCRIPTIONS = 'price_watch'
+    CHECKS = 'price_watch_checks'
+    INBOX = 'price_watch_inbox'
+
+    def __init__(self, cache, search, store, describe, searches_per_hour=PRICE_WATCH_SEARCHES_PER_HOUR,
+                 interval=PRICE_WATCH_INTERVAL_SECONDS):
+        self.cache = cache
+        self.backend = cache.backend
+        # async callable params -> results, must not go through the cache
+        self.search = search
+        # callable (params, results) -> results as cached
+        self.store = store
+        # callable params -> description for messages
+        self.describe = describe
+        self.interval = interval
+        self.spacing = 3600 / max(1, searches_per_hour)
+        self._retry_after = {}  # spec key -> monotonic time of the next attempt after a failure
+        self._task = None
+        self.searches = 0
+        self.cache_hits = 0
+        self.failures = 0
+        self.notifications = 0
+        self.backlog = 0
+
+    @staticmethod
+    def watch_id(spec_key):
+        return hashlib.sha1(spec_key.encode('utf-8')).hexdigest()[:10]
+
+    def subscriptions(self, subscriber):
+        prefix = f"{subscriber}#"
+        return sorted(
+            (value for key, value in self.backend.items(self.SUBSCRIPTIONS) if key.startswith(prefix)),
+            key=lambda subscription: subscription['created_at']
+        )
+
+    def subscribe(self, subscriber, channel, params, target=None, user_id=None):
+        """Watch `params` for the subscriber; raises WatchLimitError over PRICE_WATCH_MAX_PER_USER
+
+        Subscribing to the same search again replaces the target price.
+        """
+        params = relative_params(params)
+        spec_key = self.cache.key(params)
+        watch_id = self.watch_id(spec_key)
+        current = self.subscriptions(subscriber)
+        if len(current) >= PRICE_WATCH_MAX_PER_USER and all(s['id'] != watch_id for s in current):
+            raise WatchLimitError(f"Можно следить не более чем за {PRICE_WATCH_MAX_PER_USER} поисками. {UNWATCH_HINT}")
+
+        # Начальная цена - последняя проверка этого поиска или свежие результаты из кэша
+        check = self.backend.get(self.CHECKS, spec_key)
+        baseline = check['min_price'] if check else min_price(self.cache.get(current_params(params), allow_stale=True))
+        subscription = {
+            'id': watch_id,
+            'subscriber': subscriber,
+            'channel': channel,
+            'user_id': user_id,
+            'spec_key': spec_key,
+            'params': params,
+            'target': target,
+            'baseline': baseline,
+            'notified_price': None,
+            'created_at': time.time(),
+            'expires_at': time.time() + PRICE_WATCH_TTL_DAYS * 86400,
+        }
+        self._save(subscription)
+        logger.info(f"Price watch {watch_id} for {subscriber}: {spec_key}, target {target}")
+        return subscription
+
+    def _save(self, subscription):
+        ttl = subscription['expires_at'] - time.time()
+        if ttl > 0:
+            self.backend.set(self.SUBSCRIPTIONS, f"{subscription['subscriber']}#{subscription['id']}", subscription, ttl=ttl)
+
+    def unsubscribe(self, subscriber, watch_id=None):
+        """Remove one or all subscriptions of the subscriber; returns how many were removed"""
+        removed = 0
+        for subscription in self.subscriptions(subscriber):
+            if watch_id is None or subscription['id'] == watch_id:
+                self.backend.delete(self.SUBSCRIPTIONS, f"{subscriber}#{subscription['id']}")
+                removed += 1
+        return removed
+
+    def specs(self):
+        """spec key -> subscriptions of that search"""
+        specs = {}
+        for _, subscription in self.backend.items(self.SUBSCRIPTIONS):
+            specs.setdefault(subscription['spec_key'], []).append(subscription)
+        return specs
+
+    def _expired(self, params):
+        """Fixed dates already in the past"""
+        return params.get('dateto') != RELATIVE_DATES and str(params.get('dateto') or '9999') < time.strftime('%Y-%m-%d')
+
+    def due(self):
+        """(spec key, subscriptions) not checked within the interval, the longest waiting first"""
+        due = []
+        now = time.monotonic()
+        for spec_key, subscriptions in self.specs().items():
+            if self._expired(subscriptions[0]['params']):
+                for subscription in subscriptions:
+                    self.backend.delete(self.SUBSCRIPTIONS, f"{subscription['subscriber']}#{subscription['id']}")
+                continue
+            if self._retry_after.get(spec_key, 0) > now:
+                continue
+            check = self.backend.get(self.CHECKS, spec_key)
+            checked_at = check['checked_at'] if check else 0
+            if time.time() - checked_at >= self.interval:
+                due.append((checked_at, -len(subscriptions), spec_key, subscriptions))
+        due.sort(key=lambda item: item[:2])
+        return [(spec_key, subscriptions) for _, _, spec_key, subscriptions in due]
+
+    async def check(self, spec_key, subscriptions):
+        """One search for all subscribers of the spec; returns True if TourVisor was searched"""
+        params = current_params(subscriptions[0]['params'])
+        results = self.cache.get(params)
+        searched = results is None
+        if searched:
+            try:
+                results = await self.search(params)
+            except Exception as e:
+                logger.error(f"Price watch search error: {e}")
+                results = None
+            if not results or "error" in results:
+                logger.warning(f"Price watch search failed for {spec_key}: {results}")
+                self.failures += 1
+                self._retry_after[spec_key] = time.monotonic() + PRICE_WATCH_RETRY_SECONDS
+                return True
+            results = self.store(params, results)
+            self.searches += 1
+        else:
+            self.cache_hits += 1
+        self._retry_after.pop(spec_key, None)
+
+        price = min_price(results)
+        self.backend.set(self.CHECKS, spec_key, {'checked_at': time.time(), 'min_price': price},
+                         ttl=PRICE_WATCH_TTL_DAYS * 86400)
+        logger.info(f"Price watch checked {spec_key} for {len(subscriptions)} subscribers: min price {price}")
+        if price is not None:
+            for subscription in subscriptions:
+                self._update(subscription, price)
+        return searched
+
+    def _update(self, subscription, price):
+        # Подписку могли отменить или заменить, пока шел поиск
+        key = f"{subscription['subscriber']}#{subscription['id']}"
+        subscription = self.backend.get(self.SUBSCRIPTIONS, key)
+        if subscription is None:
+            return
+        changed = subscription.get('baseline') is None
+        if changed:
+            subscription['baseline'] = price
+        if should_notify(subscription, price):
+            self.notify(subscription, price)
+            subscription['notified_price'] = price
+            changed = True
+        if changed:
+            self._save(subscription)
+
+    def notify(self, subscription, price):
+        previous = subscription.get('notified_price') or subscription['baseline']
+        message = f"🔔 Цены снизились!\n{self.describe(subscription['params'])}\n💰 От {_amount(price)}"
+        if previous > price:
+            message += f" (было {_amount(previous)})"
+        message += f"\n{UNWATCH_HINT}"
+        self.backend.set(self.INBOX, f"{subscription['subscriber']}#{uuid.uuid4().hex}", {
+            'watch_id': subscription['id'],
+            'channel': subscription['channel'],
+            'user_id': subscription.get('user_id'),
+            'message': message,
+            'min_price': price,
+            'created_at': time.time(),
+        }, ttl=NOTIFICATION_TTL_SECONDS)
+        self.notifications += 1
+        logger.info(f"Price drop for {subscription['subscriber']}: {subscription['spec_key']} {previous} -> {price}")
+
+    def _pending(self, matches):
+        pending = [
+            dict(notification, id=key) for key, notification in self.backend.items(self.INBOX)
+            if matches(key, notification)
+        ]
+        return sorted(pending, key=lambda notification: notification['created_at'])
+
+    def pending(self, subscriber):
+        """Unconfirmed notifications of the subscriber; they stay in the inbox until acknowledge()"""
+        prefix = f"{subscriber}#"
+        return self._pending(lambda key, notification: key.startswith(prefix))
+
+    def pending_for_channel(self, channel):
+        """Unconfirmed notifications of all users of a messenger channel"""
+        return self._pending(lambda key, notification: notification['channel'] == channel)
+
+    def acknowledge(self, ids, prefix):
+        """Remove delivered notifications; only ids starting with `prefix` (the caller's own)"""
+        removed = 0
+        for notification_id in ids:
+            if notification_id.startswith(prefix) and self.backend.get(self.INBOX, notification_id) is not None:
+                self.backend.delete(self.INBOX, notification_id)
+                removed += 1
+        return removed
+
+    async def run(self):
+        logger.info(
+            f"Price watch started (each search every {self.interval / 3600:g}h, one search every {self.spacing:.0f}s)"
+        )
+        while True:
+            due = self.due()
+            if not due:
+                self.backlog = 0
+                await asyncio.sleep(PRICE_WATCH_TICK_SECONDS)
+                continue
+            self.backlog = len(due)
+            try:
+                searched = await self.check(*due[0])
+            except Exception as e:
+                logger.error(f"Price watch error: {e}")
+                self._retry_after[due[0][0]] = time.monotonic() + PRICE_WATCH_RETRY_SECONDS
+                searched = True
+            # Результаты из кэша не расходуют бюджет поисков
+            if searched:
+                await asyncio.sleep(self.spacing)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    @property
+    def running(self):
+        return self._task is not None
+
+    def stats(self):
+        specs = self.specs()
+        return {
+            'running': self.running,
+            'subscriptions': sum(len(subscriptions) for subscriptions in specs.values()),
+            'searches_watched': len(specs),
+            'searches': self.searches,
+            'cache_hits': self.cache_hits,
+            'failures': self.failures,
+            'notifications': self.notifications,
+            # Больше, чем interval / spacing, - бюджета поисков не хватает на все подписки
+            'backlog': self.backlog,
+        }
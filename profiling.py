@@ -0,0 +1,173 @@
+import asyncio
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+
+from starlette.datastructures import Headers, MutableHeaders
+
+logger = logging.getLogger(__name__)
+
+# Профилирование выключено, пока не задана доля запросов или токен заголовка
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+# Запрос с заголовком X-Profile: <токен> профилируется всегда (в пределах лимита)
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")
+PROFILE_HEADER = "x-profile"
+PROFILE_DIR = os.getenv(
+    "PROFILE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "profiles")
+)
+# Не больше стольких профилей в минуту на процесс
+PROFILE_MAX_PER_MINUTE = int(os.getenv("PROFILE_MAX_PER_MINUTE", "2"))
+# Период выборки стеков
+PROFILE_INTERVAL_SECONDS = 0.005
+PROFILED_PATHS = ('/chat', '/search')
+
+
+class StackSampler:
+    """Samples thread stacks from a background thread
+
+    Only the threads in `thread_ids` are sampled, all threads when None.
+    Counts are collapsed stacks ("thread;module:function;..."), the input
+    format of flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, interval=PROFILE_INTERVAL_SECONDS, thread_ids=None):
+        self.interval = interval
+        self.thread_ids = None if thread_ids is None else set(thread_ids)
+        self.counts = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own or (self.thread_ids is not None and thread_id not in self.thread_ids):
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name}")
+                frame = frame.f_back
+            stack.append(names.get(thread_id, str(thread_id)))
+            self.counts[';'.join(reversed(stack))] += 1
+        self.samples += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.counts
+
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.counts.most_common())
+
+
+class RequestProfiler:
+    """Decides which requests are profiled and writes their profiles
+
+    A request is profiled when it carries X-Profile with PROFILE_TOKEN or
+    falls into PROFILE_SAMPLE_RATE, and only if the per-minute limit allows;
+    one request is profiled at a time per process.
+    """
+
+    def __init__(self, paths=PROFILED_PATHS, sample_rate=PROFILE_SAMPLE_RATE, token=PROFILE_TOKEN,
+                 max_per_minute=PROFILE_MAX_PER_MINUTE, directory=PROFILE_DIR):
+        self.paths = paths
+        self.sample_rate = sample_rate
+        self.token = token
+        self.max_per_minute = max_per_minute
+        self.directory = directory
+        self._started = deque()
+        self._busy = False
+        self.written = 0
+        self.rate_limited = 0
+
+    def wanted(self, scope):
+        if scope['type'] != 'http' or scope['path'] not in self.paths:
+            return False
+        if self.token and Headers(scope=scope).get(PROFILE_HEADER) == self.token:
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def acquire(self):
+        now = time.monotonic()
+        while self._started and now - self._started[0] > 60:
+            self._started.popleft()
+        if self._busy or len(self._started) >= self.max_per_minute:
+            self.rate_limited += 1
+            return False
+        self._busy = True
+        self._started.append(now)
+        return True
+
+    def release(self):
+        self._busy = False
+
+    def write(self, name, sampler):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as f:
+            f.write(sampler.collapsed())
+        self.written += 1
+        return path
+
+    def stats(self):
+        return {
+            'enabled': bool(self.sample_rate > 0 or self.token),
+            'written': self.written,
+            'rate_limited': self.rate_limited,
+        }
+
+
+class ProfilingMiddleware:
+    """Wraps profiled requests in a StackSampler; the file name goes to X-Profile-Id
+
+    Only the event loop thread serving the request is sampled: warm-up, price
+    watch and hedging threads stay out of the profile, and so do the request's
+    own TourVisor calls in executor threads.
+    """
+
+    def __init__(self, app, profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if not self.profiler.wanted(scope) or not self.profiler.acquire():
+            await self.app(scope, receive, send)
+            return
+
+        path = scope['path']
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{path.strip('/').replace('/', '_')}-{uuid.uuid4().hex[:6]}.folded"
+
+        async def send_with_id(message):
+            if message['type'] == 'http.response.start':
+                MutableHeaders(scope=message)['X-Profile-Id'] = name
+            await send(message)
+
+        sampler = StackSampler(thread_ids={threading.get_ident()})
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            sampler.stop()
+            self.profiler.release()
+            elapsed = time.perf_counter() - started
+            try:
+                written = await asyncio.get_running_loop().run_in_executor(None, self.profiler.write, name, sampler)
+                logger.info(f"Profile of {path} ({elapsed * 1000:.0f} ms, {sampler.samples} samples) written to {written}")
+            except OSError as e:
+                logger.error(f"Failed to write profile {name}: {e}")
@@ -0,0 +1,354 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import xml.etree.ElementTree as ET
+
+logger = logging.getLogger(__name__)
+
+# Снимок справочников TourVisor на диске
+REFERENCE_SNAPSHOT_PATH = os.getenv(
+    "REFERENCE_SNAPSHOT_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "reference.json")
+)
+# Как часто перечитывать справочники из TourVisor
+REFERENCE_TTL_SECONDS = int(os.getenv("REFERENCE_TTL", str(24 * 3600)))
+REFERENCE_CHECK_SECONDS = 3600
+
+# Какие справочники запрашивать у list.php
+LIST_TYPES = ('departure', 'country', 'region', 'meal', 'operator')
+
+# Встроенные значения на случай, если снимка нет и TourVisor недоступен
+DEFAULT_DEPARTURES = {
+    "1": "Москва",
+    "2": "Санкт-Петербург",
+    "3": "Казань"
+}
+DEFAULT_COUNTRIES = {
+    "46": "Абхазия",
+    "31": "Австрия",
+    "55": "Азербайджан",
+    "71": "Албания",
+    "17": "Андорра",
+    "88": "Аргентина",
+    "53": "Армения",
+    "72": "Аруба",
+    "59": "Бахрейн",
+    "57": "Беларусь",
+    "20": "Болгария",
+    "39": "Бразилия",
+    "44": "Великобритания",
+    "37": "Венгрия",
+    "90": "Венесуэла",
+    "16": "Вьетнам",
+    "38": "Германия",
+    "6": "Греция",
+    "54": "Грузия",
+    "11": "Доминикана",
+    "1": "Египет",
+    "30": "Израиль",
+    "3": "Индия",
+    "7": "Индонезия",
+    "29": "Иордания",
+    "92": "Иран",
+    "14": "Испания",
+    "24": "Италия",
+    "78": "Казахстан",
+    "40": "Камбоджа",
+    "79": "Катар",
+    "51": "Кения",
+    "15": "Кипр",
+    "60": "Киргизия",
+    "13": "Китай",
+    "10": "Куба",
+    "80": "Ливан",
+    "27": "Маврикий",
+    "36": "Малайзия",
+    "8": "Мальдивы",
+    "50": "Мальта",
+    "23": "Марокко",
+    "18": "Мексика",
+    "81": "Мьянма",
+    "82": "Непал",
+    "9": "ОАЭ",
+    "64": "Оман",
+    "87": "Панама",
+    "35": "Португалия",
+    "47": "Россия",
+    "93": "Саудовская Аравия",
+    "28": "Сейшелы",
+    "58": "Сербия",
+    "25": "Сингапур",
+    "43": "Словения",
+    "2": "Таиланд",
+    "41": "Танзания",
+    "5": "Тунис",
+    "4": "Турция",
+    "56": "Узбекистан",
+    "26": "Филиппины",
+    "34": "Финляндия",
+    "32": "Франция",
+    "22": "Хорватия",
+    "21": "Черногория",
+    "19": "Чехия",
+    "52": "Швейцария",
+    "12": "Шри-Ланка",
+    "69": "Эстония",
+    "70": "Южная Корея",
+    "33": "Ямайка",
+    "49": "Япония"
+}
+# Справочник питания TourVisor: id -> код и русское название
+DEFAULT_MEALS = {
+    "2": {"name": "RO", "russian": "Без питания"},
+    "3": {"name": "BB", "russian": "Завтрак"},
+    "4": {"name": "HB", "russian": "Завтрак и ужин"},
+    "5": {"name": "HB+", "russian": "Завтрак, ужин и напитки"},
+    "6": {"name": "FB", "russian": "Полный пансион"},
+    "7": {"name": "FB+", "russian": "Полный пансион и напитки"},
+    "8": {"name": "AI", "russian": "Всё включено"},
+    "9": {"name": "UAI", "russian": "Ультра всё включено"}
+}
+
+
+def _items(root, group, item):
+    """Collect <group><item>...</item></group> blocks as flat dicts"""
+    block = root.find(f'.//{group}')
+    if block is None:
+        return None
+    return [{child.tag: child.text for child in elem} for elem in block.findall(item)]
+
+
+def parse_lists(xml_text):
+    """Parse a list.php response into plain dicts keyed by id"""
+    root = ET.fromstring(xml_text)
+    lists = {}
+
+    departures = _items(root, 'departures', 'departure')
+    if departures is not None:
+        lists['departures'] = {d['id']: d.get('name') for d in departures if d.get('id')}
+
+    countries = _items(root, 'countries', 'country')
+    if countries is not None:
+        lists['countries'] = {c['id']: c.get('name') for c in countries if c.get('id')}
+
+    regions = _items(root, 'regions', 'region')
+    if regions is not None:
+        lists['regions'] = {
+            r['id']: {'name': r.get('name'), 'country': r.get('country')}
+            for r in regions if r.get('id')
+        }
+
+    meals = _items(root, 'meals', 'meal')
+    if meals is not None:
+        lists['meals'] = {
+            m['id']: {'name': m.get('name'), 'russian': m.get('russian') or m.get('fullname')}
+            for m in meals if m.get('id')
+        }
+
+    operators = _items(root, 'operators', 'operator')
+    if operators is not None:
+        lists['operators'] = {
+            o['id']: o.get('russian') or o.get('name')
+            for o in operators if o.get('id')
+        }
+
+    return lists
+
+
+class ReferenceData:
+    """Immutable snapshot of TourVisor dictionaries with lookup indexes"""
+
+    def __init__(self, departures=None, countries=None, regions=None, meals=None,
+                 operators=None, fetched_at=0.0, content_hash=None):
+        self.departures = departures or dict(DEFAULT_DEPARTURES)
+        self.countries = countries or dict(DEFAULT_COUNTRIES)
+        self.regions = regions or {}
+        self.meals = meals or dict(DEFAULT_MEALS)
+        self.operators = operators or {}
+        self.fetched_at = fetched_at
+        # sha1 ответа list.php: по нему видно, что справочники не изменились
+        self.content_hash = content_hash
+
+        # Индексы для поиска по названию и по стране
+        self.departure_by_name = {name.lower(): id for id, name in self.departures.items() if name}
+        self.country_by_name = {name.lower(): id for id, name in self.countries.items() if name}
+        self.regions_by_country = {}
+        for region_id, region in self.regions.items():
+            self.regions_by_country.setdefault(region.get('country'), {})[region_id] = region.get('name')
+        self.meal_by_name = {
+            (meal.get('name') or '').lower(): meal_id for meal_id, meal in self.meals.items()
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            departures=data.get('departures'),
+            countries=data.get('countries'),
+            regions=data.get('regions'),
+            meals=data.get('meals'),
+            operators=data.get('operators'),
+            fetched_at=data.get('fetched_at', 0.0),
+            content_hash=data.get('content_hash'),
+        )
+
+    def to_dict(self):
+        return {
+            'departures': self.departures,
+            'countries': self.countries,
+            'regions': self.regions,
+            'meals': self.meals,
+            'operators': self.operators,
+            'fetched_at': self.fetched_at,
+            'content_hash': self.content_hash,
+        }
+
+    def renewed(self, fetched_at):
+        """Same dictionaries with a new fetch time; the snapshot itself stays unchanged"""
+        return ReferenceData(self.departures, self.countries, self.regions, self.meals, self.operators,
+                             fetched_at=fetched_at, content_hash=self.content_hash)
+
+    def is_stale(self, ttl=REFERENCE_TTL_SECONDS):
+        return time.time() - self.fetched_at > ttl
+
+    def departure_id(self, value):
+        """Departure id by id or by name, None if unknown"""
+        value = str(value).strip()
+        if value in self.departures:
+            return value
+        return self.departure_by_name.get(value.lower())
+
+    def country_id(self, value):
+        """Country id by id or by exact name, None if unknown"""
+        value = str(value).strip()
+        if value in self.countries:
+            return value
+        return self.country_by_name.get(value.lower())
+
+    def meal_russian(self, meal):
+        """Russian meal name by id or code (AI, BB...), None if unknown"""
+        entry = self.meals.get(str(meal)) or self.meals.get(self.meal_by_name.get(str(meal).lower()))
+        if not entry:
+            return None
+        return entry.get('russian') or entry.get('name')
+
+    def meal_name(self, meal):
+        """Russian meal name by id or code, falls back to the input"""
+        return self.meal_russian(meal) or meal
+
+    def describe_hotels(self, results):
+        """Fill missing country, region and meal names in search results in place"""
+        for hotel in (results or {}).get('result', {}).get('hotels', []):
+            if not hotel.get('countryname') and hotel.get('countrycode'):
+                hotel['countryname'] = self.countries.get(hotel['countrycode'])
+            if not hotel.get('regionname') and hotel.get('regioncode'):
+                hotel['regionname'] = (self.regions.get(hotel['regioncode']) or {}).get('name')
+            for tour in hotel.get('tours') or []:
+                if tour.get('meal') and not tour.get('mealrussian'):
+                    # Неизвестный код не выдаем за русское название
+                    russian = self.meal_russian(tour['meal'])
+                    if russian:
+                        tour['mealrussian'] = russian
+        return results
+
+
+class ReferenceStore:
+    """Loads the on-disk snapshot and refreshes it from TourVisor when stale"""
+
+    def __init__(self, path=REFERENCE_SNAPSHOT_PATH, ttl=REFERENCE_TTL_SECONDS):
+        self.path = path
+        self.ttl = ttl
+        self._current = None
+        self._loaded_mtime = None
+        self._lock = threading.Lock()
+
+    @property
+    def current(self):
+        if self._current is None:
+            with self._lock:
+                if self._current is None:
+                    self._current = self._load()
+        return self._current
+
+    def _mtime(self):
+        try:
+            return os.path.getmtime(self.path)
+        except OSError:
+            return None
+
+    def _load(self):
+        self._loaded_mtime = self._mtime()
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                reference = ReferenceData.from_dict(json.load(f))
+            logger.info(f"Loaded reference data snapshot from {self.path}")
+            return reference
+        except FileNotFoundError:
+            logger.info("No reference data snapshot yet, using built-in tables")
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to load reference data snapshot: {e}")
+        return ReferenceData()
+
+    def _save(self, reference):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(reference.to_dict(), f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        self._loaded_mtime = self._mtime()
+
+    def reload_if_changed(self):
+        """Pick up a snapshot written by another worker"""
+        mtime = self._mtime()
+        if mtime is None or mtime == self._loaded_mtime:
+            return False
+        with self._lock:
+            self._current = self._load()
+        return True
+
+    def refresh(self, fetch):
+        """Fetch list.php through `fetch(types)` and swap in a new snapshot if it changed"""
+        xml_text = fetch(LIST_TYPES)
+        if not xml_text:
+            logger.warning("Reference data refresh failed, keeping the current snapshot")
+            return False
+
+        content_hash = hashlib.sha1(xml_text.encode('utf-8')).hexdigest()
+        current = self.current
+        if content_hash == current.content_hash:
+            # Содержимое не изменилось - новый снимок с продленным сроком жизни, без разбора XML
+            reference = current.renewed(time.time())
+            self._save(reference)
+            self._current = reference
+            logger.info("Reference data unchanged")
+            return False
+
+        try:
+            lists = parse_lists(xml_text)
+        except ET.ParseError as e:
+            logger.error(f"Failed to parse reference lists: {e}")
+            return False
+
+        reference = ReferenceData(fetched_at=time.time(), content_hash=content_hash, **lists)
+        self._save(reference)
+        self._current = reference
+        logger.info(
+            f"Reference data refreshed: {len(reference.departures)} departures, "
+            f"{len(reference.countries)} countries, {len(reference.regions)} regions"
+        )
+        return True
+
+    def refresh_if_stale(self, fetch):
+        if self.current.is_stale(self.ttl):
+            return self.refresh(fetch)
+        return False
+
+
+reference_store = ReferenceStore()
+
+
+def get_reference():
+    """Process-wide reference data"""
+    return reference_store.current
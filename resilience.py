@@ -0,0 +1,173 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+logger = logging.getLogger(__name__)
+
+# Автомат размыкается после стольких ошибок или медленных вызовов подряд
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("TOURVISOR_BREAKER_FAILURES", "5"))
+BREAKER_SLOW_CALL_SECONDS = float(os.getenv("TOURVISOR_BREAKER_SLOW_CALL", "10"))
+BREAKER_OPEN_SECONDS = float(os.getenv("TOURVISOR_BREAKER_OPEN", "30"))
+
+# Хеджирование идемпотентных чтений result.php
+HEDGE_ENABLED = os.getenv("TOURVISOR_HEDGE", "1") == "1"
+HEDGE_MIN_SAMPLES = 20
+HEDGE_DEFAULT_DELAY_SECONDS = 3.0
+HEDGE_MIN_DELAY_SECONDS = 0.2
+LATENCY_WINDOW = 200
+# Потоки для копий запросов: каждое чтение в слоте ограничителя плюс его хедж
+HEDGE_MAX_WORKERS = int(os.getenv("TOURVISOR_HEDGE_WORKERS", "16"))
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """Fails fast while TourVisor is failing or answering too slowly
+
+    closed -> open after `failure_threshold` consecutive failures or slow calls;
+    open -> half_open after `open_seconds`, letting one trial call through;
+    half_open -> closed on success, back to open on failure.
+    """
+
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, slow_call_seconds=BREAKER_SLOW_CALL_SECONDS,
+                 open_seconds=BREAKER_OPEN_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+        self.rejected = 0
+        self.opened = 0
+
+    @property
+    def is_open(self):
+        with self._lock:
+            return self.state == OPEN and time.monotonic() - self._opened_at < self.open_seconds
+
+    def before_call(self):
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self._opened_at < self.open_seconds:
+                    self.rejected += 1
+                    raise CircuitOpenError("TourVisor circuit is open")
+                self.state = HALF_OPEN
+                self._trial_in_flight = False
+            if self.state == HALF_OPEN:
+                if self._trial_in_flight:
+                    self.rejected += 1
+                    raise CircuitOpenError("TourVisor circuit is half-open, trial call in flight")
+                self._trial_in_flight = True
+
+    def cancel(self):
+        """The admitted call never reached TourVisor"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record(self, duration, ok):
+        with self._lock:
+            if ok and duration < self.slow_call_seconds:
+                if self.state != CLOSED:
+                    logger.info("TourVisor circuit closed")
+                self.state = CLOSED
+                self._failures = 0
+                self._trial_in_flight = False
+                return
+
+            self._failures += 1
+            if self.state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    logger.warning(f"TourVisor circuit opened after {self._failures} failed or slow calls")
+                    self.opened += 1
+                self.state = OPEN
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+    def stats(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self._failures,
+                'opened': self.opened,
+                'rejected': self.rejected,
+            }
+
+
+class LatencyTracker:
+    """Sliding window of call durations for p95 estimates"""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, duration):
+        with self._lock:
+            self._samples.append(duration)
+
+    def percentile(self, pct):
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(len(samples) * pct / 100))
+        return samples[index]
+
+    def hedge_delay(self):
+        with self._lock:
+            enough = len(self._samples) >= HEDGE_MIN_SAMPLES
+        if not enough:
+            return HEDGE_DEFAULT_DELAY_SECONDS
+        return max(HEDGE_MIN_DELAY_SECONDS, self.percentile(95))
+
+
+class Hedger:
+    """Sends a second copy of an idempotent call if the first exceeds p95"""
+
+    def __init__(self, tracker=None, max_workers=HEDGE_MAX_WORKERS):
+        self.tracker = tracker or LatencyTracker()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hedge")
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def call(self, fn):
+        primary = self._executor.submit(fn)
+        done, _ = wait([primary], timeout=self.tracker.hedge_delay())
+        if done:
+            return primary.result()
+
+        self.hedged += 1
+        logger.info("result.php is slower than p95, sending a hedged request")
+        backup = self._executor.submit(fn)
+        pending = {primary, backup}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                if future is backup:
+                    self.hedge_wins += 1
+                return result
+        raise error
+
+    def stats(self):
+        return {
+            'p95': self.tracker.percentile(95),
+            'p99': self.tracker.percentile(99),
+            'hedged': self.hedged,
+            'hedge_wins': self.hedge_wins,
+        }
@@ -0,0 +1,305 @@
+import json
+import os
+import zlib
+from functools import lru_cache
+from typing import Annotated, Any, Dict, List, Optional
+
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, BeforeValidator, ConfigDict
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import orjson
+except ImportError:  # необязательная зависимость, без нее работает стандартный json
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # без brotli ответы сжимаются только gzip
+    brotli = None
+
+# Сжимать ответы больше этого размера (байт)
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1000"))
+# Картинки уже сжаты - повторное сжатие только тратит CPU
+UNCOMPRESSED_PREFIXES = ('/thumbnails',)
+# Быстрые уровни brotli и gzip для динамических ответов
+BROTLI_QUALITY = 4
+GZIP_LEVEL = 6
+
+# Поля отеля, которые нужны карточкам в веб-интерфейсе
+UI_FIELDS = "hotelcode,hotelname,hotelstars,hotelrating,countryname,regionname,price,picturelink"
+
+
+def _number(cast):
+    """Lenient conversion of TourVisor strings: '' and garbage become None"""
+    def convert(value):
+        if value is None or isinstance(value, (int, float)) and not isinstance(value, bool):
+            return value
+        try:
+            return cast(float(str(value).replace(',', '.')))
+        except ValueError:
+            return None
+    return BeforeValidator(convert)
+
+
+Int = Annotated[Optional[int], _number(int)]
+Float = Annotated[Optional[float], _number(float)]
+
+
+class Tour(BaseModel):
+    model_config = ConfigDict(extra='allow')
+
+    tourid: Optional[str] = None
+    operatorcode: Optional[str] = None
+    operatorname: Optional[str] = None
+    flydate: Optional[str] = None
+    nights: Int = None
+    placement: Optional[str] = None
+    adults: Int = None
+    child: Int = None
+    meal: Optional[str] = None
+    mealrussian: Optional[str] = None
+    room: Optional[str] = None
+    price: Int = None
+    fuelcharge: Int = None
+
+
+class Hotel(BaseModel):
+    model_config = ConfigDict(extra='allow')
+
+    hotelcode: Optional[str] = None
+    hotelname: Optional[str] = None
+    hotelstars: Int = None
+    hotelrating: Float = None
+    countrycode: Optional[str] = None
+    countryname: Optional[str] = None
+    regioncode: Optional[str] = None
+    regionname: Optional[str] = None
+    price: Int = None
+    picturelink: Optional[str] = None
+    hoteldescription: Optional[str] = None
+    fulldesclink: Optional[str] = None
+    seadistance: Int = None
+    catalog_version: Optional[str] = None
+    tours: Optional[List[Tour]] = None
+
+
+class HotelList(BaseModel):
+    hotels: List[Hotel] = []
+
+
+class SearchStatus(BaseModel):
+    model_config = ConfigDict(extra='allow')
+
+    state: Optional[str] = None
+    hotelsfound: Int = None
+    toursfound: Int = None
+    minprice: Int = None
+    progress: Int = None
+    timepassed: Int = None
+
+
+class SearchResults(BaseModel):
+    model_config = ConfigDict(extra='allow')
+
+    status: Optional[SearchStatus] = None
+    result: Optional[HotelList] = None
+    requestid: Optional[str] = None
+    stale: Optional[bool] = None
+    searches: Optional[List[Dict[str, Any]]] = None
+
+
+class JobResponse(BaseModel):
+    job_id: str
+    status: str
+    requestid: Optional[str] = None
+    progress: Optional[SearchStatus] = None
+    error: Optional[str] = None
+    result: Optional[SearchResults] = None
+
+
+class ChatResponse(BaseModel):
+    message: str
+    type: str
+    job_id: Optional[str] = None
+    data: Optional[SearchResults] = None
+
+
+class ChatEvent(BaseModel):
+    """Server message of the WebSocket chat"""
+    type: str
+    message: Optional[str] = None
+    job_id: Optional[str] = None
+    progress: Optional[SearchStatus] = None
+    # Итоги поиска приходят с первой пачкой отелей
+    status: Optional[SearchStatus] = None
+    hotels: Optional[List[Hotel]] = None
+    stale: Optional[bool] = None
+    final: Optional[bool] = None
+
+
+@lru_cache(maxsize=128)
+def parse_fields(fields):
+    """'hotelname,price,tours.price' -> {'hotelname': True, 'price': True, 'tours': {'price': True}}"""
+    spec = {}
+    for path in fields.split(','):
+        parts = [part for part in path.strip().split('.') if part]
+        node = spec
+        for part in parts[:-1]:
+            child = node.get(part)
+            if child is True:
+                break
+            node = node.setdefault(part, {})
+        else:
+            if parts:
+                node[parts[-1]] = True
+    return spec
+
+
+def _project(item, spec):
+    projected = {}
+    for key, sub in spec.items():
+        if key not in item:
+            continue
+        value = item[key]
+        if sub is True:
+            projected[key] = value
+        elif isinstance(value, list):
+            projected[key] = [_project(v, sub) for v in value if isinstance(v, dict)]
+        elif isinstance(value, dict):
+            projected[key] = _project(value, sub)
+    return projected
+
+
+def project_results(results, fields=None):
+    """Keep only the requested hotel fields; None or 'all' keeps everything"""
+    if not results or not fields or fields == 'all':
+        return results
+    hotels = (results.get('result') or {}).get('hotels')
+    if hotels is None:
+        return results
+    spec = parse_fields(fields)
+    return dict(results, result={'hotels': [_project(hotel, spec) for hotel in hotels]})
+
+
+class CompactJSONResponse(JSONResponse):
+    """Compact JSON via pydantic's serializer for models and orjson (if installed) for the rest"""
+
+    def render(self, content):
+        if isinstance(content, BaseModel):
+            return content.model_dump_json(exclude_none=True).encode('utf-8')
+        if orjson is not None:
+            return orjson.dumps(content)
+        return json.dumps(content, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def dumps_line(content):
+    """One NDJSON line for streamed responses"""
+    if isinstance(content, BaseModel):
+        return content.model_dump_json(exclude_none=True) + "\n"
+    return CompactJSONResponse(content).body.decode('utf-8') + "\n"
+
+
+class _GzipCompressor:
+    """zlib in gzip format with the process/flush/finish interface of brotli.Compressor"""
+
+    def __init__(self, level=GZIP_LEVEL):
+        self._zlib = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def process(self, data):
+        return self._zlib.compress(data)
+
+    def flush(self):
+        # Z_SYNC_FLUSH: все полученное до сих пор можно распаковать на клиенте
+        return self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._zlib.flush()
+
+
+class _CompressingResponder:
+    def __init__(self, app, minimum_size, encoding, make_compressor):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.encoding = encoding
+        self.make_compressor = make_compressor
+        self.start_message = None
+        self.compressor = None
+        self.started = False
+
+    async def __call__(self, scope, receive, send):
+        self.send = send
+        await self.app(scope, receive, self.send_compressed)
+
+    async def send_compressed(self, message):
+        if message['type'] == 'http.response.start':
+            # Заголовки отправляем, когда увидим первый кусок тела
+            self.start_message = message
+            return
+        if message['type'] != 'http.response.body':
+            await self.send(message)
+            return
+
+        body = message.get('body', b'')
+        more_body = message.get('more_body', False)
+        if not self.started:
+            self.started = True
+            headers = MutableHeaders(raw=self.start_message['headers'])
+            if 'content-encoding' in headers or (not more_body and len(body) < self.minimum_size):
+                await self.send(self.start_message)
+                await self.send(message)
+                return
+            self.compressor = self.make_compressor()
+            headers['Content-Encoding'] = self.encoding
+            headers.add_vary_header('Accept-Encoding')
+            if more_body:
+                # Потоковый ответ: сбрасываем каждый кусок сразу, чтобы клиент не ждал
+                del headers['Content-Length']
+                body = self.compressor.process(body) + self.compressor.flush()
+            else:
+                body = self.compressor.process(body) + self.compressor.finish()
+                headers['Content-Length'] = str(len(body))
+            await self.send(self.start_message)
+            await self.send({'type': 'http.response.body', 'body': body, 'more_body': more_body})
+            return
+
+        if self.compressor is None:
+            await self.send(message)
+            return
+        body = self.compressor.process(body)
+        body += self.compressor.flush() if more_body else self.compressor.finish()
+        await self.send({'type': 'http.response.body', 'body': body, 'more_body': more_body})
+
+
+class CompressionMiddleware:
+    """brotli when the client accepts it and the package is installed, gzip otherwise
+
+    Streamed responses (NDJSON search snapshots) are flushed chunk by chunk
+    in both encodings, so compression does not hold snapshots back.
+    """
+
+    def __init__(self, app, minimum_size=COMPRESS_MIN_SIZE, brotli_quality=BROTLI_QUALITY,
+                 gzip_level=GZIP_LEVEL, skip_prefixes=UNCOMPRESSED_PREFIXES):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.brotli_quality = brotli_quality
+        self.gzip_level = gzip_level
+        self.skip_prefixes = skip_prefixes
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'].startswith(self.skip_prefixes):
+            await self.app(scope, receive, send)
+            return
+        accept_encoding = Headers(scope=scope).get('accept-encoding', '')
+        if brotli is not None and 'br' in accept_encoding:
+            responder = _CompressingResponder(
+                self.app, self.minimum_size, 'br', lambda: brotli.Compressor(quality=self.brotli_quality)
+            )
+        elif 'gzip' in accept_encoding:
+            responder = _CompressingResponder(
+                self.app, self.minimum_size, 'gzip', lambda: _GzipCompressor(self.gzip_level)
+            )
+        else:
+            await self.app(scope, receive, send)
+            return
+        await responder(scope, receive, send)
@@ -0,0 +1,240 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+
+from state_backend import MemoryBackend
+from search_filters import FILTER_FIELDS
+
+logger = logging.getLogger(__name__)
+
+# Сколько живут результаты поиска в кэше
+CACHE_TTL_SECONDS = int(os.getenv("SEARCH_CACHE_TTL", "900"))
+# Сколько еще хранить устаревшие результаты на случай недоступности TourVisor
+STALE_TTL_SECONDS = int(os.getenv("SEARCH_CACHE_STALE_TTL", "86400"))
+# Неполные результаты (опрос остановлен до state=finished) живут недолго
+PARTIAL_TTL_SECONDS = int(os.getenv("SEARCH_CACHE_PARTIAL_TTL", "120"))
+
+# Настройки прогрева кэша
+WARMER_ENABLED = os.getenv("CACHE_WARMER_ENABLED", "1") == "1"
+WARMER_TOP_K = int(os.getenv("CACHE_WARMER_TOP_K", "20"))
+# Сколько поисков в час прогрев может отправить в TourVisor
+WARMER_SEARCHES_PER_HOUR = int(os.getenv("CACHE_WARMER_SEARCHES_PER_HOUR", "60"))
+# Обновлять записи, которым осталось жить меньше этой доли TTL
+WARMER_REFRESH_AHEAD = 0.2
+WARMER_TICK_SECONDS = 30
+# Раз в час частоты запросов делятся пополам, чтобы старая популярность угасала
+WARMER_DECAY_SECONDS = 3600
+
+# Параметры, которые определяют результат поиска
+KEY_FIELDS = ('departure', 'country', 'datefrom', 'dateto', 'nightsfrom', 'nightsto', 'adults', 'child')
+# Метка для дат чатбота (завтра + 30 дней), которые сдвигаются каждый день
+RELATIVE_DATES = 'relative'
+
+
+def chatbot_dates():
+    """Dates the chatbot always searches with: tomorrow .. tomorrow + 30 days"""
+    start_date = datetime.now() + timedelta(days=1)
+    end_date = start_date + timedelta(days=30)
+    return start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')
+
+
+def relative_params(params):
+    """Params to remember: chatbot dates replaced with RELATIVE_DATES"""
+    params = dict(params)
+    if (params.get('datefrom'), params.get('dateto')) == chatbot_dates():
+        params['datefrom'] = params['dateto'] = RELATIVE_DATES
+    return params
+
+
+def current_params(params):
+    """Remembered params to search with: RELATIVE_DATES moved to today's chatbot dates"""
+    params = dict(params)
+    if params.get('datefrom') == RELATIVE_DATES:
+        params['datefrom'], params['dateto'] = chatbot_dates()
+    return params
+
+
+class SearchCache:
+    """TTL cache of search results keyed by normalized search params
+
+    Entries live in the shared state backend, so every worker sees them.
+    Expired entries are kept for STALE_TTL_SECONDS more as a degraded fallback.
+    Partial results (marked 'partial') expire after PARTIAL_TTL_SECONDS.
+    """
+
+    NAMESPACE = 'search_cache'
+
+    def __init__(self, backend=None, ttl=CACHE_TTL_SECONDS, stale_ttl=STALE_TTL_SECONDS,
+                 partial_ttl=PARTIAL_TTL_SECONDS):
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.partial_ttl = partial_ttl
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(params):
+        key = "|".join(str(params.get(field, '')) for field in KEY_FIELDS)
+        # Фильтры добавляются только если заданы - ключи поисков без фильтров не меняются
+        filters = [f"{field}={params[field]}" for field in FILTER_FIELDS if params.get(field) not in (None, '')]
+        return "|".join([key] + filters) if filters else key
+
+    def get(self, params, allow_stale=False):
+        """Cached results; with allow_stale expired entries are returned too"""
+        entry = self.backend.get(self.NAMESPACE, self.key(params))
+        if entry is None or (entry['expires_at'] <= time.time() and not allow_stale):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry['results']
+
+    def set(self, params, results):
+        partial = bool(results.get('partial'))
+        ttl = self.partial_ttl if partial else self.ttl
+        entry = {'expires_at': time.time() + ttl, 'ttl': ttl, 'partial': partial, 'results': results}
+        self.backend.set(self.NAMESPACE, self.key(params), entry, ttl=ttl + self.stale_ttl)
+
+    def expires_in(self, params):
+        """Seconds until the entry expires, 0 if missing"""
+        return self.lifetime(params)[0]
+
+    def lifetime(self, params):
+        """(seconds until expiry, TTL the entry was stored with, partial); (0, ttl, False) if missing"""
+        entry = self.backend.get(self.NAMESPACE, self.key(params))
+        if entry is None:
+            return 0, self.ttl, False
+        return (max(0.0, entry['expires_at'] - time.time()), entry.get('ttl', self.ttl),
+                entry.get('partial', False))
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+class CacheWarmer:
+    """Re-runs the most popular searches before their cached results expire
+
+    Query counts are kept in the cache's state backend, so searches seen by
+    any worker count; only one worker should run() the warmer.
+    """
+
+    COUNTS = 'search_popularity'
+    PARAMS = 'search_popularity_params'
+
+    def __init__(self, cache, search, top_k=WARMER_TOP_K, searches_per_hour=WARMER_SEARCHES_PER_HOUR, store=None):
+        self.cache = cache
+        self.backend = cache.backend
+        # async callable params -> results, must not go through the cache
+        self.search = search
+        # callable (params, results) that puts fresh results into the cache
+        self.store = store or cache.set
+        self.top_k = top_k
+        self.spacing = 3600 / max(1, searches_per_hour)
+        self._last_decay = time.monotonic()
+        self._retry_after = {}  # key -> monotonic time of the next attempt after a failure
+        self._task = None
+        self.warmed = 0
+
+    def record(self, params):
+        """Count a user search so popular combinations get pre-warmed"""
+        params = relative_params(params)
+        key = self.cache.key(params)
+        if self.backend.incr(self.COUNTS, key) == 1:
+            self.backend.set(self.PARAMS, key, params)
+
+    def _decay(self):
+        if time.monotonic() - self._last_decay < WARMER_DECAY_SECONDS:
+            return
+        self._last_decay = time.monotonic()
+        for key, count in self.backend.items(self.COUNTS):
+            if count // 2:
+                self.backend.set(self.COUNTS, key, count // 2)
+            else:
+                self.backend.delete(self.COUNTS, key)
+                self.backend.delete(self.PARAMS, key)
+                self._retry_after.pop(key, None)
+
+    def top(self):
+        """The top-K most popular search keys with their counts"""
+        counts = sorted(self.backend.items(self.COUNTS), key=lambda item: item[1], reverse=True)
+        return counts[:self.top_k]
+
+    def _current_params(self, key):
+        """Chatbot searches move with the calendar, so refresh their dates"""
+        params = self.backend.get(self.PARAMS, key)
+        return current_params(params) if params is not None else None
+
+    def due(self):
+        """Top-K popular searches that are missing or about to expire
+
+        Refresh-ahead is a share of each entry's own TTL. Keys cached with
+        partial results go after the others, so one of them can't hold the warmer.
+        """
+        due = []
+        partial = []
+        now = time.monotonic()
+        for key, _ in self.top():
+            if self._retry_after.get(key, 0) > now:
+                continue
+            params = self._current_params(key)
+            if params is None:
+                continue
+            expires_in, ttl, is_partial = self.cache.lifetime(params)
+            if expires_in <= ttl * WARMER_REFRESH_AHEAD:
+                (partial if is_partial else due).append((key, params))
+        return due + partial
+
+    async def run(self):
+        logger.info(f"Cache warmer started (top {self.top_k}, one search every {self.spacing:.0f}s)")
+        while True:
+            self._decay()
+            due = self.due()
+            if not due:
+                await asyncio.sleep(WARMER_TICK_SECONDS)
+                continue
+
+            # Only the most popular one per slot, the rest waits for the next slot
+            key, params = due[0]
+            refresh_ahead = self.cache.ttl * WARMER_REFRESH_AHEAD
+            try:
+                results = await self.search(params)
+                if results and "error" not in results:
+                    self.store(params, results)
+                    self.warmed += 1
+                    logger.info(f"Cache warmed for {key}")
+                    if results.get('partial'):
+                        # Поиск не успел закончиться - повторяем не чаще, чем обновлялся бы полный результат
+                        self._retry_after[key] = time.monotonic() + self.cache.ttl - refresh_ahead
+                else:
+                    logger.warning(f"Cache warm-up failed for {key}: {results}")
+                    self._retry_after[key] = time.monotonic() + refresh_ahead
+            except Exception as e:
+                logger.error(f"Cache warm-up error: {e}")
+                self._retry_after[key] = time.monotonic() + refresh_ahead
+            await asyncio.sleep(self.spacing)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    @property
+    def running(self):
+        return self._task is not None
+
+    def stats(self):
+        return {
+            'running': self.running,
+            'warmed': self.warmed,
+            'top': [{'key': key, 'count': count} for key, count in self.top()],
+        }
@@ -0,0 +1,139 @@
+import re
+
+# Фильтры search.php: TourVisor отбирает отели на своей стороне, и мы получаем меньше данных
+FILTER_FIELDS = ('stars', 'starsbetter', 'meal', 'mealbetter', 'rating', 'regions', 'pricefrom', 'priceto')
+# Минимальная оценка отеля -> код параметра rating
+RATING_CODES = ((4.5, 5), (4.0, 4), (3.5, 3), (3.0, 2))
+MAX_STARS = 5
+
+# Питание в свободном тексте -> код TourVisor (AI, BB...)
+MEAL_KEYWORDS = (
+    (re.compile(r'ультра|\buai\b', re.IGNORECASE), 'UAI'),
+    (re.compile(r'вс[её]\s*включено|all\s*inclusive|\bai\b', re.IGNORECASE), 'AI'),
+    (re.compile(r'полный\s*пансион|\bfb\b', re.IGNORECASE), 'FB'),
+    (re.compile(r'полупансион|\bhb\b', re.IGNORECASE), 'HB'),
+    (re.compile(r'завтрак|\bbb\b', re.IGNORECASE), 'BB'),
+)
+STARS_PATTERN = re.compile(r'\b([1-5])\s*(?:\*|★|зв)', re.IGNORECASE)
+PRICE_TO_PATTERN = re.compile(r'\bдо\s*(\d[\d\s]*)(к|тыс)?', re.IGNORECASE)
+PRICE_FROM_PATTERN = re.compile(r'\bот\s*(\d[\d\s]*)(к|тыс)?', re.IGNORECASE)
+RATING_PATTERN = re.compile(r'рейтинг\w*\s*(?:от\s*)?(\d(?:[.,]\d)?)', re.IGNORECASE)
+NO_FILTERS = ('нет', 'no', '-', 'любые', 'любой', 'без разницы', 'не важно', 'неважно')
+
+
+class FilterError(ValueError):
+    """Invalid filter; the message is shown to the user"""
+
+
+def rating_code(rating):
+    for threshold, code in RATING_CODES:
+        if rating >= threshold:
+            return code
+    return None
+
+
+def build_filters(reference, countries, stars=None, meal=None, regions=None,
+                  price_from=None, price_to=None, rating=None):
+    """search.php filter params from user choices; raises FilterError
+
+    Stars and meal mean "this or better". `meal` is a TourVisor meal id or
+    code (AI, BB...), `regions` region ids, `rating` the minimum hotel
+    rating (3.0-4.5). Regions belong to one country, so they need a single
+    country.
+    """
+    filters = {}
+    if stars:
+        if not 1 <= int(stars) <= MAX_STARS:
+            raise FilterError("Звездность отеля должна быть от 1 до 5")
+        filters['stars'] = int(stars)
+        filters['starsbetter'] = 1
+    if meal:
+        meal = str(meal).strip()
+        if meal in reference.meals:
+            meal_id = meal
+        else:
+            meal_id = reference.meal_by_name.get(meal.lower())
+        if meal_id is None:
+            raise FilterError(f"Неизвестный тип питания: {meal}")
+        filters['meal'] = meal_id
+        filters['mealbetter'] = 1
+    if regions:
+        region_ids = [r.strip() for r in (regions.split(',') if isinstance(regions, str) else regions) if str(r).strip()]
+        if len(countries) != 1:
+            raise FilterError("Курорты можно выбрать только для одной страны")
+        known = reference.regions_by_country.get(countries[0])
+        unknown = [r for r in region_ids if (r not in known if known else not r.isdigit())]
+        if unknown:
+            raise FilterError(f"Неизвестный курорт: {', '.join(unknown)}")
+        filters['regions'] = ','.join(region_ids)
+    if price_from is not None and price_to is not None and price_from > price_to:
+        raise FilterError("Минимальная цена больше максимальной")
+    if price_from:
+        filters['pricefrom'] = int(price_from)
+    if price_to:
+        filters['priceto'] = int(price_to)
+    if rating:
+        code = rating_code(float(rating))
+        if code is None:
+            raise FilterError("Минимальный рейтинг отеля - от 3.0 до 4.5")
+        filters['rating'] = code
+    return filters
+
+
+def _amount(match):
+    value = int(re.sub(r'\s', '', match.group(1)))
+    return value * 1000 if match.group(2) else value
+
+
+def parse_filters_text(text, reference, countries):
+    """build_filters() arguments from a free-text answer like '5 звезд, всё включено, до 200 тыс'
+
+    Returns None when nothing was recognized; {} when the user wants no filters.
+    """
+    text = text.strip()
+    if text.lower() in NO_FILTERS:
+        return {}
+    choices = {}
+    if match := RATING_PATTERN.search(text):
+        choices['rating'] = float(match.group(1).replace(',', '.'))
+        # "рейтинг от 4.5" - не цена
+        text = text[:match.start()] + text[match.end():]
+    if match := STARS_PATTERN.search(text):
+        choices['stars'] = int(match.group(1))
+    for pattern, code in MEAL_KEYWORDS:
+        if pattern.search(text):
+            choices['meal'] = code
+            break
+    if match := PRICE_TO_PATTERN.search(text):
+        choices['price_to'] = _amount(match)
+    if match := PRICE_FROM_PATTERN.search(text):
+        choices['price_from'] = _amount(match)
+    if len(countries) == 1:
+        lowered = text.lower()
+        regions = [
+            region_id for region_id, name in reference.regions_by_country.get(countries[0], {}).items()
+            if name and name.lower() in lowered
+        ]
+        if regions:
+            choices['regions'] = regions
+    return choices or None
+
+
+def describe_filters(filters, reference):
+    """Filters as a short Russian line for the confirmation message"""
+    parts = []
+    if filters.get('stars'):
+        parts.append(f"{filters['stars']}★ и выше")
+    if filters.get('meal'):
+        parts.append(f"питание {reference.meal_name(filters['meal'])} и лучше")
+    if filters.get('regions'):
+        names = [(reference.regions.get(r) or {}).get('name') or r for r in filters['regions'].split(',')]
+        parts.append(f"курорты: {', '.join(names)}")
+    if filters.get('pricefrom'):
+        parts.append(f"от {filters['pricefrom']:,} ₽".replace(',', ' '))
+    if filters.get('priceto'):
+        parts.append(f"до {filters['priceto']:,} ₽".replace(',', ' '))
+    if filters.get('rating'):
+        rating = next(threshold for threshold, code in RATING_CODES if code == filters['rating'])
+        parts.append(f"рейтинг от {rating}")
+    return ", ".join(parts)
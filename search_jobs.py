@@ -0,0 +1,246 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+
+from state_backend import MemoryBackend
+from tracing import span, current_context
+from termination import TerminationPolicy, poll_until_done
+
+logger = logging.getLogger(__name__)
+
+SEARCH_WORKERS = int(os.getenv("SEARCH_WORKERS", "4"))
+JOB_QUEUE_SIZE = int(os.getenv("SEARCH_JOB_QUEUE_SIZE", "100"))
+# Опрос статуса поиска в TourVisor
+POLL_INTERVAL_SECONDS = 2.5
+MAX_POLL_SECONDS = 60
+# Сколько хранить завершенные задачи
+JOB_RETENTION_SECONDS = 3600
+# Процесс без отметки дольше этого времени считается упавшим, его задачи подхватывают другие
+HEARTBEAT_TTL_SECONDS = 60
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+ERROR = 'error'
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class SearchJobQueue:
+    """Runs TourVisor create/poll/fetch in a bounded pool of async workers
+
+    Jobs are stored in the shared state backend, so any uvicorn worker can
+    answer GET /jobs/{id}; each job is run by the process that owns it.
+    """
+
+    NAMESPACE = 'search_jobs'
+    HEARTBEATS = 'search_job_owners'
+
+    def __init__(self, tour_search, backend=None, workers=SEARCH_WORKERS,
+                 cache=None, on_results=None, fanout=None, owner=None, status_poller=None):
+        self.tour_search = tour_search
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.workers = workers
+        self.cache = cache
+        # Called with (params, results) for every fresh upstream result, returns what the job keeps
+        self.on_results = on_results
+        self.fanout = fanout
+        # Общий опрос статуса с /status/{request_id}, если задан
+        self.status_poller = status_poller
+        self.owner = owner or uuid.uuid4().hex
+        self._queue = None
+        self._tasks = []
+        self.finished = {DONE: 0, ERROR: 0}
+        # Почему прекращался опрос: finished / stable / converged / timeout
+        self.terminations = {}
+
+    def _new_job(self, params, departures=None, countries=None):
+        now = time.time()
+        return {
+            'id': uuid.uuid4().hex,
+            'status': QUEUED,
+            'owner': self.owner,
+            'params': params,
+            'departures': departures or [params['departure']],
+            'countries': countries or [params['country']],
+            'requestid': None,
+            'progress': None,
+            'result': None,
+            'error': None,
+            # Трасса запроса, который поставил задачу - воркер ее продолжает
+            'trace': current_context(),
+            'created_at': now,
+            'updated_at': now,
+        }
+
+    def _save(self, job):
+        active = job['status'] in (QUEUED, RUNNING)
+        self.backend.set(self.NAMESPACE, job['id'], job, ttl=None if active else JOB_RETENTION_SECONDS)
+
+    def _update(self, job, **changes):
+        job.update(changes, updated_at=time.time())
+        if job['status'] in self.finished and 'status' in changes:
+            self.finished[job['status']] += 1
+        self._save(job)
+
+    def _fail(self, job, error):
+        """Finish the job with stale cached results if there are any, else with the error"""
+        stale = self.cache.get(job['params'], allow_stale=True) if self.cache is not None else None
+        if stale is not None:
+            logger.warning(f"Search job {job['id']} failed ({error}), serving stale results")
+            self._update(job, status=DONE, result=dict(stale, stale=True))
+        else:
+            self._update(job, status=ERROR, error=error)
+
+    def submit(self, params, departures=None, countries=None):
+        """Enqueue a search, serving it from the cache right away when possible"""
+        job = self._new_job(params, departures, countries)
+        single = len(job['departures']) == 1 and len(job['countries']) == 1
+        cached = self.cache.get(params) if self.cache is not None and single else None
+        if cached is not None:
+            job.update(status=DONE, result=cached, requestid=cached.get('requestid'))
+            self._save(job)
+            return job
+
+        if self._queue is None or self._queue.full():
+            raise QueueFullError("Search queue is full")
+        self._save(job)
+        self._queue.put_nowait(job['id'])
+        logger.info(f"Search job {job['id']} queued")
+        return job
+
+    def get(self, job_id):
+        return self.backend.get(self.NAMESPACE, job_id)
+
+    def heartbeat(self):
+        """Mark this process as alive so its queued jobs are not taken over"""
+        self.backend.set(self.HEARTBEATS, self.owner, time.time(), ttl=HEARTBEAT_TTL_SECONDS)
+
+    def resume_orphans(self):
+        """Take over unfinished jobs of processes that stopped or crashed
+
+        Should be called by a single process (the leader). Jobs that already
+        have a TourVisor requestid are only polled and fetched again.
+        """
+        if self._queue is None:
+            return 0
+        resumed = 0
+        for job_id, job in self.backend.items(self.NAMESPACE):
+            if job['status'] not in (QUEUED, RUNNING) or job.get('owner') == self.owner:
+                continue
+            if self.backend.get(self.HEARTBEATS, job.get('owner') or '') is not None:
+                continue
+            if self._queue.full():
+                break
+            logger.info(f"Resuming search job {job_id} (requestid {job.get('requestid')})")
+            self._update(job, status=QUEUED, owner=self.owner)
+            self._queue.put_nowait(job_id)
+            resumed += 1
+        return resumed
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=JOB_QUEUE_SIZE)
+        self.heartbeat()
+        self._tasks = [asyncio.create_task(self._worker(n)) for n in range(self.workers)]
+        logger.info(f"Started {self.workers} search workers")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        # Незавершенные задачи сразу становятся доступны другим процессам
+        self.backend.delete(self.HEARTBEATS, self.owner)
+
+    async def _worker(self, number):
+        while True:
+            job_id = await self._queue.get()
+            job = self.get(job_id)
+            if job is None or job.get('owner') != self.owner:
+                continue
+            try:
+                with span('search.job', parent=job.get('trace'), job_id=job_id):
+                    await self._run(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Search job {job_id} failed in worker {number}: {e}", exc_info=True)
+                self._fail(job, "Не удалось получить результаты поиска")
+
+    async def _run(self, job):
+        self._update(job, status=RUNNING)
+
+        if len(job['departures']) > 1 or len(job['countries']) > 1:
+            # Параллельный поиск не возобновляется - запускаем заново
+            results = await self.fanout.search(job['params'], job['departures'], job['countries'])
+            if "error" in results:
+                self._update(job, status=ERROR, error=results['error'])
+            else:
+                self._update(job, status=DONE, result=results)
+            return
+
+        loop = asyncio.get_running_loop()
+        params = job['params']
+
+        if not job.get('requestid'):
+            with span('tourvisor.search'):
+                search_response = await loop.run_in_executor(None, self.tour_search.create_search_request, params)
+            if not search_response:
+                self._fail(job, "Ошибка при создании поискового запроса")
+                return
+            if "error" in search_response:
+                self._fail(job, f"API вернула ошибку: {search_response['error']}")
+                return
+            if not search_response.get('requestid'):
+                self._fail(job, "Не удалось получить ID запроса")
+                return
+            self._update(job, requestid=search_response['requestid'])
+            logger.info(f"Search job {job['id']} got request ID {job['requestid']}")
+
+        request_id = job['requestid']
+
+        async def poll_status():
+            with span('tourvisor.status'):
+                if self.status_poller is not None:
+                    return await self.status_poller.aget(request_id)
+                return await loop.run_in_executor(None, self.tour_search.get_search_results, request_id, 'status')
+
+        def show_progress(status):
+            if status.get('status'):
+                self._update(job, progress=status['status'])
+
+        # Не ждем state=finished, если лучшая цена уже не меняется
+        with span('search.wait') as waiting:
+            _, reason = await poll_until_done(
+                poll_status, TerminationPolicy(), POLL_INTERVAL_SECONDS, MAX_POLL_SECONDS, on_snapshot=show_progress
+            )
+            waiting.set(reason=reason)
+        self.terminations[reason] = self.terminations.get(reason, 0) + 1
+
+        with span('tourvisor.result'):
+            results = await loop.run_in_executor(None, self.tour_search.get_search_results, request_id)
+        if not results:
+            self._fail(job, "Не удалось получить результаты поиска")
+            return
+
+        results['requestid'] = request_id
+        if reason != 'finished':
+            # Поиск в TourVisor еще идет - кэш хранит такие результаты недолго
+            results['partial'] = True
+        if self.on_results is not None:
+            with span('search.store'):
+                results = self.on_results(params, results)
+        self._update(job, status=DONE, result=results)
+        logger.info(f"Search job {job['id']} done")
+
+    def stats(self):
+        """Counters of this process only"""
+        return {
+            'queued': self._queue.qsize() if self._queue is not None else 0,
+            'workers': len(self._tasks),
+            'jobs': dict(self.finished),
+            'poll_terminations': dict(self.terminations),
+        }
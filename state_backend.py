@@ -0,0 +1,177 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Общее состояние воркеров: "sqlite:///путь/к/файлу.db" или "memory" (только для одного процесса)
+STATE_BACKEND = os.getenv(
+    "STATE_BACKEND",
+    "sqlite:///" + os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "state.db")
+)
+
+
+class MemoryBackend:
+    """Process-local backend, for a single worker and for development
+
+    Values are stored as given, callers must set() again after changing them.
+    """
+
+    def __init__(self):
+        self._data = {}  # (namespace, key) -> (expires_at or None, value)
+        self._lock = threading.Lock()
+
+    def get(self, namespace, key):
+        with self._lock:
+            entry = self._data.get((namespace, key))
+            if entry is None:
+                return None
+            if entry[0] is not None and entry[0] <= time.time():
+                del self._data[(namespace, key)]
+                return None
+            return entry[1]
+
+    def set(self, namespace, key, value, ttl=None):
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            self._data[(namespace, key)] = (expires_at, value)
+
+    def delete(self, namespace, key):
+        with self._lock:
+            self._data.pop((namespace, key), None)
+
+    def items(self, namespace):
+        now = time.time()
+        with self._lock:
+            return [
+                (key, value) for (ns, key), (expires_at, value) in list(self._data.items())
+                if ns == namespace and (expires_at is None or expires_at > now)
+            ]
+
+    def incr(self, namespace, key, amount=1):
+        with self._lock:
+            expires_at, value = self._data.get((namespace, key), (None, 0))
+            self._data[(namespace, key)] = (expires_at, value + amount)
+            return value + amount
+
+    def acquire_lease(self, name, owner, ttl):
+        with self._lock:
+            entry = self._data.get(('leases', name))
+            if entry is None or entry[1] == owner or entry[0] <= time.time():
+                self._data[('leases', name)] = (time.time() + ttl, owner)
+                return True
+            return False
+
+    def purge_expired(self):
+        now = time.time()
+        with self._lock:
+            for key in [k for k, (expires_at, _) in self._data.items() if expires_at is not None and expires_at <= now]:
+                del self._data[key]
+
+
+class SQLiteBackend:
+    """SQLite in WAL mode, shared by all uvicorn workers on the same machine
+
+    Values are stored as JSON. One connection per thread.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        # Файл и таблицы создаются при первом обращении, а не при импорте
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+
+    def _create_schema(self, conn):
+        with self._schema_lock:
+            if self._schema_ready:
+                return
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS kv ("
+                " namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, expires_at REAL,"
+                " PRIMARY KEY (namespace, key))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._schema_ready = True
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            if not self._schema_ready:
+                self._create_schema(conn)
+        return conn
+
+    def get(self, namespace, key):
+        row = self._conn().execute(
+            "SELECT value FROM kv WHERE namespace = ? AND key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (namespace, key, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, namespace, key, value, ttl=None):
+        expires_at = time.time() + ttl if ttl else None
+        self._conn().execute(
+            "INSERT OR REPLACE INTO kv (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+            (namespace, key, json.dumps(value, ensure_ascii=False), expires_at)
+        )
+
+    def delete(self, namespace, key):
+        self._conn().execute("DELETE FROM kv WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def items(self, namespace):
+        rows = self._conn().execute(
+            "SELECT key, value FROM kv WHERE namespace = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (namespace, time.time())
+        ).fetchall()
+        return [(key, json.loads(value)) for key, value in rows]
+
+    def incr(self, namespace, key, amount=1):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT INTO kv (namespace, key, value, expires_at) VALUES (?, ?, ?, NULL) "
+                "ON CONFLICT (namespace, key) DO UPDATE SET value = CAST(value AS INTEGER) + excluded.value",
+                (namespace, key, amount)
+            )
+            row = conn.execute("SELECT value FROM kv WHERE namespace = ? AND key = ?", (namespace, key)).fetchone()
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return int(row[0])
+
+    def acquire_lease(self, name, owner, ttl):
+        """Take or extend a named lease; True if `owner` holds it now"""
+        now = time.time()
+        conn = self._conn()
+        conn.execute("INSERT OR IGNORE INTO leases (name, owner, expires_at) VALUES (?, ?, 0)", (name, owner))
+        cursor = conn.execute(
+            "UPDATE leases SET owner = ?, expires_at = ? WHERE name = ? AND (owner = ? OR expires_at <= ?)",
+            (owner, now + ttl, name, owner, now)
+        )
+        return cursor.rowcount == 1
+
+    def purge_expired(self):
+        self._conn().execute("DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),))
+
+
+def create_backend(url=STATE_BACKEND):
+    if url == "memory":
+        logger.info("Using in-memory state backend (single worker only)")
+        return MemoryBackend()
+    if url.startswith("sqlite:///"):
+        path = url[len("sqlite:///"):]
+        logger.info(f"Using SQLite state backend at {path}")
+        return SQLiteBackend(path)
+    raise ValueError(f"Unsupported STATE_BACKEND: {url}")
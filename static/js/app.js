@@ -0,0 +1,240 @@
+let isWaitingForResponse = false;
+// Only the hotel fields the cards below use (set by the server on <body>)
+const HOTEL_FIELDS = document.body.dataset.hotelFields;
+// Chat socket; the page falls back to POST /chat while it is not open
+let chatSocket = null;
+
+function connectChat() {
+    const scheme = location.protocol === 'https:' ? 'wss' : 'ws';
+    const socket = new WebSocket(`${scheme}://${location.host}/ws/chat?fields=${HOTEL_FIELDS}`);
+    socket.onopen = () => { chatSocket = socket; };
+    socket.onmessage = (event) => handleChatEvent(JSON.parse(event.data));
+    socket.onclose = () => {
+        chatSocket = null;
+        isWaitingForResponse = false;
+        setTimeout(connectChat, 3000);
+    };
+}
+
+function handleChatEvent(data) {
+    if (data.type === 'progress') {
+        showSearchProgress(data.progress);
+        return;
+    }
+    if (data.type === 'hotels') {
+        appendHotels(data.hotels, data.status !== undefined);
+        return;
+    }
+    if (data.type === 'price_alert') {
+        // Arrives on its own, the pending reply (if any) is still coming
+        addMessage(data.message, 'bot');
+        return;
+    }
+    isWaitingForResponse = false;
+    if (data.type === 'error') {
+        addMessage('❌ ' + data.message, 'bot');
+    } else if (data.type === 'reset') {
+        document.getElementById('chatMessages').innerHTML = '';
+        document.getElementById('searchResults').innerHTML = '';
+        addMessage(data.message, 'bot');
+    } else {
+        addMessage(data.message, 'bot');
+    }
+}
+
+async function sendMessage() {
+    if (isWaitingForResponse) return;
+
+    const input = document.getElementById('messageInput');
+    const message = input.value.trim();
+    if (!message) return;
+
+    input.value = '';
+    addMessage(message, 'user');
+    isWaitingForResponse = true;
+
+    if (chatSocket) {
+        chatSocket.send(JSON.stringify({ type: 'message', text: message }));
+        return;
+    }
+
+    try {
+        const formData = new FormData();
+        formData.append('message', message);
+        formData.append('fields', HOTEL_FIELDS);
+
+        const response = await fetch('/chat', {
+            method: 'POST',
+            body: formData
+        });
+
+        const data = await response.json();
+
+        if (data.type === 'search_results') {
+            addMessage(data.message, 'bot');
+            displaySearchResults(data.data);
+        } else if (data.type === 'search_job') {
+            addMessage(data.message, 'bot');
+            await waitForSearchJob(data.job_id);
+        } else if (data.type === 'error') {
+            addMessage('❌ ' + data.message, 'bot');
+        } else {
+            addMessage(data.message, 'bot');
+        }
+    } catch (error) {
+        console.error('Error:', error);
+        addMessage('Произошла ошибка при отправке сообщения', 'bot');
+    } finally {
+        isWaitingForResponse = false;
+    }
+}
+
+async function waitForSearchJob(jobId) {
+    // The search runs in the background, poll its status until it finishes
+    while (true) {
+        await new Promise(resolve => setTimeout(resolve, 2000));
+        const response = await fetch(`/jobs/${jobId}?fields=${HOTEL_FIELDS}`);
+        const job = await response.json();
+
+        if (job.status === 'done') {
+            addMessage('🎯 Вот что я нашел:', 'bot');
+            displaySearchResults(job.result);
+            return;
+        }
+        if (job.status === 'error' || job.error) {
+            addMessage('❌ ' + (job.error || 'Не удалось получить результаты поиска'), 'bot');
+            return;
+        }
+    }
+}
+
+function addMessage(message, type) {
+    const messagesContainer = document.getElementById('chatMessages');
+    const messageDiv = document.createElement('div');
+    messageDiv.className = `message ${type}-message`;
+    messageDiv.textContent = message;
+    messagesContainer.appendChild(messageDiv);
+    messagesContainer.scrollTop = messagesContainer.scrollHeight;
+}
+
+function showSearchProgress(progress) {
+    const container = document.getElementById('searchResults');
+    const percent = progress.progress || 0;
+    container.innerHTML = `
+        <div class="text-center text-muted">
+            <i class="fas fa-spinner fa-spin fa-2x mb-3"></i>
+            <p>Ищем туры: ${percent}%, найдено отелей: ${progress.hotelsfound || 0}</p>
+        </div>`;
+}
+
+function showNoResults() {
+    document.getElementById('searchResults').innerHTML = `
+        <div class="text-center">
+            <i class="fas fa-search fa-3x mb-3 text-muted"></i>
+            <p>Туры не найдены</p>
+        </div>`;
+}
+
+function appendHotels(hotels, first) {
+    // Hotels arrive in batches over the chat socket, the first one replaces old results
+    const container = document.getElementById('searchResults');
+    if (first) {
+        if (!hotels.length) {
+            showNoResults();
+            return;
+        }
+        container.innerHTML = '<div class="row"></div>';
+    }
+    const row = container.querySelector('.row');
+    if (row) {
+        row.insertAdjacentHTML('beforeend', hotels.map(hotelCard).join(''));
+    }
+}
+
+function displaySearchResults(results) {
+    const container = document.getElementById('searchResults');
+
+    if (!results.result || !results.result.hotels) {
+        showNoResults();
+        return;
+    }
+
+    container.innerHTML = '<div class="row">' + results.result.hotels.map(hotelCard).join('') + '</div>';
+}
+
+function hotelCard(hotel) {
+    const hotelName = hotel.hotelname || 'Название отеля не указано';
+    const stars = hotel.hotelstars ? '★'.repeat(parseInt(hotel.hotelstars)) : '';
+    const countryName = hotel.countryname || 'Страна не указана';
+    const regionName = hotel.regionname || 'Регион не указан';
+    const rating = hotel.hotelrating || 'Нет оценки';
+    const price = hotel.price ? Number(hotel.price).toLocaleString('ru-RU') : 'По запросу';
+    const image = hotel.picturelink
+        ? `/thumbnails?w=640&url=${encodeURIComponent(hotel.picturelink)}`
+        : 'https://placehold.co/600x400?text=Нет+фото';
+
+    return `
+        <div class="col-12 mb-4">
+            <div class="card tour-card">
+                <img src="${image}" class="hotel-image" alt="${hotelName}">
+                <div class="hotel-rating">
+                    <i class="fas fa-star"></i> ${rating}
+                </div>
+                <div class="card-body">
+                    <h5 class="hotel-name">
+                        ${hotelName}
+                        <span class="hotel-stars text-warning">${stars}</span>
+                    </h5>
+                    <div class="hotel-location">
+                        <i class="fas fa-map-marker-alt"></i> ${countryName}, ${regionName}
+                    </div>
+                    <div class="hotel-features">
+                        <i class="fas fa-wifi"></i> Wi-Fi
+                        <i class="fas fa-swimming-pool ml-2"></i> Бассейн
+                        <i class="fas fa-utensils ml-2"></i> Ресторан
+                    </div>
+                    <div class="hotel-price text-success">
+                        <i class="fas fa-tag"></i> От ${price} ₽
+                    </div>
+                    <button class="btn btn-primary btn-tour" onclick="showTours('${hotel.hotelcode}')">
+                        <i class="fas fa-search"></i> Показать туры
+                    </button>
+                </div>
+            </div>
+        </div>
+    `;
+}
+
+async function resetChat() {
+    if (chatSocket) {
+        chatSocket.send(JSON.stringify({ type: 'reset' }));
+        return;
+    }
+    try {
+        const response = await fetch('/chat/reset', { method: 'POST' });
+        const data = await response.json();
+
+        document.getElementById('chatMessages').innerHTML = '';
+        document.getElementById('searchResults').innerHTML = '';
+        addMessage(data.message, 'bot');
+    } catch (error) {
+        console.error('Error resetting chat:', error);
+    }
+}
+
+function showTours(hotelCode) {
+    // Implement showing tours for specific hotel
+    console.log('Showing tours for hotel:', hotelCode);
+}
+
+document.getElementById('messageInput').addEventListener('keypress', function(e) {
+    if (e.key === 'Enter') {
+        e.preventDefault();
+        sendMessage();
+    }
+});
+
+window.onload = () => {
+    resetChat();
+    connectChat();
+};
@@ -0,0 +1,154 @@
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import posixpath
+import threading
+
+from fastapi.responses import JSONResponse, Response
+from starlette.datastructures import Headers
+
+try:
+    import brotli
+except ImportError:  # без brotli статика хранится только в gzip
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+STATIC_URL = "/static"
+# Длина хэша содержимого в имени файла: app.3f2a9c01de.js
+FINGERPRINT_LENGTH = 10
+# Файлы с хэшем в имени никогда не меняются
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+# HTML-оболочка и файлы без хэша проверяются по ETag при каждом заходе
+REVALIDATE_CACHE = "no-cache"
+# Статика сжимается один раз, поэтому уровни максимальные
+BROTLI_QUALITY = 11
+GZIP_LEVEL = 9
+
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+
+
+class Asset:
+    """One static response stored in every encoding it is worth sending"""
+
+    def __init__(self, body, media_type, cache_control):
+        self.media_type = media_type
+        self.cache_control = cache_control
+        self.digest = hashlib.sha256(body).hexdigest()
+        self.bodies = {'identity': body}
+        if media_type.startswith(COMPRESSIBLE_TYPES):
+            compressed = {'gzip': gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)}
+            if brotli is not None:
+                compressed['br'] = brotli.compress(body, quality=BROTLI_QUALITY)
+            for encoding, data in compressed.items():
+                if len(data) < len(body):
+                    self.bodies[encoding] = data
+
+    def etag(self, encoding):
+        suffix = '' if encoding == 'identity' else f"-{encoding}"
+        return f'"{self.digest[:16]}{suffix}"'
+
+    def negotiate(self, accept_encoding):
+        for encoding in ('br', 'gzip'):
+            if encoding in self.bodies and encoding in accept_encoding:
+                return encoding
+        return 'identity'
+
+    def response(self, request):
+        """200 with the best stored encoding, or 304 when the client already has it"""
+        request_headers = Headers(scope=request.scope)
+        encoding = self.negotiate(request_headers.get('accept-encoding', ''))
+        headers = {'ETag': self.etag(encoding), 'Cache-Control': self.cache_control}
+        if len(self.bodies) > 1:
+            headers['Vary'] = 'Accept-Encoding'
+        # Любое представление с тем же содержимым считается актуальным
+        if self.digest[:16] in request_headers.get('if-none-match', ''):
+            return Response(status_code=304, headers=headers)
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        return Response(self.bodies[encoding], media_type=self.media_type, headers=headers)
+
+
+def fingerprinted_name(path, digest):
+    root, ext = posixpath.splitext(path)
+    return f"{root}.{digest[:FINGERPRINT_LENGTH]}{ext}"
+
+
+class AssetPipeline:
+    """Fingerprinted, precompressed static files and a once-rendered HTML shell
+
+    Files are read, hashed and compressed on the first request, then served
+    from memory. A missing static directory just means no assets.
+    """
+
+    def __init__(self, static_dir=STATIC_DIR, url_prefix=STATIC_URL):
+        self.static_dir = static_dir
+        self.url_prefix = url_prefix
+        self._lock = threading.Lock()
+        self._assets = None
+        self._urls = {}
+        self._shells = {}
+
+    def _build(self):
+        assets = {}
+        urls = {}
+        if not os.path.isdir(self.static_dir):
+            logger.warning(f"Static directory {self.static_dir} not found, serving no assets")
+        for root, _, files in os.walk(self.static_dir):
+            for name in files:
+                full_path = os.path.join(root, name)
+                path = os.path.relpath(full_path, self.static_dir).replace(os.sep, '/')
+                with open(full_path, 'rb') as f:
+                    body = f.read()
+                media_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+                fingerprinted = Asset(body, media_type, IMMUTABLE_CACHE)
+                versioned_path = fingerprinted_name(path, fingerprinted.digest)
+                assets[versioned_path] = fingerprinted
+                # Старое имя без хэша тоже работает, но кэшируется только с проверкой
+                assets[path] = Asset(body, media_type, REVALIDATE_CACHE)
+                urls[path] = f"{self.url_prefix}/{versioned_path}"
+        logger.info(f"Built {len(urls)} static assets")
+        self._urls = urls
+        self._assets = assets
+
+    def _ensure_built(self):
+        if self._assets is None:
+            with self._lock:
+                if self._assets is None:
+                    self._build()
+        return self._assets
+
+    def asset_url(self, path):
+        """URL of the fingerprinted copy of a static file (used in templates)"""
+        self._ensure_built()
+        url = self._urls.get(path)
+        if url is None:
+            logger.warning(f"Static asset {path} not found")
+            return f"{self.url_prefix}/{path}"
+        return url
+
+    def static_response(self, request, path):
+        asset = self._ensure_built().get(path)
+        if asset is None:
+            return JSONResponse(status_code=404, content={"error": "Файл не найден"})
+        return asset.response(request)
+
+    def shell_response(self, request, template, **context):
+        """HTML rendered once per template; later requests reuse the stored bytes"""
+        shell = self._shells.get(template.name)
+        if shell is None:
+            body = template.render(**context).encode('utf-8')
+            shell = self._shells[template.name] = Asset(body, 'text/html', REVALIDATE_CACHE)
+        return shell.response(request)
+
+    def stats(self):
+        assets = self._assets or {}
+        return {
+            'assets': len(self._urls),
+            'bytes': sum(len(asset.bodies['identity']) for asset in assets.values()
+                         if asset.cache_control == IMMUTABLE_CACHE),
+            'shells': len(self._shells),
+        }
@@ -0,0 +1,103 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+from state_backend import MemoryBackend
+
+logger = logging.getLogger(__name__)
+
+# Как часто статус одного поиска может запрашиваться в TourVisor
+STATUS_TTL_SECONDS = float(os.getenv("STATUS_CACHE_TTL", "2"))
+# Завершенный поиск больше не меняется
+FINISHED_STATUS_TTL_SECONDS = 300
+PRUNE_INTERVAL_SECONDS = 60
+
+
+def is_finished(status):
+    return ((status or {}).get('status') or {}).get('state') == 'finished'
+
+
+class StatusPoller:
+    """Shared TourVisor status polls: at most one upstream call per search per TTL
+
+    Concurrent callers for the same request id wait on the same in-flight
+    call; later callers within the TTL get its result. Results are also put
+    in the shared state backend, so other workers reuse them. Works for
+    executor threads (get) and coroutines (aget).
+    """
+
+    NAMESPACE = 'search_status'
+
+    def __init__(self, fetch, backend=None, ttl=STATUS_TTL_SECONDS, finished_ttl=FINISHED_STATUS_TTL_SECONDS):
+        self.fetch = fetch
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.ttl = ttl
+        self.finished_ttl = finished_ttl
+        self._lock = threading.Lock()
+        self._entries = {}  # request_id -> (expires_at, Future)
+        self._pruned_at = time.monotonic()
+        self.upstream_calls = 0
+        self.shared_calls = 0
+
+    def _subscribe(self, request_id):
+        """(future, True) if the caller must run the poll, (future, False) to just wait"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(request_id)
+            if entry is not None and (not entry[1].done() or now < entry[0]):
+                self.shared_calls += 1
+                return entry[1], False
+            future = Future()
+            self._entries[request_id] = (now + self.ttl, future)
+            if now - self._pruned_at > PRUNE_INTERVAL_SECONDS:
+                self._prune(now)
+            return future, True
+
+    def _prune(self, now):
+        self._pruned_at = now
+        for request_id, (expires_at, future) in list(self._entries.items()):
+            if future.done() and expires_at < now:
+                del self._entries[request_id]
+
+    def _poll(self, request_id, future):
+        try:
+            status = self.backend.get(self.NAMESPACE, request_id)
+            if status is None:
+                self.upstream_calls += 1
+                status = self.fetch(request_id)
+                if status:
+                    ttl = self.finished_ttl if is_finished(status) else self.ttl
+                    self.backend.set(self.NAMESPACE, request_id, status, ttl=ttl)
+            else:
+                self.shared_calls += 1
+            if is_finished(status):
+                with self._lock:
+                    self._entries[request_id] = (time.monotonic() + self.finished_ttl, future)
+            future.set_result(status)
+        except Exception as e:
+            logger.error(f"Status poll for {request_id} failed: {e}")
+            future.set_exception(e)
+
+    def get(self, request_id):
+        """Status of a search, blocking (for executor threads)"""
+        future, owner = self._subscribe(request_id)
+        if owner:
+            self._poll(request_id, future)
+        return future.result()
+
+    async def aget(self, request_id):
+        """Status of a search without blocking the event loop"""
+        future, owner = self._subscribe(request_id)
+        if owner:
+            await asyncio.get_running_loop().run_in_executor(None, self._poll, request_id, future)
+        return await asyncio.wrap_future(future)
+
+    def stats(self):
+        return {
+            'upstream_calls': self.upstream_calls,
+            'shared_calls': self.shared_calls,
+            'tracked': len(self._entries),
+        }
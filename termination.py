@@ -0,0 +1,112 @@
+import asyncio
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# Останавливать опрос, не дожидаясь state=finished, когда лучшие цены перестали меняться
+EARLY_TERMINATION_ENABLED = os.getenv("SEARCH_EARLY_TERMINATION", "1") == "1"
+# Сколько самых дешевых цен сравнивать (по статусу доступна только minprice)
+TERMINATION_TOP_N = int(os.getenv("SEARCH_TERMINATION_TOP_N", "5"))
+# Сколько опросов подряд цены должны держаться
+TERMINATION_STABLE_POLLS = int(os.getenv("SEARCH_TERMINATION_STABLE_POLLS", "2"))
+# Улучшение лучших цен за опрос меньше этой доли считается несущественным
+TERMINATION_MIN_GAIN = float(os.getenv("SEARCH_TERMINATION_MIN_GAIN", "0.01"))
+# Раньше этого прогресса (% опрошенных операторов) устоявшаяся цена ничего не значит
+TERMINATION_MIN_PROGRESS = int(os.getenv("SEARCH_TERMINATION_MIN_PROGRESS", "50"))
+
+
+def _price(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def progress(snapshot):
+    try:
+        return int(float(((snapshot or {}).get('status') or {}).get('progress')))
+    except (TypeError, ValueError):
+        return 0
+
+
+def top_prices(snapshot, n):
+    """The n lowest hotel prices of a results snapshot; only minprice for a status"""
+    hotels = ((snapshot or {}).get('result') or {}).get('hotels')
+    if hotels:
+        prices = sorted(price for price in (_price(hotel.get('price')) for hotel in hotels) if price > 0)
+        return prices[:n]
+    minprice = _price(((snapshot or {}).get('status') or {}).get('minprice'))
+    return [minprice] if minprice > 0 else []
+
+
+class TerminationPolicy:
+    """Decides when to stop polling a TourVisor search
+
+    Stops on state=finished, or when the top-N prices have been unchanged
+    (reason 'stable') or improved by less than min_gain (reason
+    'converged') for stable_polls consecutive polls, once at least
+    min_progress percent of the operators have answered. Snapshots with
+    hotels compare the N cheapest hotels; status snapshots only have
+    minprice, so there N is effectively 1. One instance per search.
+    """
+
+    def __init__(self, top_n=TERMINATION_TOP_N, stable_polls=TERMINATION_STABLE_POLLS,
+                 min_gain=TERMINATION_MIN_GAIN, enabled=EARLY_TERMINATION_ENABLED,
+                 min_progress=TERMINATION_MIN_PROGRESS):
+        self.top_n = top_n
+        self.stable_polls = stable_polls
+        self.min_gain = min_gain
+        self.enabled = enabled
+        self.min_progress = min_progress
+        self._last = None
+        self._calm = 0
+        self._unchanged = True
+
+    def observe(self, snapshot):
+        """Stop reason for this poll, or None to keep polling"""
+        if (((snapshot or {}).get('status') or {}).get('state')) == 'finished':
+            return 'finished'
+        if not self.enabled:
+            return None
+
+        is_results = bool(((snapshot or {}).get('result') or {}).get('hotels'))
+        prices = top_prices(snapshot, self.top_n)
+        full = len(prices) == (self.top_n if is_results else 1)
+        last, self._last = self._last, prices
+        if not full or last is None or len(last) != len(prices):
+            self._calm = 0
+            self._unchanged = True
+            return None
+
+        gain = (sum(last) - sum(prices)) / sum(last)
+        if prices == last or gain < self.min_gain:
+            self._calm += 1
+            self._unchanged = self._unchanged and prices == last
+        else:
+            self._calm = 0
+            self._unchanged = True
+        if self._calm >= self.stable_polls and progress(snapshot) >= self.min_progress:
+            return 'stable' if self._unchanged else 'converged'
+        return None
+
+
+async def poll_until_done(poll, policy, interval, max_seconds, on_snapshot=None):
+    """Poll every `interval` seconds until the policy stops or max_seconds pass
+
+    `poll` is a coroutine function returning a status/results snapshot.
+    Returns (last snapshot, reason); reason is 'timeout' when time ran out.
+    Results fetched after any reason but 'finished' are partial.
+    """
+    deadline = time.monotonic() + max_seconds
+    snapshot = None
+    while time.monotonic() < deadline:
+        await asyncio.sleep(min(interval, max(deadline - time.monotonic(), 0)))
+        snapshot = await poll()
+        if snapshot and on_snapshot is not None:
+            on_snapshot(snapshot)
+        reason = policy.observe(snapshot)
+        if reason is not None:
+            return snapshot, reason
+    return snapshot, 'timeout'
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# Модули проекта лежат в корне репозитория
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Тесты не пишут в data/: общее состояние в памяти, без истории цен
+os.environ.setdefault('STATE_BACKEND', 'memory')
+os.environ.setdefault('PRICE_HISTORY_ENABLED', '0')
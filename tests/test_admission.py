@@ -0,0 +1,105 @@
+import asyncio
+
+from admission import OVERLOADED_MESSAGE, AdmissionController, AdmissionMiddleware
+
+
+def test_queue_full_and_timeout_are_rejected():
+    async def run():
+        controller = AdmissionController(max_concurrent=1, max_queue=1, max_wait=0.02)
+        assert await controller.acquire() is True
+        waiting = asyncio.create_task(controller.acquire())
+        await asyncio.sleep(0)
+        assert await controller.acquire() is False   # очередь заполнена
+        assert await waiting is False                 # не дождался места
+        return controller.stats()
+
+    stats = asyncio.run(run())
+    assert stats['rejected'] == {'queue_full': 1, 'timeout': 1}
+    assert stats['active'] == 1 and stats['queued'] == 0
+
+
+def test_slots_are_handed_over_in_fifo_order():
+    async def run():
+        controller = AdmissionController(max_concurrent=1, max_queue=5, max_wait=1)
+        await controller.acquire()
+        order = []
+
+        async def request(name):
+            await controller.acquire()
+            order.append(name)
+            controller.release()
+
+        tasks = [asyncio.create_task(request(name)) for name in 'abc']
+        await asyncio.sleep(0)
+        controller.release()
+        await asyncio.gather(*tasks)
+        return order, controller.stats()
+
+    order, stats = asyncio.run(run())
+    assert order == ['a', 'b', 'c']
+    assert stats['active'] == 0 and stats['admitted'] == 4
+
+
+def test_cancelled_waiter_does_not_leak_its_slot():
+    async def run():
+        controller = AdmissionController(max_concurrent=1, max_queue=5, max_wait=1)
+        await controller.acquire()
+        waiter = asyncio.create_task(controller.acquire())
+        await asyncio.sleep(0)
+        controller.release()  # место передано ожидающему...
+        waiter.cancel()       # ...который успел уйти
+        admitted, = await asyncio.gather(waiter, return_exceptions=True)
+        if admitted is True:
+            # Python 3.11: wait_for отдает результат вместо отмены - место освобождает вызывающий
+            controller.release()
+        return controller.stats()
+
+    assert asyncio.run(run())['active'] == 0
+
+
+def test_retry_after_follows_backlog_and_service_time():
+    controller = AdmissionController(max_concurrent=2)
+    controller.service_time = 3
+    assert controller.retry_after() == 2
+    controller.service_time = 1000
+    assert controller.retry_after() == 30
+
+
+async def call(app, path, method='POST'):
+    sent = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b''}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http', 'method': method, 'path': path, 'headers': [], 'query_string': b''}
+    await app(scope, receive, send)
+    return sent
+
+
+def test_middleware_sheds_load_with_503():
+    async def run():
+        gate = asyncio.Event()
+
+        async def app(scope, receive, send):
+            await gate.wait()
+            await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+            await send({'type': 'http.response.body', 'body': b'ok'})
+
+        controller = AdmissionController(max_concurrent=1, max_queue=0, max_wait=1)
+        middleware = AdmissionMiddleware(app, controller)
+        busy = asyncio.create_task(call(middleware, '/search'))
+        await asyncio.sleep(0)
+        rejected = await call(middleware, '/gateway/instagram/u1')
+        gate.set()
+        unguarded = await call(middleware, '/search', method='GET')
+        return rejected, await busy, unguarded, controller.stats()
+
+    rejected, busy, unguarded, stats = asyncio.run(run())
+    assert rejected[0]['status'] == 503
+    assert (b'retry-after', b'1') in rejected[0]['headers']
+    assert OVERLOADED_MESSAGE.encode() in rejected[1]['body']
+    assert busy[0]['status'] == 200 and unguarded[0]['status'] == 200
+    assert stats['active'] == 0
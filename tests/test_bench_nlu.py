@@ -0,0 +1,48 @@
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+
+from chatbot import ConversationState, TourChatbot
+from reference_data import reference_store
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+import bench_nlu  # noqa: E402
+
+
+@pytest.fixture
+def corpus(monkeypatch):
+    with open(bench_nlu.CORPUS_PATH, encoding='utf-8') as f:
+        data = json.load(f)
+    # use_reference() подменяет снимок справочников процесса - возвращаем его после теста
+    monkeypatch.setattr(reference_store, 'path', reference_store.path)
+    monkeypatch.setattr(reference_store, '_current', reference_store.current)
+    bench_nlu.use_reference(data['reference'])
+    return data
+
+
+def test_every_corpus_state_has_a_check(corpus):
+    for state in {case['state'] for case in corpus['cases']}:
+        # understood() бросает ValueError для состояний без проверки
+        bench_nlu.understood(ConversationState[state], TourChatbot(), None)
+    assert all('input' in case and 'expected' in case for case in corpus['cases'])
+
+
+def test_stub_llm_answers_from_recorded_replies():
+    llm = bench_nlu.StubLLM({'Страна пирамид': 'Египет'})
+    answer = asyncio.run(llm([{'role': 'user', 'content': ' страна пирамид '}], 0.3, 50))
+    assert answer == 'Египет'
+    assert asyncio.run(llm([{'role': 'user', 'content': 'x'}], 0.3, 50)) == 'неизвестно'
+    assert llm.calls == 2
+
+
+def test_benchmark_runs_every_case_once_for_accuracy(corpus):
+    latencies, fallbacks, correct, totals, errors = asyncio.run(bench_nlu.run(corpus, 2, 0))
+    assert sum(totals.values()) == len(corpus['cases'])
+    assert sum(len(values) for values in latencies.values()) == 2 * len(corpus['cases'])
+    assert sum(correct.values()) + len(errors) == len(corpus['cases'])
+    # До LLM доходит только распознавание страны
+    assert set(state for state, calls in fallbacks.items() if calls) == {'ASK_COUNTRY'}
+    assert correct['ASK_COUNTRY'] > 0
@@ -0,0 +1,48 @@
+import json
+import sys
+
+import pytest
+
+from chatbot import SESSION_HISTORY_LIMIT, ChatCatalog, ChatSession, ConversationState, TourChatbot
+from reference_data import ReferenceData
+
+
+def test_state_round_trip_through_json():
+    session = ChatSession(ConversationState.ASK_ADULTS, {'departure': '1', 'countries': ['4']},
+                          [{'role': 'user', 'content': 'привет'}])
+    restored = ChatSession.from_state(json.loads(json.dumps(session.to_state())))
+    assert restored.state == ConversationState.ASK_ADULTS
+    assert restored.user_data == session.user_data and restored.chat_history == session.chat_history
+
+
+def test_saved_history_is_bounded():
+    history = [{'role': 'user', 'content': str(n)} for n in range(SESSION_HISTORY_LIMIT + 5)]
+    saved = ChatSession(chat_history=history).to_state()['chat_history']
+    assert len(saved) == SESSION_HISTORY_LIMIT and saved[-1]['content'] == history[-1]['content']
+
+
+def test_sessions_are_slotted_and_small():
+    session = ChatSession()
+    with pytest.raises(AttributeError):
+        session.extra = 1
+    assert not hasattr(session, '__dict__')
+    assert sys.getsizeof(session) < 100
+
+
+def test_chatbots_share_one_catalog_per_reference():
+    first, second = TourChatbot(), TourChatbot()
+    assert first.catalog is second.catalog
+    assert first.session is not second.session
+    with pytest.raises(TypeError):
+        first.catalog.countries['999'] = 'Марс'
+    # Новый снимок справочников - новый каталог
+    assert ChatCatalog.for_reference(ReferenceData()) is not first.catalog
+
+
+def test_load_state_restores_the_dialog():
+    chatbot = TourChatbot()
+    chatbot.get_next_message()
+    chatbot.get_next_message('1')
+    restored = TourChatbot().load_state(chatbot.to_state())
+    assert restored.session.state == ConversationState.ASK_COUNTRY
+    assert restored.session.user_data['departures'] == ['1']
@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+from chatbot import ConversationState, TourChatbot
+
+
+class LLM:
+    """OpenAI stand-in: answers with a fixed country name, tracks overlapping calls"""
+
+    def __init__(self, answer='неизвестно'):
+        self.answer = answer
+        self.running = 0
+        self.peak = 0
+
+    async def __call__(self, messages, temperature, max_tokens):
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        await asyncio.sleep(0.01)
+        self.running -= 1
+        return self.answer
+
+
+async def dialog(chatbot, *messages):
+    replies = [await chatbot.aget_next_message()]
+    for message in messages:
+        replies.append(await chatbot.aget_next_message(message))
+    return replies
+
+
+def test_full_dialog_ends_with_search_params():
+    chatbot = TourChatbot(llm=LLM())
+    replies = asyncio.run(dialog(chatbot, '1', 'Турция', '2', '2', '0', 'нет', 'да'))
+    signal, params = replies[-1]
+    assert signal == 'SEARCH_READY'
+    assert (params['departure'], params['country'], params['nights_from'], params['adults']) == ('1', '4', 7, 2)
+    assert chatbot.session.state == ConversationState.SEARCHING
+
+
+def test_countries_are_detected_concurrently():
+    llm = LLM(answer='Египет')
+    chatbot = TourChatbot(llm=llm)
+    asyncio.run(dialog(chatbot, '1', 'Турция или страна фараонов или пирамиды'))
+    assert chatbot.session.user_data['countries'] == ['4', '1']
+    assert llm.peak == 2
+
+
+def test_unknown_country_keeps_asking():
+    chatbot = TourChatbot(llm=LLM())
+    reply = asyncio.run(dialog(chatbot, '1', 'Атлантида'))[-1]
+    assert reply.startswith("🤔") and chatbot.session.state == ConversationState.ASK_COUNTRY
+
+
+def test_sync_wrapper_only_outside_the_event_loop():
+    chatbot = TourChatbot(llm=LLM())
+    assert "Откуда вы хотите вылететь" in chatbot.get_next_message()
+
+    async def inside():
+        with pytest.raises(RuntimeError):
+            chatbot.get_next_message('1')
+
+    asyncio.run(inside())
+
+
+def test_concurrent_sessions_do_not_block_each_other():
+    llm = LLM(answer='Турция')
+
+    async def run():
+        chatbots = [TourChatbot(llm=llm) for _ in range(5)]
+        for chatbot in chatbots:
+            await chatbot.aget_next_message()
+            await chatbot.aget_next_message('1')
+        await asyncio.gather(*(chatbot.aget_next_message('Турцыяя-ааа') for chatbot in chatbots))
+        return chatbots
+
+    chatbots = asyncio.run(run())
+    assert llm.peak == 5
+    assert all(chatbot.session.user_data['country'] == '4' for chatbot in chatbots)
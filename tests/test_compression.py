@@ -0,0 +1,69 @@
+import asyncio
+import gzip
+import zlib
+
+import pytest
+
+from responses import CompressionMiddleware
+
+LINES = [b'{"status":{"state":"searching"},"result":{"hotels":[' + b'{"price":1},' * 200 + b']}}\n'
+         for _ in range(3)]
+
+
+def scope(accept_encoding, path='/search'):
+    return {'type': 'http', 'method': 'POST', 'path': path, 'query_string': b'',
+            'headers': [(b'accept-encoding', accept_encoding.encode())]}
+
+
+async def streaming_app(scope, receive, send):
+    await send({'type': 'http.response.start', 'status': 200,
+                'headers': [(b'content-type', b'application/x-ndjson')]})
+    for number, line in enumerate(LINES):
+        await send({'type': 'http.response.body', 'body': line, 'more_body': number < len(LINES) - 1})
+
+
+async def small_app(scope, receive, send):
+    await send({'type': 'http.response.start', 'status': 200,
+                'headers': [(b'content-type', b'application/json'), (b'content-length', b'2')]})
+    await send({'type': 'http.response.body', 'body': b'{}'})
+
+
+def call(app, accept_encoding, path='/search'):
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(CompressionMiddleware(app, minimum_size=100)(scope(accept_encoding, path), None, send))
+    return dict(sent[0]['headers']), [message['body'] for message in sent[1:]]
+
+
+def test_gzip_stream_is_flushed_per_chunk():
+    headers, chunks = call(streaming_app, 'gzip, deflate')
+    assert headers[b'content-encoding'] == b'gzip' and b'content-length' not in headers
+    assert len(chunks) == len(LINES)
+    # Каждый кусок распаковывается сразу, не дожидаясь конца потока
+    decompressor = zlib.decompressobj(31)
+    assert [decompressor.decompress(chunk) for chunk in chunks] == LINES
+
+
+def test_whole_gzip_body_is_valid():
+    _, chunks = call(streaming_app, 'gzip')
+    assert gzip.decompress(b''.join(chunks)) == b''.join(LINES)
+
+
+def test_brotli_stream_is_flushed_per_chunk():
+    brotli = pytest.importorskip('brotli')
+    headers, chunks = call(streaming_app, 'br, gzip')
+    assert headers[b'content-encoding'] == b'br'
+    decompressor = brotli.Decompressor()
+    assert [decompressor.process(chunk) for chunk in chunks] == LINES
+
+
+def test_small_unknown_and_skipped_responses_pass_through():
+    headers, chunks = call(small_app, 'gzip')
+    assert b'content-encoding' not in headers and chunks == [b'{}']
+    headers, chunks = call(streaming_app, 'identity')
+    assert b'content-encoding' not in headers and chunks == LINES
+    headers, _ = call(streaming_app, 'gzip', path='/thumbnails')
+    assert b'content-encoding' not in headers
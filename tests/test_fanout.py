@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+
+from fanout import FanOutSearch, hotel_price, split_choices
+
+PRICES = {('1', '4'): [70000, 50000], ('1', '1'): [60000], ('2', '4'): [55000, 'x']}
+
+
+class SearchOne:
+    """Cache-aware search stand-in: fixed hotels per (departure, country)"""
+
+    def __init__(self, failing=()):
+        self.failing = failing
+        self.running = 0
+        self.peak = 0
+
+    async def __call__(self, params):
+        pair = (params['departure'], params['country'])
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        await asyncio.sleep(0.01)
+        self.running -= 1
+        if pair in self.failing:
+            return {"error": "API вернула ошибку: timeout"}
+        prices = PRICES.get(pair, [])
+        return {
+            'requestid': f"{pair[0]}-{pair[1]}",
+            'status': {'hotelsfound': str(len(prices)), 'toursfound': str(len(prices)),
+                       'minprice': str(min((p for p in prices if p != 'x'), default=0))},
+            'result': {'hotels': [{'hotelcode': f"{pair}{i}", 'price': str(p)} for i, p in enumerate(prices)]},
+        }
+
+
+def fanout(search_one, concurrency=4):
+    return FanOutSearch(None, max_concurrency=concurrency, search_one=search_one)
+
+
+@pytest.mark.parametrize('value, choices', [
+    ('1,2', ['1', '2']),
+    (' 4 , ,1 ', ['4', '1']),
+    ('', []),
+    (['1', 2], ['1', '2']),
+    (7, ['7']),
+])
+def test_split_choices(value, choices):
+    assert split_choices(value) == choices
+
+
+def test_combinations_are_unique_and_ordered():
+    assert FanOutSearch.combinations(['1', '2', '1'], ['4', '4', '1']) == [
+        ('1', '4'), ('1', '1'), ('2', '4'), ('2', '1'),
+    ]
+
+
+def test_hotel_price_unknown_last():
+    assert sorted([{'price': 'x'}, {'price': '10'}, {}], key=hotel_price)[0] == {'price': '10'}
+
+
+def test_search_merges_by_price():
+    merged = asyncio.run(fanout(SearchOne()).search({}, ['1', '2'], ['4', '1']))
+    prices = [hotel['price'] for hotel in merged['result']['hotels']]
+    assert prices == ['50000', '55000', '60000', '70000', 'x']
+    assert merged['status'] == {'state': 'finished', 'hotelsfound': '5', 'toursfound': '5', 'minprice': '50000.0'}
+    assert merged['result']['hotels'][0]['departure'] == '1'
+    assert len(merged['searches']) == 4
+
+
+def test_stream_yields_a_snapshot_per_sub_search():
+    async def collect():
+        return [snapshot async for snapshot in fanout(SearchOne()).stream({}, ['1'], ['4', '1'])]
+
+    snapshots = asyncio.run(collect())
+    assert [s['status']['state'] for s in snapshots] == ['searching', 'finished']
+    assert len(snapshots[-1]['result']['hotels']) == 3
+
+
+def test_concurrency_is_limited():
+    search_one = SearchOne()
+    asyncio.run(fanout(search_one, concurrency=2).search({}, ['1', '2', '3'], ['4', '1']))
+    assert search_one.peak == 2
+
+
+def test_failed_sub_searches():
+    merged = asyncio.run(fanout(SearchOne(failing={('1', '1')})).search({}, ['1'], ['4', '1']))
+    assert [s.get('error') for s in merged['searches'] if s['country'] == '1'] == ["API вернула ошибку: timeout"]
+    assert len(merged['result']['hotels']) == 2
+
+    failed = asyncio.run(fanout(SearchOne(failing={('1', '4')})).search({}, ['1'], ['4']))
+    assert failed == {"error": "API вернула ошибку: timeout"}
+
+
+def test_partial_sub_search_marks_the_merge():
+    async def search_one(params):
+        results = await SearchOne()(params)
+        return dict(results, partial=True) if params['country'] == '1' else results
+
+    merged = asyncio.run(fanout(search_one).search({}, ['1'], ['4', '1']))
+    assert merged['partial'] is True
+    assert {s['country']: s.get('partial', False) for s in merged['searches']} == {'4': False, '1': True}
+
+    complete = asyncio.run(fanout(SearchOne()).search({}, ['1'], ['4', '1']))
+    assert 'partial' not in complete
@@ -0,0 +1,125 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from gateway import CHANNEL_MESSAGE_LIMITS, NEW_SEARCH_HINT, format_results
+
+
+def results(count, stale=False):
+    hotels = [
+        {'hotelcode': str(code), 'hotelname': f"H{code}", 'hotelstars': '4', 'price': str(90000 - code * 1000),
+         'countryname': 'Турция', 'regionname': 'Кемер', 'hoteldescription': 'x' * 90}
+        for code in range(count)
+    ]
+    found = {'status': {'hotelsfound': count, 'toursfound': count * 2}, 'result': {'hotels': hotels}}
+    return dict(found, stale=True) if stale else found
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(main, 'GATEWAY_TOKEN', 'secret')
+    return TestClient(main.app)
+
+
+def test_format_results_respects_the_channel_limit():
+    messages = format_results(results(5), limit=400)
+    assert len(messages) > 2
+    assert all(len(message) <= 400 for message in messages)
+    assert messages[-1] == NEW_SEARCH_HINT
+    # Самый дешевый отель первым
+    assert "1. H4" in messages[0] + messages[1]
+
+
+def test_format_results_empty_and_stale():
+    assert format_results({'result': {'hotels': []}}, limit=1000)[0].startswith("🔍")
+    assert "неактуальны" in format_results(results(1, stale=True), limit=1000)[0]
+
+
+def test_gateway_requires_token(client):
+    assert client.post('/gateway/instagram/u1', json={'text': 'привет'}).status_code == 403
+    response = client.post('/gateway/instagram/u1', json={'text': 'привет'},
+                           headers={'X-Gateway-Token': 'wrong'})
+    assert response.status_code == 403
+    assert client.get('/gateway/instagram/notifications').status_code == 403
+    assert client.post('/gateway/instagram/notifications/ack', json={'ids': []}).status_code == 403
+
+
+def test_gateway_unknown_channel(client):
+    response = client.post('/gateway/fax/u1', json={'text': 'привет'}, headers={'X-Gateway-Token': 'secret'})
+    assert response.status_code == 404
+
+
+def test_gateway_dialog_keeps_session_per_user(client):
+    headers = {'X-Gateway-Token': 'secret'}
+    first = client.post('/gateway/instagram/u1', json={'text': 'привет'}, headers=headers).json()
+    second = client.post('/gateway/instagram/u1', json={'text': '1'}, headers=headers).json()
+    other = client.post('/gateway/whatsapp/u1', json={'text': 'привет'}, headers=headers).json()
+    assert first['messages'] and 'job_id' not in first
+    assert second['messages'][0] != first['messages'][0]
+    assert other['messages'] == first['messages']
+    assert main.shared_state.get('chat_sessions', 'instagram:u1') is not None
+
+
+def test_job_reply_per_status():
+    done = main.gateway_job_reply({'id': 'j1', 'status': 'done', 'result': results(3)}, 'instagram')
+    assert done.status == 'done' and all(len(m) <= CHANNEL_MESSAGE_LIMITS['instagram'] for m in done.messages)
+    failed = main.gateway_job_reply({'id': 'j2', 'status': 'error', 'error': 'Упало'}, 'instagram')
+    assert failed.messages == ["😔 Упало", NEW_SEARCH_HINT]
+    assert main.gateway_job_reply({'id': 'j3', 'status': 'running'}, 'instagram').messages == []
+
+
+def test_instagram_background_tasks_are_kept_and_logged(caplog):
+    instagram_bot = pytest.importorskip('instagram_bot')
+    bot = instagram_bot.InstagramTourBot.__new__(instagram_bot.InstagramTourBot)
+    bot.tasks = set()
+
+    async def fail():
+        raise RuntimeError("boom")
+
+    async def run():
+        task = bot._spawn(fail())
+        assert task in bot.tasks
+        await asyncio.gather(task, return_exceptions=True)
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
+    assert bot.tasks == set()
+    assert "boom" in caplog.text
+
+
+def test_web_cookie_cannot_reach_gateway_sessions(client):
+    headers = {'X-Gateway-Token': 'secret'}
+    client.post('/gateway/instagram/u7', json={'text': 'привет'}, headers=headers)
+    client.post('/gateway/instagram/u7', json={'text': '1'}, headers=headers)
+    watch = main.price_watch
+    watch.backend.set(watch.INBOX, 'instagram:u7#1', {
+        'channel': 'instagram', 'user_id': 'u7', 'message': '🔔', 'created_at': 1.0,
+    })
+
+    browser = TestClient(main.app, cookies={main.SESSION_COOKIE: 'instagram:u7'})
+    assert browser.get('/watch/notifications').json() == {'notifications': []}
+    assert browser.post('/watch/notifications/ack', json={'ids': ['instagram:u7#1']}).json() == {'acknowledged': 0}
+    reply = browser.post('/chat', data={'message': '2'})
+    token = reply.cookies[main.SESSION_COOKIE]
+    assert main.SESSION_TOKEN_PATTERN.fullmatch(token)
+    assert main.shared_state.get('chat_sessions', f"web:{token}") is not None
+    # Диалог Instagram-пользователя не тронут
+    assert main.load_chatbot('instagram:u7').session.user_data['departures'] == ['1']
+    assert watch.acknowledge(['instagram:u7#1'], 'instagram:') == 1
+
+
+def test_issued_web_session_is_kept():
+    browser = TestClient(main.app)
+    token = browser.post('/chat', data={'message': 'привет'}).cookies[main.SESSION_COOKIE]
+    assert browser.post('/chat', data={'message': '1'}).cookies.get(main.SESSION_COOKIE, token) == token
+    assert main.load_chatbot(f"web:{token}").session.user_data['departures'] == ['1']
+
+
+def test_watch_is_offered_only_on_delivering_channels(monkeypatch):
+    monkeypatch.setattr(main, 'PRICE_WATCH_ENABLED', True)
+    assert main.watch_hint('whatsapp') == [main.WATCH_HINT]
+    assert main.watch_hint('telegram') == []
+    done = main.gateway_job_reply({'id': 'j4', 'status': 'done', 'result': results(1)}, 'telegram')
+    assert main.WATCH_HINT not in done.messages
@@ -0,0 +1,57 @@
+import threading
+import time
+
+import pytest
+
+from governor import GovernorTimeout, Priority, UpstreamGovernor
+
+
+def test_token_bucket_limits_bursts():
+    governor = UpstreamGovernor(max_concurrency=10, rate=0, burst=3)
+    for _ in range(3):
+        with governor.slot(timeout=0):
+            pass
+    with pytest.raises(GovernorTimeout):
+        governor.acquire(timeout=0.02)
+    assert governor.stats()['granted']['interactive'] == 3
+    assert governor.stats()['timeouts']['interactive'] == 1
+
+
+def test_concurrency_limit_until_release():
+    governor = UpstreamGovernor(max_concurrency=2, rate=1000, burst=100)
+    governor.acquire()
+    governor.acquire()
+    with pytest.raises(GovernorTimeout):
+        governor.acquire(timeout=0.02)
+    governor.release()
+    governor.acquire(timeout=0.02)
+    assert governor.stats()['in_flight'] == 2
+
+
+def test_background_leaves_a_reserve_for_users():
+    governor = UpstreamGovernor(max_concurrency=4, rate=1000, burst=100)
+    governor.acquire(Priority.BACKGROUND)
+    governor.acquire(Priority.BACKGROUND)
+    with pytest.raises(GovernorTimeout):
+        governor.acquire(Priority.BACKGROUND, timeout=0.02)
+    governor.acquire(Priority.INTERACTIVE, timeout=0)
+    governor.acquire(Priority.POLL, timeout=0)
+
+
+def test_waiting_interactive_request_goes_first():
+    governor = UpstreamGovernor(max_concurrency=1, rate=1000, burst=100)
+    order = []
+
+    def run(priority):
+        with governor.slot(priority, timeout=2):
+            order.append(priority)
+
+    governor.acquire()
+    threads = [threading.Thread(target=run, args=(priority,)) for priority in (Priority.BACKGROUND, Priority.INTERACTIVE)]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.05)
+    governor.release()
+    for thread in threads:
+        thread.join()
+    assert order == [Priority.INTERACTIVE, Priority.BACKGROUND]
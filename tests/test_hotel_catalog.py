@@ -0,0 +1,64 @@
+from hotel_catalog import STATIC_FIELDS, HotelCatalog
+from state_backend import MemoryBackend
+
+
+def hotel(code, price, name='Sunrise', stars='5'):
+    return {
+        'hotelcode': code, 'hotelname': name, 'hotelstars': stars, 'regionname': 'Кемер',
+        'price': price, 'tours': [{'tourid': f"{code}-1", 'price': price}],
+    }
+
+
+def results(*hotels):
+    return {'status': {'state': 'finished'}, 'result': {'hotels': list(hotels)}}
+
+
+def without_version(found):
+    return [{k: v for k, v in h.items() if k != 'catalog_version'} for h in found['result']['hotels']]
+
+
+def test_split_keeps_only_dynamic_fields():
+    catalog = HotelCatalog()
+    stored = catalog.split(results(hotel('1', 50000)))
+    cached = stored['result']['hotels'][0]
+    assert not set(cached) & set(STATIC_FIELDS)
+    assert cached['price'] == 50000 and cached['catalog_version']
+    assert stored['status'] == {'state': 'finished'}
+
+
+def test_join_restores_the_original_results():
+    catalog = HotelCatalog()
+    original = results(hotel('1', 50000), hotel('2', 60000, name='Palm'), {'price': 1})
+    assert without_version(catalog.join(catalog.split(original))) == original['result']['hotels']
+
+
+def test_unchanged_hotels_are_not_rewritten():
+    catalog = HotelCatalog()
+    catalog.split(results(hotel('1', 50000)))
+    catalog.split(results(hotel('1', 45000)))
+    assert catalog.stats()['updated'] == 1
+    catalog.split(results(hotel('1', 45000, stars='4')))
+    assert catalog.stats()['updated'] == 2
+
+
+def test_other_worker_sees_the_new_version():
+    backend = MemoryBackend()
+    first, second = HotelCatalog(backend), HotelCatalog(backend)
+    second.join(second.split(results(hotel('1', 50000))))
+    # Первый воркер обновил звезды; у второго в памяти старая запись
+    cached = first.split(results(hotel('1', 50000, stars='4')))
+    assert second.join(cached)['result']['hotels'][0]['hotelstars'] == '4'
+
+
+def test_memory_is_bounded_and_falls_back_to_the_backend():
+    catalog = HotelCatalog(memory_entries=2)
+    cached = catalog.split(results(*(hotel(str(code), 1000) for code in range(5))))
+    assert catalog.stats()['in_memory'] == 2
+    assert [h['hotelname'] for h in catalog.join(cached)['result']['hotels']] == ['Sunrise'] * 5
+
+
+def test_empty_results_pass_through():
+    catalog = HotelCatalog()
+    assert catalog.split({'result': {'hotels': []}}) == {'result': {'hotels': []}}
+    assert catalog.join(None) is None
+    assert catalog.entries(['1']) == {}
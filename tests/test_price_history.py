@@ -0,0 +1,70 @@
+from datetime import date, timedelta
+
+import pytest
+
+import price_history as price_history_module
+from price_history import PriceHistory, day_number, day_string
+
+NOW = 1_800_000_000
+
+
+def flydate(days):
+    return (date.today() + timedelta(days=days)).strftime('%d.%m.%Y')
+
+
+def results(hotel, price, days, nights=7):
+    return {'result': {'hotels': [{
+        'hotelcode': str(hotel), 'tours': [{'price': str(price), 'nights': str(nights), 'flydate': flydate(days)}],
+    }]}}
+
+
+@pytest.fixture
+def history(tmp_path, monkeypatch):
+    clock = [NOW]
+    monkeypatch.setattr(price_history_module.time, 'time', lambda: clock[0])
+    store = PriceHistory(str(tmp_path))
+
+    def record(fetched_at, found):
+        clock[0] = fetched_at
+        store.record({'departure': '1', 'country': '4'}, found)
+        clock[0] = NOW
+
+    return store, record
+
+
+def test_day_number_round_trip():
+    assert day_string(day_number('01.03.2027')) == '01.03.2027'
+
+
+def test_rows_out_of_fetch_order_are_all_scanned(history):
+    store, record = history
+    # Воркер с устаревшими ценами дописал строки между свежими
+    record(NOW - 60, results(1, 50000, 10))
+    record(NOW - 30 * 86400, results(2, 10000, 12))
+    record(NOW - 30, results(3, 60000, 11))
+
+    dates = store.cheapest_dates('4')
+    assert [(row['hotelcode'], row['price']) for row in dates] == [('1', 50000), ('3', 60000)]
+
+
+def test_hotel_trend_ignores_append_order(history):
+    store, record = history
+    record(NOW - 2 * 86400, results(1, 52000, 20))
+    record(NOW - 200 * 86400, results(1, 1000, 20))
+    record(NOW - 86400, results(1, 51000, 20))
+    record(NOW - 86400, results(1, 50000, 20))
+
+    trend = store.hotel_trend('1')
+    assert [(row['min_price'], row['samples']) for row in trend] == [(52000, 1), (50000, 2)]
+
+
+def test_cheapest_dates_filters(history):
+    store, record = history
+    record(NOW, results(1, 40000, 10, nights=10))
+    record(NOW, results(2, 45000, 10, nights=7))
+    record(NOW, results(3, 30000, 90, nights=7))
+
+    assert [row['price'] for row in store.cheapest_dates('4')] == [40000]
+    assert [row['price'] for row in store.cheapest_dates('4', nights=7)] == [45000]
+    assert store.cheapest_dates('4', departure='2') == []
+    assert store.stats()['rows'] == 3
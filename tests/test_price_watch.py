@@ -0,0 +1,169 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+import price_watch as price_watch_module
+from price_watch import PriceWatch, WatchLimitError, min_price, parse_watch_command
+from search_cache import SearchCache, chatbot_dates
+
+DATE_FROM, DATE_TO = chatbot_dates()
+PARAMS = {
+    'departure': '1', 'country': '4', 'datefrom': DATE_FROM, 'dateto': DATE_TO,
+    'nightsfrom': 7, 'nightsto': 10, 'adults': 2, 'child': 0,
+}
+
+
+def results(price):
+    return {'status': {'state': 'finished', 'minprice': str(price)},
+            'result': {'hotels': [{'hotelcode': '1', 'price': str(price)}]}}
+
+
+class Upstream:
+    """Search stand-in with a settable minimum price"""
+
+    def __init__(self, price):
+        self.price = price
+        self.calls = []
+
+    async def __call__(self, params):
+        self.calls.append(params)
+        return results(self.price)
+
+
+@pytest.fixture
+def upstream():
+    return Upstream(50000)
+
+
+@pytest.fixture
+def watch(upstream):
+    cache = SearchCache()
+
+    def store(params, found):
+        cache.set(params, found)
+        return found
+
+    return PriceWatch(cache, upstream, store, describe=lambda params: f"{params['country']}")
+
+
+def recheck(watch, upstream, price):
+    """Next scheduled check with the cache expired and `price` upstream"""
+    upstream.price = price
+    for key, _ in watch.backend.items(watch.cache.NAMESPACE):
+        watch.backend.delete(watch.cache.NAMESPACE, key)
+    for key, _ in watch.backend.items(watch.CHECKS):
+        watch.backend.delete(watch.CHECKS, key)
+    for spec_key, subscriptions in watch.due():
+        asyncio.run(watch.check(spec_key, subscriptions))
+
+
+@pytest.mark.parametrize('text, command', [
+    ('следить', ('watch', None)),
+    ('Следить за ценой', ('watch', None)),
+    ('следить до 150000', ('watch', 150000)),
+    ('следить до 150 тыс', ('watch', 150000)),
+    ('следить до 90к руб', ('watch', 90000)),
+    ('не  следить', ('unwatch', None)),
+    ('мои подписки', ('list', None)),
+    ('Турция', None),
+])
+def test_parse_watch_command(text, command):
+    assert parse_watch_command(text) == command
+
+
+def test_min_price():
+    assert min_price(results(50000)) == 50000
+    assert min_price({'status': {'minprice': '0'}, 'result': {'hotels': [{'price': 'x'}]}}) is None
+
+
+def test_met_target_does_not_alert_for_the_shown_price(watch, upstream):
+    watch.cache.set(PARAMS, results(50000))
+    subscription = watch.subscribe('s1', 'web', PARAMS, target=60000)
+    assert subscription['baseline'] == 50000
+
+    recheck(watch, upstream, 50000)
+    assert watch.pending('s1') == []
+    recheck(watch, upstream, 48000)
+    assert [n['min_price'] for n in watch.pending('s1')] == [48000]
+
+
+def test_drop_without_target(watch, upstream):
+    watch.subscribe('s1', 'web', PARAMS)
+    recheck(watch, upstream, 50000)  # первая проверка задает начальную цену
+    recheck(watch, upstream, 49000)  # меньше PRICE_WATCH_MIN_DROP
+    assert watch.pending('s1') == []
+    recheck(watch, upstream, 45000)
+    recheck(watch, upstream, 45000)
+    assert [n['min_price'] for n in watch.pending('s1')] == [45000]
+
+
+def test_identical_specs_share_one_search(watch, upstream):
+    for subscriber in ('s1', 's2', 's3'):
+        watch.subscribe(subscriber, 'web', PARAMS)
+    assert watch.stats()['searches_watched'] == 1
+    recheck(watch, upstream, 50000)
+    assert len(upstream.calls) == 1
+    # Свежие результаты в кэше - без поиска
+    for key, _ in watch.backend.items(watch.CHECKS):
+        watch.backend.delete(watch.CHECKS, key)
+    assert asyncio.run(watch.check(*watch.due()[0])) is False
+    assert len(upstream.calls) == 1
+
+
+def test_chatbot_dates_are_kept_relative(watch):
+    subscription = watch.subscribe('s1', 'web', PARAMS)
+    assert subscription['params']['datefrom'] == 'relative'
+
+
+def test_notifications_stay_until_acknowledged(watch, upstream):
+    watch.cache.set(PARAMS, results(50000))
+    watch.subscribe('instagram:u1', 'instagram', PARAMS, user_id='u1')
+    recheck(watch, upstream, 40000)
+    pending = watch.pending_for_channel('instagram')
+    assert len(pending) == 1 and pending[0]['user_id'] == 'u1'
+    assert len(watch.pending_for_channel('instagram')) == 1  # доставка не подтверждена
+
+    assert watch.acknowledge([pending[0]['id']], 'whatsapp:') == 0
+    assert watch.acknowledge([pending[0]['id']], 'instagram:') == 1
+    assert watch.pending_for_channel('instagram') == []
+
+
+def test_unsubscribe_during_check_is_not_undone(watch, upstream):
+    watch.subscribe('s1', 'web', PARAMS)
+    due = watch.due()
+    watch.unsubscribe('s1')
+    asyncio.run(watch.check(*due[0]))
+    assert watch.subscriptions('s1') == []
+
+
+def test_subscription_limit(watch, monkeypatch):
+    monkeypatch.setattr(price_watch_module, 'PRICE_WATCH_MAX_PER_USER', 2)
+    watch.subscribe('s1', 'web', dict(PARAMS, country='1'))
+    watch.subscribe('s1', 'web', dict(PARAMS, country='2'))
+    watch.subscribe('s1', 'web', dict(PARAMS, country='2'), target=1000)  # та же подписка
+    with pytest.raises(WatchLimitError):
+        watch.subscribe('s1', 'web', dict(PARAMS, country='3'))
+
+
+def test_past_dates_are_dropped(watch):
+    watch.subscribe('s1', 'web', dict(PARAMS, datefrom='2020-01-01', dateto='2020-01-10'))
+    assert watch.due() == []
+    assert watch.subscriptions('s1') == []
+
+
+def test_gateway_notifications_and_ack(monkeypatch):
+    monkeypatch.setattr(main, 'GATEWAY_TOKEN', None)
+    watch = main.price_watch
+    watch.backend.set(watch.INBOX, 'instagram:u9#1', {
+        'channel': 'instagram', 'user_id': 'u9', 'message': '🔔', 'created_at': 1.0,
+    })
+    client = TestClient(main.app)
+    reply = client.get('/gateway/instagram/notifications').json()
+    assert reply == {'notifications': [{'user_id': 'u9', 'messages': ['🔔'], 'ids': ['instagram:u9#1']}]}
+    assert client.get('/gateway/instagram/notifications').json() == reply
+    assert client.post('/gateway/instagram/notifications/ack', json={'ids': ['instagram:u9#1']}).json() == {
+        'acknowledged': 1
+    }
+    assert client.get('/gateway/instagram/notifications').json() == {'notifications': []}
@@ -0,0 +1,89 @@
+import asyncio
+import os
+import threading
+import time
+
+from profiling import ProfilingMiddleware, RequestProfiler, StackSampler
+
+
+def scope(path='/chat', headers=None):
+    return {
+        'type': 'http', 'method': 'POST', 'path': path, 'query_string': b'',
+        'headers': [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()],
+    }
+
+
+def busy_handler():
+    deadline = time.monotonic() + 0.05
+    while time.monotonic() < deadline:
+        sum(range(1000))
+
+
+def test_sampler_collects_collapsed_stacks():
+    sampler = StackSampler(interval=0.001)
+    sampler.start()
+    busy_handler()
+    sampler.stop()
+    assert sampler.samples > 0
+    lines = sampler.collapsed().splitlines()
+    assert any('test_profiling:busy_handler' in line for line in lines)
+    assert all(line.rsplit(' ', 1)[1].isdigit() for line in lines)
+
+
+def test_only_token_or_sampled_requests_are_profiled():
+    profiler = RequestProfiler(sample_rate=0, token='secret')
+    assert not profiler.wanted(scope())
+    assert not profiler.wanted(scope(headers={'X-Profile': 'wrong'}))
+    assert profiler.wanted(scope(headers={'X-Profile': 'secret'}))
+    assert not profiler.wanted(scope('/metrics', headers={'X-Profile': 'secret'}))
+    assert RequestProfiler(sample_rate=1, token=None).wanted(scope('/search'))
+    assert not RequestProfiler(sample_rate=0, token=None).stats()['enabled']
+
+
+def test_one_profile_at_a_time_and_per_minute_limit():
+    profiler = RequestProfiler(max_per_minute=2)
+    assert profiler.acquire()
+    assert not profiler.acquire()  # уже идет профилирование
+    profiler.release()
+    assert profiler.acquire()
+    profiler.release()
+    assert not profiler.acquire()
+    assert profiler.stats()['rate_limited'] == 2
+
+
+def test_middleware_writes_profile_and_names_it(tmp_path):
+    async def app(scope, receive, send):
+        busy_handler()
+        await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+        await send({'type': 'http.response.body', 'body': b'{}'})
+
+    profiler = RequestProfiler(token='secret', directory=str(tmp_path))
+    middleware = ProfilingMiddleware(app, profiler)
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(middleware(scope(headers={'X-Profile': 'secret'}), None, send))
+    name = dict(sent[0]['headers'])[b'x-profile-id'].decode()
+    assert '-chat-' in name and name.endswith('.folded')
+    assert os.path.getsize(tmp_path / name) > 0
+    assert profiler.stats()['written'] == 1
+
+    sent.clear()
+    asyncio.run(middleware(scope(), None, send))
+    assert b'x-profile-id' not in dict(sent[0]['headers'])
+
+
+def test_sampler_skips_other_threads():
+    stop = threading.Event()
+    other = threading.Thread(target=stop.wait, name="other-worker")
+    other.start()
+    sampler = StackSampler(interval=0.001, thread_ids={threading.get_ident()})
+    sampler.start()
+    busy_handler()
+    sampler.stop()
+    stop.set()
+    other.join()
+    assert any('test_profiling:busy_handler' in line for line in sampler.collapsed().splitlines())
+    assert 'other-worker' not in sampler.collapsed()
@@ -0,0 +1,92 @@
+import os
+
+from reference_data import DEFAULT_COUNTRIES, ReferenceData, ReferenceStore, parse_lists
+
+LISTS = """<?xml version="1.0" encoding="utf-8"?>
+<lists>
+  <departures>
+    <departure><id>1</id><name>Москва</name></departure>
+    <departure><id>99</id><name>Калининград</name></departure>
+  </departures>
+  <countries>
+    <country><id>4</id><name>Турция</name></country>
+    <country><name>Без id</name></country>
+  </countries>
+  <regions>
+    <region><id>15</id><name>Кемер</name><country>4</country></region>
+  </regions>
+  <meals>
+    <meal><id>7</id><name>AI</name><russian>Все включено</russian></meal>
+  </meals>
+</lists>"""
+
+
+class Fetch:
+    def __init__(self, xml_text=LISTS):
+        self.xml_text = xml_text
+        self.calls = 0
+
+    def __call__(self, types):
+        self.calls += 1
+        return self.xml_text
+
+
+def test_parse_lists():
+    lists = parse_lists(LISTS)
+    assert lists['departures'] == {'1': 'Москва', '99': 'Калининград'}
+    assert lists['countries'] == {'4': 'Турция'}
+    assert lists['regions'] == {'15': {'name': 'Кемер', 'country': '4'}}
+    assert lists['meals'] == {'7': {'name': 'AI', 'russian': 'Все включено'}}
+    assert 'operators' not in lists
+
+
+def test_lookups_by_id_and_name():
+    reference = ReferenceData(**parse_lists(LISTS))
+    assert reference.departure_id('калининград') == '99'
+    assert reference.country_id(' Турция ') == '4' and reference.country_id('Марс') is None
+    assert reference.regions_by_country['4'] == {'15': 'Кемер'}
+    assert reference.meal_name('ai') == 'Все включено' and reference.meal_name('XX') == 'XX'
+    # Без снимка - встроенные таблицы
+    assert ReferenceData().countries == DEFAULT_COUNTRIES
+
+
+def test_describe_hotels_fills_missing_names():
+    reference = ReferenceData(**parse_lists(LISTS))
+    results = {'result': {'hotels': [{
+        'countrycode': '4', 'regioncode': '15', 'tours': [{'meal': '7'}, {'meal': 'XX'}],
+    }]}}
+    hotel = reference.describe_hotels(results)['result']['hotels'][0]
+    assert (hotel['countryname'], hotel['regionname']) == ('Турция', 'Кемер')
+    assert hotel['tours'][0]['mealrussian'] == 'Все включено' and 'mealrussian' not in hotel['tours'][1]
+
+
+def test_refresh_saves_a_snapshot_other_workers_reload(tmp_path):
+    path = str(tmp_path / 'reference.json')
+    store, other = ReferenceStore(path), ReferenceStore(path)
+    assert other.current.departure_id('99') is None
+    assert store.refresh(Fetch()) is True
+    assert store.current.departure_id('99') == '99'
+
+    os.utime(path, (1, 1))  # mtime снимка изменился
+    assert other.reload_if_changed() is True
+    assert other.current.departure_id('99') == '99'
+    assert other.reload_if_changed() is False
+
+
+def test_unchanged_or_broken_lists_keep_the_snapshot(tmp_path):
+    store = ReferenceStore(str(tmp_path / 'reference.json'), ttl=3600)
+    store.refresh(Fetch())
+    current = store.current
+    fetched_at = current.fetched_at
+    assert store.refresh(Fetch()) is False
+    # Снимок неизменяемый: продленный срок жизни - это новый снимок с теми же справочниками
+    assert current.fetched_at == fetched_at
+    assert store.current is not current and store.current.departures == current.departures
+    assert store.current.content_hash == current.content_hash
+    current = store.current
+    assert store.refresh(Fetch('')) is False
+    assert store.refresh(Fetch('<lists><broken')) is False
+    assert store.current is current
+
+    fetch = Fetch()
+    assert store.refresh_if_stale(fetch) is False and fetch.calls == 0
@@ -0,0 +1,118 @@
+import itertools
+import threading
+import time
+
+import pytest
+
+import resilience
+from resilience import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, Hedger, LatencyTracker
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=3, slow_call_seconds=1, open_seconds=60)
+    breaker.record(0.1, ok=False)
+    breaker.record(0.1, ok=False)
+    breaker.record(0.1, ok=True)  # успех сбрасывает счетчик
+    breaker.record(0.1, ok=False)
+    breaker.record(5, ok=True)    # медленный ответ считается ошибкой
+    assert breaker.state == CLOSED
+    breaker.record(0.1, ok=False)
+    assert breaker.state == OPEN and breaker.is_open
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    assert breaker.stats()['rejected'] == 1
+
+
+def test_half_open_lets_one_trial_through():
+    breaker = CircuitBreaker(failure_threshold=1, open_seconds=0.01)
+    breaker.record(0.1, ok=False)
+    time.sleep(0.02)
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record(0.1, ok=False)
+    assert breaker.state == OPEN and breaker.stats()['opened'] == 2
+
+    time.sleep(0.02)
+    breaker.before_call()
+    breaker.cancel()  # вызов не дошел до TourVisor - пробный слот свободен
+    breaker.before_call()
+    breaker.record(0.1, ok=True)
+    assert breaker.state == CLOSED
+
+
+def test_latency_percentiles_and_hedge_delay():
+    tracker = LatencyTracker(window=100)
+    assert tracker.percentile(95) is None
+    assert tracker.hedge_delay() == resilience.HEDGE_DEFAULT_DELAY_SECONDS
+    for duration in range(1, 101):
+        tracker.add(duration / 100)
+    assert tracker.percentile(95) == 0.96
+    assert tracker.hedge_delay() == 0.96
+    tracker.add(0.0)  # окно сдвигается
+    assert tracker.percentile(0) == 0.0
+
+
+def test_fast_call_is_not_hedged():
+    hedger = Hedger()
+    assert hedger.call(lambda: 'ok') == 'ok'
+    assert hedger.stats()['hedged'] == 0
+
+
+def test_slow_call_is_hedged_and_backup_wins(monkeypatch):
+    monkeypatch.setattr(resilience, 'HEDGE_DEFAULT_DELAY_SECONDS', 0.02)
+    release = threading.Event()
+    calls = itertools.count()
+
+    def fetch():
+        if next(calls) == 0:
+            release.wait(2)
+            return 'primary'
+        return 'backup'
+
+    hedger = Hedger()
+    assert hedger.call(fetch) == 'backup'
+    release.set()
+    assert hedger.stats()['hedged'] == 1 and hedger.stats()['hedge_wins'] == 1
+
+
+def test_hedge_survives_one_failed_copy(monkeypatch):
+    monkeypatch.setattr(resilience, 'HEDGE_DEFAULT_DELAY_SECONDS', 0.02)
+    calls = itertools.count()
+
+    def fetch():
+        if next(calls) == 0:
+            time.sleep(0.05)
+            return 'primary'
+        raise RuntimeError("timeout")
+
+    assert Hedger().call(fetch) == 'primary'
+
+    def broken():
+        time.sleep(0.03)
+        raise RuntimeError("down")
+
+    with pytest.raises(RuntimeError):
+        Hedger().call(broken)
+
+
+def test_hedge_latency_excludes_the_governor_wait(monkeypatch):
+    from contextlib import contextmanager
+    from types import SimpleNamespace
+
+    import tour_search
+
+    search = tour_search.TourSearch()
+
+    @contextmanager
+    def slow_slot(priority):
+        time.sleep(0.2)  # очередь ограничителя
+        yield
+
+    monkeypatch.setattr(search.governor, 'slot', slow_slot)
+    monkeypatch.setattr(search.session, 'get', lambda url, **kwargs: SimpleNamespace(status_code=200))
+    monkeypatch.setattr(tour_search, 'HEDGE_ENABLED', False)
+    search._get_result_page('http://tourvisor.test/result.php', tour_search.Priority.INTERACTIVE)
+    assert search.hedger.tracker.percentile(95) < 0.1
+    assert search.hedger._executor._max_workers == search.governor.max_concurrency * 2
@@ -0,0 +1,61 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+FORM = {
+    'departure': '1', 'country': '4,1', 'date_from': '2026-11-01', 'date_to': '2026-11-10',
+    'nights_from': '7', 'nights_to': '10',
+}
+# Снимки в том виде, в каком их собирает fan-out: числа TourVisor - строками
+SNAPSHOT = {
+    'status': {'state': 'searching', 'hotelsfound': '1', 'toursfound': '2', 'minprice': '50000.0', 'progress': '40'},
+    'result': {'hotels': [{
+        'hotelcode': '101', 'hotelname': 'H101', 'hotelstars': '4', 'hotelrating': '4,3', 'price': '50000.0',
+        'tours': [{'tourid': '1', 'nights': '7', 'price': '50000'}],
+    }]},
+    'searches': [{'departure': '1', 'country': '4', 'status': 'done'}],
+}
+FINISHED = dict(SNAPSHOT, status=dict(SNAPSHOT['status'], state='finished', progress='100'))
+
+
+@pytest.fixture
+def client():
+    # Без startup: фоновые задачи и проверка TourVisor тестам не нужны
+    return TestClient(main.app)
+
+
+def test_stream_snapshots_use_the_job_schema(client, monkeypatch):
+    async def stream(params, departures, countries):
+        yield SNAPSHOT
+        yield FINISHED
+
+    monkeypatch.setattr(main.fanout_search, 'stream', stream)
+    response = client.post('/search', data=dict(FORM, stream='true'))
+    lines = [json.loads(line) for line in response.text.splitlines()]
+
+    assert len(lines) == 2
+    hotel = lines[0]['result']['hotels'][0]
+    assert hotel['price'] == 50000 and hotel['hotelstars'] == 4 and hotel['hotelrating'] == 4.3
+    assert hotel['tours'][0]['nights'] == 7
+    assert lines[0]['status']['minprice'] == 50000
+    assert lines[1]['status']['progress'] == 100
+    # Итог потока совпадает с result в ответе GET /jobs/{id}
+    job = main.job_view({'id': 'x', 'status': 'done', 'result': FINISHED})
+    assert json.loads(job.model_dump_json(exclude_none=True))['result'] == lines[1]
+
+
+def test_stream_projects_fields(client, monkeypatch):
+    async def stream(params, departures, countries):
+        yield SNAPSHOT
+
+    monkeypatch.setattr(main.fanout_search, 'stream', stream)
+    response = client.post('/search', data=dict(FORM, stream='true', fields='hotelname,price'))
+    assert json.loads(response.text)['result']['hotels'] == [{'hotelname': 'H101', 'price': 50000}]
+
+
+def test_search_rejects_unknown_codes(client):
+    assert client.post('/search', data=dict(FORM, country='4,999')).json() == {"error": "Неизвестная страна: 999"}
+    assert 'error' in client.post('/search', data=dict(FORM, country='4', stars='7')).json()
@@ -0,0 +1,140 @@
+import asyncio
+import time
+
+import pytest
+
+import search_cache
+from search_cache import RELATIVE_DATES, CacheWarmer, SearchCache, chatbot_dates, current_params, relative_params
+
+DATE_FROM, DATE_TO = chatbot_dates()
+PARAMS = {'departure': '1', 'country': '4', 'datefrom': DATE_FROM, 'dateto': DATE_TO, 'adults': 2}
+RESULTS = {'status': {'state': 'finished'}, 'result': {'hotels': [{'hotelcode': '1', 'price': '50000'}]}}
+
+
+def test_get_set_and_stats():
+    cache = SearchCache()
+    assert cache.get(PARAMS) is None
+    cache.set(PARAMS, RESULTS)
+    assert cache.get(dict(PARAMS, unrelated='x')) == RESULTS
+    assert cache.get(dict(PARAMS, country='1')) is None
+    assert cache.stats() == {'hits': 1, 'misses': 2}
+
+
+def test_filters_change_the_key_only_when_set():
+    assert SearchCache.key(dict(PARAMS, stars='')) == SearchCache.key(PARAMS)
+    assert SearchCache.key(dict(PARAMS, stars='4')) != SearchCache.key(PARAMS)
+
+
+def test_expired_entries_are_a_stale_fallback():
+    cache = SearchCache(ttl=0.01, stale_ttl=60)
+    cache.set(PARAMS, RESULTS)
+    time.sleep(0.02)
+    assert cache.get(PARAMS) is None
+    assert cache.get(PARAMS, allow_stale=True) == RESULTS
+    assert cache.expires_in(PARAMS) == 0
+
+
+def test_chatbot_dates_are_remembered_relative():
+    remembered = relative_params(PARAMS)
+    assert remembered['datefrom'] == remembered['dateto'] == RELATIVE_DATES
+    assert current_params(remembered) == PARAMS
+    fixed = dict(PARAMS, datefrom='2027-01-01')
+    assert relative_params(fixed) == fixed
+
+
+class Search:
+    def __init__(self, results=RESULTS):
+        self.results = results
+        self.calls = []
+
+    async def __call__(self, params):
+        self.calls.append(params)
+        return self.results
+
+
+def test_warmer_ranks_and_selects_due_searches():
+    cache = SearchCache(ttl=100)
+    warmer = CacheWarmer(cache, Search(), top_k=2)
+    for country, count in (('4', 3), ('1', 2), ('5', 1)):
+        for _ in range(count):
+            warmer.record(dict(PARAMS, country=country))
+    assert [count for _, count in warmer.top()] == [3, 2]
+
+    cache.set(dict(PARAMS, country='4'), RESULTS)  # свежий - прогревать рано
+    assert [params['country'] for _, params in warmer.due()] == ['1']
+    assert warmer.due()[0][1]['datefrom'] == DATE_FROM
+
+
+@pytest.fixture
+def fast_warmer(monkeypatch):
+    monkeypatch.setattr(search_cache, 'WARMER_TICK_SECONDS', 0.01)
+
+    def make(search):
+        warmer = CacheWarmer(SearchCache(ttl=100), search)
+        warmer.spacing = 0.01
+        warmer.record(PARAMS)
+        return warmer
+
+    return make
+
+
+async def run_for(warmer, seconds):
+    warmer.start()
+    await asyncio.sleep(seconds)
+    await warmer.stop()
+
+
+def test_warmer_refreshes_popular_search_once(fast_warmer):
+    search = Search()
+    warmer = fast_warmer(search)
+    asyncio.run(run_for(warmer, 0.1))
+    assert len(search.calls) == 1 and warmer.warmed == 1
+    assert warmer.cache.get(PARAMS) == RESULTS
+    assert not warmer.running
+
+
+def test_failed_warmup_backs_off(fast_warmer):
+    search = Search({"error": "Ошибка"})
+    warmer = fast_warmer(search)
+    asyncio.run(run_for(warmer, 0.1))
+    assert len(search.calls) == 1 and warmer.warmed == 0
+    assert warmer.due() == []
+
+
+def test_counts_decay(monkeypatch):
+    monkeypatch.setattr(search_cache, 'WARMER_DECAY_SECONDS', 0)
+    warmer = CacheWarmer(SearchCache(), Search())
+    for _ in range(4):
+        warmer.record(PARAMS)
+    warmer.record(dict(PARAMS, country='1'))
+    warmer._decay()
+    assert [count for _, count in warmer.top()] == [2]
+
+
+def test_refresh_ahead_follows_the_entry_ttl():
+    cache = SearchCache(ttl=900, partial_ttl=120)
+    warmer = CacheWarmer(cache, Search())
+    warmer.record(PARAMS)
+    cache.set(PARAMS, dict(RESULTS, partial=True))  # 120 с из 120 - обновлять рано
+    assert warmer.due() == []
+    assert cache.lifetime(PARAMS)[1:] == (120, True)
+
+
+def test_partial_results_do_not_take_over_the_warmer(fast_warmer):
+    search = Search(dict(RESULTS, partial=True))
+    warmer = fast_warmer(search)
+    warmer.cache.partial_ttl = 0.01  # запись сразу "истекает"
+    for country in ('1', '5'):
+        warmer.record(dict(PARAMS, country=country))
+    asyncio.run(run_for(warmer, 0.2))
+    assert sorted(params['country'] for params in search.calls) == ['1', '4', '5']
+
+
+def test_partial_entries_go_after_missing_ones():
+    cache = SearchCache(ttl=100, partial_ttl=0)
+    warmer = CacheWarmer(cache, Search())
+    for _ in range(3):
+        warmer.record(PARAMS)
+    warmer.record(dict(PARAMS, country='1'))
+    cache.set(PARAMS, dict(RESULTS, partial=True))
+    assert [params['country'] for _, params in warmer.due()] == ['1', '4']
@@ -0,0 +1,95 @@
+import pytest
+
+from reference_data import ReferenceData, ReferenceStore
+from search_cache import SearchCache
+from search_filters import FilterError, build_filters, describe_filters, parse_filters_text
+
+REGIONS = {
+    '10': {'name': 'Анталья', 'country': '4'},
+    '11': {'name': 'Кемер', 'country': '4'},
+    '20': {'name': 'Хургада', 'country': '1'},
+}
+
+
+@pytest.fixture
+def reference():
+    """Built-in tables only, as on a fresh install without list.php snapshot"""
+    return ReferenceData()
+
+
+def test_meal_code_without_snapshot(reference):
+    assert build_filters(reference, ['4'], meal='AI') == {'meal': '8', 'mealbetter': 1}
+    assert build_filters(reference, ['4'], meal='bb') == {'meal': '3', 'mealbetter': 1}
+    assert build_filters(reference, ['4'], meal='8') == {'meal': '8', 'mealbetter': 1}
+
+
+def test_store_without_snapshot_knows_meals(tmp_path):
+    reference = ReferenceStore(path=str(tmp_path / 'missing.json')).current
+    assert build_filters(reference, ['4'], meal='UAI')['meal'] == '9'
+
+
+def test_unknown_meal(reference):
+    with pytest.raises(FilterError):
+        build_filters(reference, ['4'], meal='XX')
+
+
+def test_chatbot_example_builds_filters(reference):
+    choices = parse_filters_text("4*, всё включено, до 150000", reference, ['4'])
+    assert choices == {'stars': 4, 'meal': 'AI', 'price_to': 150000}
+    assert build_filters(reference, ['4'], **choices) == {
+        'stars': 4, 'starsbetter': 1, 'meal': '8', 'mealbetter': 1, 'priceto': 150000
+    }
+
+
+def test_parse_no_filters_and_unrecognized(reference):
+    assert parse_filters_text("Нет", reference, ['4']) == {}
+    assert parse_filters_text("хочу красиво", reference, ['4']) is None
+
+
+def test_parse_rating_is_not_a_price(reference):
+    choices = parse_filters_text("рейтинг от 4.5, от 100 тыс", reference, ['4'])
+    assert choices == {'rating': 4.5, 'price_from': 100000}
+
+
+def test_parse_regions_of_single_country():
+    reference = ReferenceData(regions=REGIONS)
+    assert parse_filters_text("Кемер или Анталья", reference, ['4'])['regions'] == ['10', '11']
+    # Курорты нескольких стран не угадываем
+    assert parse_filters_text("Кемер", reference, ['4', '1']) is None
+
+
+@pytest.mark.parametrize('choices', [
+    {'stars': 7},
+    {'price_from': 200000, 'price_to': 100000},
+    {'rating': 2.0},
+    {'regions': '10'},
+])
+def test_invalid_filters(choices):
+    countries = ['4', '1'] if 'regions' in choices else ['4']
+    with pytest.raises(FilterError):
+        build_filters(ReferenceData(regions=REGIONS), countries, **choices)
+
+
+def test_unknown_region():
+    with pytest.raises(FilterError):
+        build_filters(ReferenceData(regions=REGIONS), ['4'], regions='20')
+
+
+def test_describe_filters(reference):
+    filters = build_filters(reference, ['4'], stars=4, meal='AI', price_to=150000, rating=4.0)
+    assert describe_filters(filters, reference) == (
+        "4★ и выше, питание Всё включено и лучше, до 150 000 ₽, рейтинг от 4.0"
+    )
+
+
+def test_describe_hotels_keeps_unknown_meal_codes(reference):
+    results = {'result': {'hotels': [{'tours': [{'meal': 'AI'}, {'meal': 'XX'}]}]}}
+    tours = reference.describe_hotels(results)['result']['hotels'][0]['tours']
+    assert tours[0]['mealrussian'] == 'Всё включено'
+    assert 'mealrussian' not in tours[1]
+
+
+def test_cache_key_has_filters_only_when_set():
+    params = {'departure': '1', 'country': '4', 'adults': 2}
+    assert SearchCache.key(params) == '1|4|||||2|'
+    assert SearchCache.key(dict(params, stars=4, starsbetter=1, meal=None)) == '1|4|||||2||stars=4|starsbetter=1'
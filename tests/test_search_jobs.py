@@ -0,0 +1,138 @@
+import asyncio
+import time
+
+import pytest
+
+import search_jobs
+from search_cache import SearchCache
+from search_jobs import DONE, ERROR, QUEUED, QueueFullError, SearchJobQueue
+from state_backend import MemoryBackend
+
+PARAMS = {'departure': '1', 'country': '4'}
+RESULTS = {'status': {'state': 'finished'}, 'result': {'hotels': [{'hotelcode': '1', 'price': '50000'}]}}
+
+
+class TourSearch:
+    """create_search_request/get_search_results stand-in"""
+
+    def __init__(self, create=None):
+        self.create = create if create is not None else {'requestid': '42'}
+        self.created = 0
+
+    def create_search_request(self, params):
+        self.created += 1
+        return self.create
+
+    def get_search_results(self, request_id, result_type='result'):
+        if result_type == 'status':
+            return {'status': {'state': 'finished', 'progress': 100}}
+        return {'status': {'state': 'finished'}, 'result': dict(RESULTS['result'])}
+
+
+@pytest.fixture(autouse=True)
+def fast_polls(monkeypatch):
+    monkeypatch.setattr(search_jobs, 'POLL_INTERVAL_SECONDS', 0.001)
+
+
+async def wait_for(jobs, job_id, seconds=2):
+    deadline = time.monotonic() + seconds
+    while jobs.get(job_id)['status'] not in (DONE, ERROR):
+        assert time.monotonic() < deadline
+        await asyncio.sleep(0.01)
+    return jobs.get(job_id)
+
+
+def run_job(jobs, params=PARAMS):
+    async def run():
+        await jobs.start()
+        try:
+            return await wait_for(jobs, jobs.submit(params)['id'])
+        finally:
+            await jobs.stop()
+
+    return asyncio.run(run())
+
+
+def test_job_runs_through_the_worker_pool():
+    stored = []
+    jobs = SearchJobQueue(TourSearch(), workers=2,
+                          on_results=lambda params, results: stored.append(params) or dict(results, stored=True))
+    job = run_job(jobs)
+    assert job['status'] == DONE and job['requestid'] == '42'
+    assert job['result']['stored'] is True and 'partial' not in job['result']
+    assert stored == [PARAMS]
+    assert jobs.stats()['jobs'] == {DONE: 1, ERROR: 0}
+    assert jobs.stats()['poll_terminations'] == {'finished': 1}
+
+
+def test_cached_search_is_done_on_submit():
+    cache = SearchCache()
+    cache.set(PARAMS, RESULTS)
+    tour_search = TourSearch()
+    job = SearchJobQueue(tour_search, cache=cache).submit(PARAMS)
+    assert job['status'] == DONE and job['result'] == RESULTS
+    assert tour_search.created == 0
+
+
+def test_full_queue_is_rejected(monkeypatch):
+    monkeypatch.setattr(search_jobs, 'JOB_QUEUE_SIZE', 1)
+
+    async def run():
+        jobs = SearchJobQueue(TourSearch(), workers=0)
+        await jobs.start()
+        jobs.submit(PARAMS)
+        with pytest.raises(QueueFullError):
+            jobs.submit(PARAMS)
+
+    asyncio.run(run())
+    with pytest.raises(QueueFullError):
+        SearchJobQueue(TourSearch()).submit(PARAMS)  # воркеры не запущены
+
+
+def test_failure_serves_stale_results():
+    cache = SearchCache(ttl=0.01)
+    cache.set(PARAMS, RESULTS)
+    time.sleep(0.02)
+    job = run_job(SearchJobQueue(TourSearch(create={'error': 'limit'}), cache=cache))
+    assert job['status'] == DONE and job['result']['stale'] is True
+
+    job = run_job(SearchJobQueue(TourSearch(create={'error': 'limit'})))
+    assert job['status'] == ERROR and job['error'] == "API вернула ошибку: limit"
+
+
+def test_orphaned_jobs_are_resumed_without_a_new_search():
+    backend = MemoryBackend()
+    crashed = SearchJobQueue(TourSearch(), backend=backend, owner='crashed')
+    job = crashed._new_job(PARAMS)
+    job['requestid'] = '42'
+    crashed._save(job)
+
+    tour_search = TourSearch()
+    leader = SearchJobQueue(tour_search, backend=backend, owner='leader')
+
+    async def run():
+        await leader.start()
+        try:
+            assert leader.resume_orphans() == 1
+            return await wait_for(leader, job['id'])
+        finally:
+            await leader.stop()
+
+    resumed = asyncio.run(run())
+    assert resumed['status'] == DONE and resumed['owner'] == 'leader'
+    assert tour_search.created == 0
+
+
+def test_jobs_of_live_workers_are_not_taken_over():
+    backend = MemoryBackend()
+    alive = SearchJobQueue(TourSearch(), backend=backend, owner='alive')
+    alive.heartbeat()
+    alive._save(alive._new_job(PARAMS))
+
+    async def run():
+        leader = SearchJobQueue(TourSearch(), backend=backend, owner='leader', workers=0)
+        await leader.start()
+        return leader.resume_orphans()
+
+    assert asyncio.run(run()) == 0
+    assert [job['status'] for _, job in backend.items(SearchJobQueue.NAMESPACE)] == [QUEUED]
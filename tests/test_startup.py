@@ -0,0 +1,21 @@
+import json
+import os
+import subprocess
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAZY_MODULES = ('openai', 'pycountry', 'thefuzz')
+
+
+def test_import_main_is_lazy_and_touches_no_files(tmp_path):
+    probe = (
+        f"import json, sys; sys.path.insert(0, {REPO_DIR!r}); import main; "
+        f"print(json.dumps([m for m in {LAZY_MODULES!r} if m in sys.modules]))"
+    )
+    env = dict(os.environ, STATE_BACKEND=f"sqlite:///{tmp_path / 'state' / 'state.db'}",
+               PRICE_HISTORY_DIR=str(tmp_path / 'prices'), PRICE_HISTORY_ENABLED='1')
+    proc = subprocess.run([sys.executable, '-c', probe], cwd=tmp_path, env=env, capture_output=True, text=True)
+    assert proc.returncode == 0, proc.stderr
+    assert json.loads(proc.stdout.strip().splitlines()[-1]) == []
+    # База состояния и история цен создаются при первом обращении, а не при импорте
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,86 @@
+import threading
+import time
+
+import pytest
+
+from state_backend import MemoryBackend, SQLiteBackend, create_backend
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def backend(request, tmp_path):
+    if request.param == 'memory':
+        return MemoryBackend()
+    return SQLiteBackend(str(tmp_path / 'state.db'))
+
+
+def test_get_set_delete(backend):
+    assert backend.get('ns', 'a') is None
+    backend.set('ns', 'a', {'x': [1, 'два']})
+    backend.set('other', 'a', 1)
+    assert backend.get('ns', 'a') == {'x': [1, 'два']}
+    assert backend.items('ns') == [('a', {'x': [1, 'два']})]
+    backend.delete('ns', 'a')
+    assert backend.get('ns', 'a') is None and backend.get('other', 'a') == 1
+
+
+def test_ttl_expiry(backend):
+    backend.set('ns', 'short', 1, ttl=0.05)
+    backend.set('ns', 'long', 2, ttl=60)
+    assert backend.get('ns', 'short') == 1
+    time.sleep(0.06)
+    assert backend.get('ns', 'short') is None
+    assert backend.items('ns') == [('long', 2)]
+    backend.purge_expired()
+    assert backend.get('ns', 'long') == 2
+
+
+def test_incr_is_atomic_across_threads(backend):
+    def bump():
+        for _ in range(50):
+            backend.incr('counters', 'hits')
+
+    threads = [threading.Thread(target=bump) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert backend.incr('counters', 'hits', 0) == 200
+
+
+def test_leader_lease(backend):
+    assert backend.acquire_lease('warmer', 'worker-1', ttl=0.1)
+    assert not backend.acquire_lease('warmer', 'worker-2', ttl=0.1)
+    assert backend.acquire_lease('warmer', 'worker-1', ttl=0.1)  # продление
+    assert backend.acquire_lease('poller', 'worker-2', ttl=0.1)
+    time.sleep(0.12)
+    assert backend.acquire_lease('warmer', 'worker-2', ttl=0.1)
+    assert not backend.acquire_lease('warmer', 'worker-1', ttl=0.1)
+
+
+def test_sqlite_lease_has_one_holder_across_processes(tmp_path):
+    # Каждый воркер uvicorn открывает свой экземпляр на общем файле
+    path = str(tmp_path / 'state.db')
+    workers = [SQLiteBackend(path) for _ in range(5)]
+    holders = []
+    barrier = threading.Barrier(len(workers))
+
+    def contend(index, backend):
+        barrier.wait()
+        if backend.acquire_lease('leader', f"worker-{index}", ttl=30):
+            holders.append(index)
+
+    threads = [threading.Thread(target=contend, args=item) for item in enumerate(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(holders) == 1
+    workers[0].set('ns', 'shared', 'значение')
+    assert workers[1].get('ns', 'shared') == 'значение'
+
+
+def test_create_backend(tmp_path):
+    assert isinstance(create_backend('memory'), MemoryBackend)
+    assert isinstance(create_backend(f"sqlite:///{tmp_path}/state.db"), SQLiteBackend)
+    with pytest.raises(ValueError):
+        create_backend('redis://localhost')
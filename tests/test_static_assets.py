@@ -0,0 +1,67 @@
+import re
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+
+import main
+from static_assets import IMMUTABLE_CACHE, REVALIDATE_CACHE, AssetPipeline
+
+SCRIPT = b"console.log('tour');\n" * 50
+
+
+def request(headers=None):
+    return Request({
+        'type': 'http', 'method': 'GET', 'path': '/', 'query_string': b'',
+        'headers': [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()],
+    })
+
+
+@pytest.fixture
+def pipeline(tmp_path):
+    (tmp_path / 'js').mkdir()
+    (tmp_path / 'js' / 'app.js').write_bytes(SCRIPT)
+    (tmp_path / 'logo.png').write_bytes(b'\x89PNG' + bytes(range(256)))
+    return AssetPipeline(str(tmp_path))
+
+
+def test_fingerprinted_urls_are_immutable(pipeline):
+    url = pipeline.asset_url('js/app.js')
+    assert re.fullmatch(r'/static/js/app\.[0-9a-f]{10}\.js', url)
+    response = pipeline.static_response(request(), url[len('/static/'):])
+    assert response.headers['cache-control'] == IMMUTABLE_CACHE
+    assert response.body == SCRIPT
+    assert pipeline.static_response(request(), 'js/app.js').headers['cache-control'] == REVALIDATE_CACHE
+    assert pipeline.static_response(request(), 'js/missing.js').status_code == 404
+    assert pipeline.asset_url('js/missing.js') == '/static/js/missing.js'
+
+
+def test_precompressed_encodings(pipeline):
+    response = pipeline.static_response(request({'Accept-Encoding': 'gzip, deflate'}), 'js/app.js')
+    assert response.headers['content-encoding'] == 'gzip'
+    assert response.headers['vary'] == 'Accept-Encoding'
+    assert len(response.body) < len(SCRIPT)
+    # Картинки не сжимаются повторно
+    image = pipeline.static_response(request({'Accept-Encoding': 'gzip'}), 'logo.png')
+    assert 'content-encoding' not in image.headers and image.media_type == 'image/png'
+
+
+def test_etag_revalidation_for_any_encoding(pipeline):
+    etag = pipeline.static_response(request(), 'js/app.js').headers['etag']
+    response = pipeline.static_response(request({'If-None-Match': etag, 'Accept-Encoding': 'gzip'}), 'js/app.js')
+    assert response.status_code == 304
+
+
+def test_missing_static_dir_serves_nothing(tmp_path):
+    pipeline = AssetPipeline(str(tmp_path / 'missing'))
+    assert pipeline.static_response(request(), 'app.js').status_code == 404
+    assert pipeline.stats()['assets'] == 0
+
+
+def test_home_page_links_fingerprinted_assets():
+    client = TestClient(main.app)
+    page = client.get('/')
+    assert page.headers['cache-control'] == REVALIDATE_CACHE
+    script = re.search(r'src="(/static/js/app\.[0-9a-f]{10}\.js)"', page.text).group(1)
+    assert client.get(script).headers['cache-control'] == IMMUTABLE_CACHE
+    assert client.get('/', headers={'If-None-Match': page.headers['etag']}).status_code == 304
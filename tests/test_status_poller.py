@@ -0,0 +1,99 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from state_backend import MemoryBackend
+from status_poller import StatusPoller
+
+
+class Upstream:
+    """status.php stand-in that counts calls and answers slowly"""
+
+    def __init__(self, state='searching', delay=0.05):
+        self.state = state
+        self.delay = delay
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, request_id):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        if self.state == 'error':
+            raise RuntimeError("TourVisor 500")
+        return {'status': {'state': self.state, 'requestid': request_id}}
+
+
+def test_concurrent_coroutines_share_one_poll():
+    upstream = Upstream()
+    poller = StatusPoller(upstream, ttl=10)
+
+    async def run():
+        return await asyncio.gather(*(poller.aget('42') for _ in range(20)))
+
+    statuses = asyncio.run(run())
+    assert upstream.calls == 1
+    assert all(status['status']['requestid'] == '42' for status in statuses)
+    assert poller.stats()['shared_calls'] == 19
+
+
+def test_concurrent_threads_share_one_poll():
+    upstream = Upstream()
+    poller = StatusPoller(upstream, ttl=10)
+    statuses = []
+    threads = [threading.Thread(target=lambda: statuses.append(poller.get('42'))) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert upstream.calls == 1 and len(statuses) == 10
+
+
+def test_status_is_polled_again_after_ttl():
+    upstream = Upstream(delay=0)
+    poller = StatusPoller(upstream, ttl=0.05)
+    poller.get('42')
+    poller.get('42')
+    assert upstream.calls == 1
+    time.sleep(0.06)
+    poller.get('42')
+    poller.get('7')
+    assert upstream.calls == 3
+
+
+def test_finished_status_is_kept_longer():
+    upstream = Upstream(state='finished', delay=0)
+    poller = StatusPoller(upstream, ttl=0.01, finished_ttl=60)
+    poller.get('42')
+    time.sleep(0.02)
+    poller.get('42')
+    assert upstream.calls == 1
+
+
+def test_workers_share_polls_through_the_backend():
+    backend = MemoryBackend()
+    upstream = Upstream(delay=0)
+    first, second = StatusPoller(upstream, backend, ttl=10), StatusPoller(upstream, backend, ttl=10)
+    assert first.get('42') == second.get('42')
+    assert upstream.calls == 1
+
+
+def test_failed_poll_reaches_every_waiter_and_is_retried():
+    upstream = Upstream(state='error')
+    poller = StatusPoller(upstream, ttl=0.2)
+
+    async def run():
+        return await asyncio.gather(*(poller.aget('42') for _ in range(5)), return_exceptions=True)
+
+    errors = asyncio.run(run())
+    assert all(isinstance(error, RuntimeError) for error in errors)
+    assert upstream.calls == 1
+
+    upstream.state, upstream.delay = 'searching', 0
+    with pytest.raises(RuntimeError):
+        poller.get('42')  # ошибка живет до конца TTL, как и обычный статус
+    time.sleep(0.2)
+    assert poller.get('42')['status']['state'] == 'searching'
+    assert upstream.calls == 2
@@ -0,0 +1,96 @@
+import asyncio
+
+import fanout
+from governor import Priority
+from search_cache import SearchCache
+from termination import TerminationPolicy, poll_until_done
+
+
+def status(minprice, progress=100, state='searching'):
+    return {'status': {'state': state, 'minprice': minprice, 'progress': progress}}
+
+
+def hotels(*prices, progress=100):
+    return dict(status(min(prices), progress), result={'hotels': [{'price': price} for price in prices]})
+
+
+def test_finished_stops_right_away():
+    assert TerminationPolicy(enabled=False).observe(status(100, state='finished')) == 'finished'
+
+
+def test_disabled_waits_for_finished():
+    policy = TerminationPolicy(enabled=False)
+    assert [policy.observe(status(100)) for _ in range(5)] == [None] * 5
+
+
+def test_stable_minprice_stops_after_stable_polls():
+    policy = TerminationPolicy(stable_polls=2)
+    assert [policy.observe(status(price)) for price in (120, 100, 100, 100)] == [None, None, None, 'stable']
+
+
+def test_converged_on_small_gains():
+    policy = TerminationPolicy(stable_polls=2, min_gain=0.01)
+    assert [policy.observe(status(price)) for price in (1000, 998, 996)] == [None, None, 'converged']
+
+
+def test_stability_before_min_progress_does_not_stop():
+    policy = TerminationPolicy(stable_polls=2, min_progress=50)
+    reasons = [policy.observe(status(100, progress)) for progress in (10, 20, 30, 40, 60)]
+    assert reasons == [None, None, None, None, 'stable']
+    # Без прогресса в статусе - только state=finished
+    policy = TerminationPolicy(stable_polls=2, min_progress=50)
+    assert [policy.observe({'status': {'minprice': 100}}) for _ in range(4)] == [None] * 4
+
+
+def test_top_n_needs_all_prices():
+    policy = TerminationPolicy(top_n=3, stable_polls=1)
+    assert policy.observe(hotels(100, 110)) is None
+    assert policy.observe(hotels(100, 110)) is None
+    assert policy.observe(hotels(100, 110, 120)) is None
+    assert policy.observe(hotels(100, 110, 120, 130)) == 'stable'
+
+
+def test_poll_until_done_timeout():
+    async def poll():
+        return status(100, progress=0)
+
+    snapshot, reason = asyncio.run(poll_until_done(poll, TerminationPolicy(), 0.001, 0.02))
+    assert reason == 'timeout' and snapshot['status']['minprice'] == 100
+
+
+class FakeTourSearch:
+    """create_search_request/get_search_results with a fixed status sequence"""
+
+    def __init__(self, statuses):
+        self.statuses = list(statuses)
+
+    def create_search_request(self, params, priority=None):
+        return {'requestid': '42'}
+
+    def get_search_results(self, request_id, result_type='result', priority=None):
+        if result_type == 'status':
+            return self.statuses.pop(0) if len(self.statuses) > 1 else self.statuses[0]
+        return hotels(100, 110)
+
+
+def test_early_stopped_results_are_partial(monkeypatch):
+    monkeypatch.setattr(fanout, 'RESULT_POLL_INTERVAL_SECONDS', 0.001)
+    stopped = asyncio.run(fanout.run_search(FakeTourSearch([status(100)] * 5), {}, wait=1))
+    finished = asyncio.run(fanout.run_search(FakeTourSearch([status(100, state='finished')]), {}, wait=1))
+    assert stopped['partial'] is True
+    assert 'partial' not in finished
+
+
+def test_background_search_waits_for_finished(monkeypatch):
+    monkeypatch.setattr(fanout, 'RESULT_POLL_INTERVAL_SECONDS', 0.001)
+    statuses = [status(100)] * 10 + [status(100, state='finished')]
+    results = asyncio.run(fanout.run_search(FakeTourSearch(statuses), {}, priority=Priority.BACKGROUND))
+    assert 'partial' not in results
+
+
+def test_partial_results_get_a_short_ttl():
+    cache = SearchCache(ttl=900, partial_ttl=60)
+    cache.set({'country': '4'}, hotels(100))
+    cache.set({'country': '1'}, dict(hotels(100), partial=True))
+    assert 850 < cache.expires_in({'country': '4'}) <= 900
+    assert 0 < cache.expires_in({'country': '1'}) <= 60
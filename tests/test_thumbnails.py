@@ -0,0 +1,157 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from starlette.requests import Request
+
+import thumbnails
+from thumbnails import DiskLRU, ImageFetchError, ThumbnailProxy, fetch_image
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'\0' * 100
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, body=PNG, location=None):
+        self.status_code = status_code
+        self.body = body
+        self.headers = {'location': location} if location else {}
+        self.is_redirect = location is not None and status_code in (301, 302, 303, 307, 308)
+
+    def iter_content(self, size):
+        for start in range(0, len(self.body), size):
+            yield self.body[start:start + size]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """url -> FakeResponse; requested urls are recorded"""
+    responses = {}
+    requested = []
+
+    def get(url, timeout, stream, allow_redirects=True):
+        assert allow_redirects is False
+        requested.append(url)
+        return responses[url]
+
+    monkeypatch.setattr(thumbnails.requests, 'get', get)
+    return responses, requested
+
+
+def request(headers=None):
+    return Request({
+        'type': 'http', 'method': 'GET', 'path': '/thumbnails', 'query_string': b'',
+        'headers': [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()],
+    })
+
+
+@pytest.mark.parametrize('url, allowed', [
+    ('https://static.tourvisor.ru/hotel.jpg', True),
+    ('http://tourvisor.ru/hotel.jpg', True),
+    ('https://tourvisor.ru.evil.com/hotel.jpg', False),
+    ('https://nottourvisor.ru/hotel.jpg', False),
+    ('ftp://tourvisor.ru/hotel.jpg', False),
+    ('http://127.0.0.1/hotel.jpg', False),
+    ('', False),
+])
+def test_allowed_hosts(url, allowed):
+    assert ThumbnailProxy(hosts=('tourvisor.ru',)).allowed(url) is allowed
+
+
+def test_redirect_to_disallowed_host_is_rejected(upstream):
+    responses, requested = upstream
+    responses['https://tourvisor.ru/a.jpg'] = FakeResponse(302, location='http://169.254.169.254/latest/meta-data')
+    proxy = ThumbnailProxy(hosts=('tourvisor.ru',))
+    with pytest.raises(ImageFetchError):
+        proxy.fetch('https://tourvisor.ru/a.jpg')
+    assert requested == ['https://tourvisor.ru/a.jpg']
+
+
+def test_redirect_within_allowed_hosts_is_followed(upstream):
+    responses, requested = upstream
+    responses['https://tourvisor.ru/a.jpg'] = FakeResponse(301, location='/b.jpg')
+    responses['https://tourvisor.ru/b.jpg'] = FakeResponse(302, location='https://static.tourvisor.ru/c.jpg')
+    responses['https://static.tourvisor.ru/c.jpg'] = FakeResponse()
+    proxy = ThumbnailProxy(hosts=('tourvisor.ru',))
+    assert proxy.fetch('https://tourvisor.ru/a.jpg') == PNG
+    assert requested[-1] == 'https://static.tourvisor.ru/c.jpg'
+
+
+def test_redirect_loop(upstream):
+    responses, _ = upstream
+    responses['https://tourvisor.ru/a.jpg'] = FakeResponse(302, location='/a.jpg')
+    with pytest.raises(ImageFetchError):
+        fetch_image('https://tourvisor.ru/a.jpg')
+
+
+def test_size_cap_and_errors(upstream):
+    responses, _ = upstream
+    responses['https://tourvisor.ru/big.jpg'] = FakeResponse(body=PNG * 100)
+    responses['https://tourvisor.ru/missing.jpg'] = FakeResponse(404)
+    with pytest.raises(ImageFetchError):
+        fetch_image('https://tourvisor.ru/big.jpg', max_bytes=1000)
+    with pytest.raises(ImageFetchError):
+        fetch_image('https://tourvisor.ru/missing.jpg')
+
+
+def test_disk_lru_eviction(tmp_path):
+    cache = DiskLRU(str(tmp_path), max_bytes=250)
+    cache.put('a', b'a' * 100)
+    time.sleep(0.01)
+    cache.put('b', b'b' * 100)
+    assert cache.get('a') == b'a' * 100  # 'a' становится самым свежим
+    cache.put('c', b'c' * 100)
+    assert cache.get('b') is None
+    assert cache.get('a') is not None and cache.get('c') is not None
+    assert cache.stats()['evictions'] == 1
+    # Индекс восстанавливается с диска в новом процессе
+    assert DiskLRU(str(tmp_path), max_bytes=250).stats()['files'] == 2
+
+
+def test_concurrent_requests_share_one_fetch(tmp_path):
+    release = threading.Event()
+    calls = []
+
+    def fetch(url):
+        calls.append(url)
+        release.wait(5)
+        return PNG
+
+    proxy = ThumbnailProxy(fetch=fetch, cache=DiskLRU(str(tmp_path)), hosts=('tourvisor.ru',))
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(proxy.get('https://tourvisor.ru/a.jpg', 320)))
+        for _ in range(10)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert calls == ['https://tourvisor.ru/a.jpg']
+    assert results == [(PNG, 'image/png')] * 10
+    # Следующий запрос - из кэша на диске
+    proxy.get('https://tourvisor.ru/a.jpg', 320)
+    assert len(calls) == 1
+
+
+def test_response_statuses(tmp_path):
+    def fetch(url):
+        if 'broken' in url:
+            raise ImageFetchError("HTTP 500")
+        return b'not an image'
+
+    proxy = ThumbnailProxy(fetch=fetch, cache=DiskLRU(str(tmp_path)), hosts=('tourvisor.ru',))
+    assert asyncio.run(proxy.response(request(), 'http://127.0.0.1/a.jpg')).status_code == 400
+    assert asyncio.run(proxy.response(request(), 'https://tourvisor.ru/broken.jpg')).status_code == 502
+    assert asyncio.run(proxy.response(request(), 'https://tourvisor.ru/text.jpg')).status_code == 502
+    etag = proxy.etag('https://tourvisor.ru/a.jpg', 640)
+    response = asyncio.run(proxy.response(request({'If-None-Match': etag}), 'https://tourvisor.ru/a.jpg', 640))
+    assert response.status_code == 304
@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+
+import tracing
+from tracing import NDJSONExporter, critical_path, load_traces, parse_traceparent, span, summarize, traceparent
+
+
+@pytest.fixture
+def traces(tmp_path, monkeypatch):
+    path = tmp_path / 'traces.ndjson'
+    monkeypatch.setattr(tracing, 'TRACING_ENABLED', True)
+    monkeypatch.setattr(tracing, 'exporter', NDJSONExporter(str(path)))
+    return lambda: load_traces(str(path))
+
+
+def record(name, span_id, parent, start, ms):
+    return {'trace': 't', 'span': span_id, 'parent': parent, 'name': name, 'start': start, 'ms': ms}
+
+
+def test_disabled_tracing_is_a_no_op():
+    with span('chat.turn') as current:
+        current.set(channel='web')
+        assert tracing.current_context() is None and traceparent() is None
+
+
+def test_nested_spans_share_a_trace(traces):
+    with span('chat.turn', channel='web'):
+        with span('tourvisor.search') as search:
+            search.set(country='4')
+    with pytest.raises(ValueError):
+        with span('openai.chat'):
+            raise ValueError("boom")
+
+    (turn, failed) = sorted(traces().values(), key=len, reverse=True)
+    child, parent = turn
+    assert child['parent'] == parent['span'] and parent['parent'] is None
+    assert child['attrs'] == {'country': '4'} and parent['attrs'] == {'channel': 'web'}
+    assert failed[0]['error'] == 'ValueError'
+
+
+def test_trace_continues_in_tasks_and_over_traceparent(traces):
+    async def turn():
+        with span('chat.turn'):
+            header = traceparent()
+
+            async def job():
+                with span('search.job'):
+                    pass
+
+            await asyncio.create_task(job())
+        with span('gateway.message', parent=parse_traceparent(header)):
+            pass
+
+    asyncio.run(turn())
+    (spans,) = traces().values()
+    assert {s['name'] for s in spans} == {'chat.turn', 'search.job', 'gateway.message'}
+    root = next(s for s in spans if s['name'] == 'chat.turn')
+    assert all(s['parent'] == root['span'] for s in spans if s is not root)
+
+
+@pytest.mark.parametrize('header', [None, '', '00-abc-def-01', 'garbage'])
+def test_bad_traceparent_starts_a_new_trace(header):
+    assert parse_traceparent(header) is None
+
+
+def test_critical_path_follows_the_last_finishing_child():
+    spans = [
+        record('chat.turn', 'a', None, 0.0, 1000),
+        record('openai.chat', 'b', 'a', 0.1, 300),     # 0.1 .. 0.4
+        record('tourvisor.search', 'c', 'a', 0.2, 700),  # 0.2 .. 0.9, параллельно с openai
+        record('search.job', 'd', 'a', 0.5, 5000),     # пережил родителя - отдельный корень
+    ]
+    stages = critical_path(spans)
+    assert stages['tourvisor.search'] == pytest.approx(700)
+    assert stages['chat.turn'] == pytest.approx(300)
+    assert stages['search.job'] == pytest.approx(5000)
+    assert 'openai.chat' not in stages
+
+
+def test_summarize_ranks_stages_by_share():
+    traces = {'t': [record('chat.turn', 'a', None, 0.0, 100), record('tourvisor.search', 'b', 'a', 0.0, 90)]}
+    rows = summarize(traces)
+    assert [row[0] for row in rows] == ['tourvisor.search', 'chat.turn']
+    assert rows[0][4] == pytest.approx(0.9)
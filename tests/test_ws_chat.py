@@ -0,0 +1,89 @@
+import asyncio
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from ws_chat import ChatConnection, SlowConsumerError, hotel_batches
+
+RESULTS = {
+    'status': {'state': 'finished', 'hotelsfound': '12'},
+    'result': {'hotels': [{'hotelcode': str(code), 'hotelname': f"H{code}", 'price': '50000'} for code in range(12)]},
+}
+
+
+class Socket:
+    """Records what the sender writes"""
+
+    def __init__(self):
+        self.sent = []
+
+    async def send_text(self, text):
+        self.sent.append(text)
+
+
+def test_hotel_batches():
+    assert hotel_batches(list(range(25)), size=10) == [list(range(10)), list(range(10, 20)), list(range(20, 25))]
+    assert hotel_batches([]) == [[]]
+
+
+def test_progress_is_dropped_but_replies_wait():
+    async def run():
+        connection = ChatConnection(Socket(), queue_size=2, send_timeout=0.02)
+        assert connection.offer({'type': 'progress'})
+        await connection.send({'type': 'message'})
+        assert not connection.offer({'type': 'progress'})
+        with pytest.raises(SlowConsumerError):
+            await connection.send({'type': 'message'})
+        return connection
+
+    assert asyncio.run(run()).dropped == 1
+
+
+def test_sender_writes_compact_json_in_order():
+    async def run():
+        socket = Socket()
+        connection = ChatConnection(socket)
+        sender = asyncio.create_task(connection.run_sender())
+        await connection.send({'type': 'message', 'message': 'Привет'})
+        connection.offer({'type': 'progress'})
+        await asyncio.sleep(0.01)
+        sender.cancel()
+        return socket.sent
+
+    assert asyncio.run(run()) == ['{"type":"message","message":"Привет"}', '{"type":"progress"}']
+
+
+def test_finished_job_is_pushed_as_hotel_batches(monkeypatch):
+    jobs = iter([
+        {'id': 'j1', 'status': 'running', 'progress': {'progress': 40}},
+        {'id': 'j1', 'status': 'running', 'progress': {'progress': 40}},
+        {'id': 'j1', 'status': 'done', 'result': RESULTS},
+    ])
+    monkeypatch.setattr(main.search_jobs, 'get', lambda job_id: next(jobs))
+    monkeypatch.setattr(main, 'WS_JOB_POLL_SECONDS', 0)
+    monkeypatch.setattr(main, 'PRICE_WATCH_ENABLED', False)
+
+    async def run():
+        connection = ChatConnection(Socket())
+        await main.watch_search(connection, 'j1', fields='hotelname')
+        return [connection._queue.get_nowait() for _ in range(connection._queue.qsize())]
+
+    events = [json.loads(text) for text in asyncio.run(run())]
+    types = [event['type'] for event in events]
+    assert types == ['progress', 'message', 'hotels', 'hotels']
+    assert [len(event['hotels']) for event in events[2:]] == [10, 2]
+    assert events[2]['status']['hotelsfound'] == 12 and 'status' not in events[3]
+    assert events[3]['final'] is True and events[2]['hotels'][0] == {'hotelname': 'H0'}
+
+
+def test_socket_dialog_and_reset(monkeypatch):
+    monkeypatch.setattr(main, 'PRICE_WATCH_ENABLED', False)
+    client = TestClient(main.app)
+    with client.websocket_connect('/ws/chat') as websocket:
+        websocket.send_json({'type': 'message', 'text': 'привет'})
+        greeting = websocket.receive_json()
+        assert greeting['type'] == 'message' and greeting['message']
+        websocket.send_json({'type': 'reset'})
+        assert websocket.receive_json()['type'] == 'reset'
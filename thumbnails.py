@@ -0,0 +1,302 @@
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from functools import partial
+from io import BytesIO
+from urllib.parse import urljoin, urlsplit
+
+import requests
+from fastapi.responses import JSONResponse, Response
+from starlette.datastructures import Headers
+
+try:
+    from PIL import Image
+except ImportError:  # без Pillow картинки кэшируются и отдаются без уменьшения
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_DIR = os.getenv(
+    "THUMBNAIL_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "thumbnails")
+)
+# Предел размера кэша на диске (исходники и превью вместе)
+THUMBNAIL_CACHE_MB = int(os.getenv("THUMBNAIL_CACHE_MB", "200"))
+# Картинки загружаются только с этих хостов (и их поддоменов)
+THUMBNAIL_HOSTS = tuple(host.strip() for host in os.getenv("THUMBNAIL_HOSTS", "tourvisor.ru").split(",") if host.strip())
+# Разрешенные ширины превью: запрошенная округляется вверх до ближайшей
+THUMBNAIL_WIDTHS = (160, 320, 640, 960)
+THUMBNAIL_DEFAULT_WIDTH = 640
+THUMBNAIL_QUALITY = 80
+IMAGE_FETCH_TIMEOUT_SECONDS = 10
+# Исходники больше этого не загружаются
+IMAGE_MAX_BYTES = 10 * 1024 * 1024
+IMAGE_MAX_REDIRECTS = 3
+# Превью по одному адресу не меняются: храним у клиента месяц
+THUMBNAIL_CACHE_CONTROL = "public, max-age=2592000, immutable"
+
+INVALID_URL_MESSAGE = "Недопустимый адрес изображения"
+FETCH_FAILED_MESSAGE = "Не удалось загрузить изображение"
+
+IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF8', 'image/gif'),
+    (b'RIFF', 'image/webp'),
+)
+
+
+class ImageFetchError(Exception):
+    pass
+
+
+def image_type(data):
+    """Media type from the file signature, None if it is not an image we serve"""
+    for signature, media_type in IMAGE_SIGNATURES:
+        if data.startswith(signature):
+            if media_type == 'image/webp' and data[8:12] != b'WEBP':
+                return None
+            return media_type
+    return None
+
+
+def fetch_image(url, allowed=None, timeout=IMAGE_FETCH_TIMEOUT_SECONDS, max_bytes=IMAGE_MAX_BYTES):
+    """Image bytes from `url`; raises ImageFetchError
+
+    Redirects are followed by hand: every next address must pass `allowed(url)`,
+    otherwise a redirect of an allowed host could lead the proxy anywhere.
+    """
+    try:
+        for _ in range(IMAGE_MAX_REDIRECTS + 1):
+            with requests.get(url, timeout=timeout, stream=True, allow_redirects=False) as response:
+                if response.is_redirect:
+                    url = urljoin(url, response.headers['location'])
+                    if allowed is not None and not allowed(url):
+                        raise ImageFetchError(f"redirect to a disallowed address {url}")
+                    continue
+                if response.status_code != 200:
+                    raise ImageFetchError(f"HTTP {response.status_code}")
+                data = bytearray()
+                for chunk in response.iter_content(64 * 1024):
+                    data += chunk
+                    if len(data) > max_bytes:
+                        raise ImageFetchError(f"image larger than {max_bytes} bytes")
+                return bytes(data)
+        raise ImageFetchError(f"more than {IMAGE_MAX_REDIRECTS} redirects")
+    except requests.RequestException as e:
+        raise ImageFetchError(str(e)) from e
+
+
+def resize(data, width, quality=THUMBNAIL_QUALITY):
+    """(JPEG bytes, 'image/jpeg') no wider than `width`; the original when Pillow is unavailable"""
+    if Image is None:
+        return data, image_type(data)
+    try:
+        with Image.open(BytesIO(data)) as image:
+            # JPEG декодируется сразу в уменьшенном масштабе
+            image.draft('RGB', (width, width * 4))
+            image = image.convert('RGB')
+            image.thumbnail((width, width * 4))
+            output = BytesIO()
+            image.save(output, 'JPEG', quality=quality, optimize=True, progressive=True)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Failed to resize image: {e}")
+        return data, image_type(data)
+    return output.getvalue(), 'image/jpeg'
+
+
+class DiskLRU:
+    """Files in one directory, least recently used removed above max_bytes
+
+    Recency is the file mtime, so the order survives restarts; each worker
+    keeps its own index and tolerates files removed by another one.
+    """
+
+    def __init__(self, directory=THUMBNAIL_DIR, max_bytes=THUMBNAIL_CACHE_MB * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._index = None  # name -> size, от старых к новым
+        self.size = 0
+        self.evictions = 0
+
+    def _load(self):
+        if self._index is not None:
+            return
+        self._index = OrderedDict()
+        self.size = 0
+        try:
+            entries = [entry for entry in os.scandir(self.directory) if entry.is_file() and not entry.name.endswith('.tmp')]
+        except FileNotFoundError:
+            return
+        for entry in sorted(entries, key=lambda entry: entry.stat().st_mtime):
+            self._index[entry.name] = entry.stat().st_size
+            self.size += entry.stat().st_size
+
+    def get(self, name):
+        with self._lock:
+            self._load()
+            if name not in self._index:
+                return None
+            self._index.move_to_end(name)
+        path = os.path.join(self.directory, name)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.size -= self._index.pop(name, 0)
+            return None
+        return data
+
+    def put(self, name, data):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, name)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._load()
+            self.size += len(data) - self._index.pop(name, 0)
+            self._index[name] = len(data)
+            while self.size > self.max_bytes and len(self._index) > 1:
+                oldest, size = self._index.popitem(last=False)
+                self.size -= size
+                self.evictions += 1
+                try:
+                    os.remove(os.path.join(self.directory, oldest))
+                except FileNotFoundError:
+                    pass
+
+    def stats(self):
+        with self._lock:
+            self._load()
+            return {'files': len(self._index), 'bytes': self.size, 'max_bytes': self.max_bytes,
+                    'evictions': self.evictions}
+
+
+class ThumbnailProxy:
+    """Hotel picture thumbnails: each source fetched once, kept in a DiskLRU
+
+    Concurrent requests for the same thumbnail (or the same source picture)
+    share one fetch/resize. `fetch(url) -> bytes` is injectable, so a local
+    stand-in can serve the images; the default one re-checks the allowed hosts
+    on every redirect.
+    """
+
+    def __init__(self, fetch=None, cache=None, hosts=THUMBNAIL_HOSTS, widths=THUMBNAIL_WIDTHS):
+        self.fetch = fetch if fetch is not None else partial(fetch_image, allowed=self.allowed)
+        self.cache = cache if cache is not None else DiskLRU()
+        self.hosts = hosts
+        self.widths = widths
+        self._lock = threading.Lock()
+        self._inflight = {}  # cache file name -> Future
+        self.hits = 0
+        self.misses = 0
+        self.fetches = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    def allowed(self, url):
+        parts = urlsplit(url or '')
+        host = (parts.hostname or '').lower()
+        if parts.scheme not in ('http', 'https') or not host:
+            return False
+        return any(host == allowed or host.endswith(f".{allowed}") for allowed in self.hosts)
+
+    def width_for(self, width):
+        for allowed in self.widths:
+            if width <= allowed:
+                return allowed
+        return self.widths[-1]
+
+    def _shared(self, name, produce):
+        """Cached bytes of `name`, produced once however many callers want it"""
+        data = self.cache.get(name)
+        if data is not None:
+            self.hits += 1
+            return data
+        with self._lock:
+            future = self._inflight.get(name)
+            owner = future is None
+            if owner:
+                future = self._inflight[name] = Future()
+            else:
+                self.coalesced += 1
+        if not owner:
+            return future.result()
+        try:
+            # Предыдущий владелец мог закончить между проверкой кэша и захватом
+            data = self.cache.get(name)
+            if data is None:
+                self.misses += 1
+                data = produce()
+                self.cache.put(name, data)
+            future.set_result(data)
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                del self._inflight[name]
+        return future.result()
+
+    def _source(self, url, key):
+        def download():
+            self.fetches += 1
+            started = time.monotonic()
+            data = self.fetch(url)
+            if image_type(data) is None:
+                raise ImageFetchError("not an image")
+            logger.info(f"Fetched image {url} ({len(data)} bytes) in {time.monotonic() - started:.2f}s")
+            return data
+        return self._shared(f"{key}.src", download)
+
+    def _key(self, url):
+        return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+    def etag(self, url, width):
+        return f'"{self._key(url)[:16]}-{self.width_for(width)}"'
+
+    def get(self, url, width):
+        """(body, media type) of the thumbnail, blocking; raises ImageFetchError"""
+        width = self.width_for(width)
+        key = self._key(url)
+        if Image is None:
+            body = self._source(url, key)
+            return body, image_type(body)
+        body = self._shared(f"{key}-{width}.thumb", lambda: resize(self._source(url, key), width)[0])
+        return body, image_type(body)
+
+    async def response(self, request, url, width=THUMBNAIL_DEFAULT_WIDTH):
+        """Thumbnail response; 400 for URLs outside the allowed hosts, 502 when the source fails"""
+        if not self.allowed(url):
+            return JSONResponse(status_code=400, content={"error": INVALID_URL_MESSAGE})
+        headers = {'ETag': self.etag(url, width), 'Cache-Control': THUMBNAIL_CACHE_CONTROL}
+        # Превью по адресу неизменно - проверять кэш и источник не нужно
+        if headers['ETag'] in Headers(scope=request.scope).get('if-none-match', ''):
+            return Response(status_code=304, headers=headers)
+        try:
+            body, media_type = await asyncio.get_running_loop().run_in_executor(None, self.get, url, width)
+        except (ImageFetchError, OSError) as e:
+            self.errors += 1
+            logger.error(f"Thumbnail of {url} failed: {e}")
+            return JSONResponse(status_code=502, content={"error": FETCH_FAILED_MESSAGE})
+        return Response(body, media_type=media_type, headers=headers)
+
+    def stats(self):
+        return {
+            'resize': Image is not None,
+            'hits': self.hits,
+            'misses': self.misses,
+            'fetches': self.fetches,
+            'coalesced': self.coalesced,
+            'errors': self.errors,
+            'disk': self.cache.stats(),
+        }
@@ -0,0 +1,359 @@
+import logging
+import os
+import time
+import xml.etree.ElementTree as ET
+from datetime import datetime, timedelta
+from urllib.parse import urlencode
+
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+from governor import UpstreamGovernor, Priority, GovernorTimeout
+from resilience import CircuitBreaker, CircuitOpenError, Hedger, HEDGE_ENABLED
+from search_filters import FILTER_FIELDS
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+TOURVISOR_LOGIN = os.getenv("TOURVISOR_LOGIN")
+TOURVISOR_PASS = os.getenv("TOURVISOR_PASS")
+TOURVISOR_BASE_URL = "http://tourvisor.ru/xml"
+# Таймауты (соединение, чтение) для запросов к TourVisor
+SEARCH_TIMEOUT = (5, 30)
+RESULT_TIMEOUT = (5, 15)
+
+
+class TourSearch:
+    def __init__(self, governor=None):
+        self.base_url = TOURVISOR_BASE_URL
+        self.auth = {
+            'authlogin': TOURVISOR_LOGIN,
+            'authpass': TOURVISOR_PASS
+        }
+        # Все запросы к TourVisor проходят через общий ограничитель
+        self.governor = governor or UpstreamGovernor()
+        # Быстрый отказ при деградации TourVisor и хеджирование чтений result.php
+        self.breaker = CircuitBreaker()
+        # Основной запрос и хедж на каждый слот ограничителя
+        self.hedger = Hedger(max_workers=self.governor.max_concurrency * 2)
+        # Keep-alive соединения с TourVisor, общие для всех каналов (веб, Instagram, WhatsApp)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.governor.max_concurrency * 2)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        logger.info(f"Initialized TourSearch with login: {TOURVISOR_LOGIN}")
+
+    def _get(self, url, priority=Priority.INTERACTIVE, tracker=None, **kwargs):
+        """GET to TourVisor within the governor's limits, guarded by the circuit breaker
+
+        `tracker` receives the duration of the HTTP call itself, without the wait for a slot.
+        """
+        self.breaker.before_call()
+        try:
+            with self.governor.slot(priority):
+                started = time.monotonic()
+                ok = False
+                try:
+                    response = self.session.get(url, verify=False, **kwargs)
+                    ok = response.status_code < 500
+                    if tracker is not None:
+                        tracker.add(time.monotonic() - started)
+                    return response
+                finally:
+                    self.breaker.record(time.monotonic() - started, ok)
+        except GovernorTimeout:
+            # Запрос так и не ушел в TourVisor - это не сбой апстрима
+            self.breaker.cancel()
+            raise
+
+    def _get_result_page(self, url, priority):
+        """Idempotent result.php read, hedged when slower than the p95 latency"""
+        def timed_get():
+            return self._get(url, priority, tracker=self.hedger.tracker, timeout=RESULT_TIMEOUT)
+
+        if HEDGE_ENABLED:
+            return self.hedger.call(timed_get)
+        return timed_get()
+
+    def test_connection(self):
+        """Test API connection with credentials"""
+        now = datetime.now()
+        date_from = f"{now.day:02d}.{now.month:02d}.{now.year}"
+        date_to = (now + timedelta(days=7))
+        date_to = f"{date_to.day:02d}.{date_to.month:02d}.{date_to.year}"
+        
+        url = (
+            f"{self.base_url}/search.php"
+            f"?authlogin={self.auth['authlogin']}"
+            f"&authpass={self.auth['authpass']}"
+            f"&departure=1"  # Moscow
+            f"&country=1"    # Egypt
+            f"&datefrom={date_from}"
+            f"&dateto={date_to}"
+            f"&nightsfrom=7"
+            f"&nightsto=14"
+            f"&adults=2"
+            f"&child=0"
+        )
+        
+        try:
+            logger.info(f"Testing connection with URL: {url}")
+            response = self._get(url, Priority.BACKGROUND, timeout=SEARCH_TIMEOUT)
+            logger.info(f"Test connection response: {response.text}")
+            if response.status_code != 200:
+                logger.error(f"API test failed with status code: {response.status_code}")
+            if 'error' in response.text.lower():
+                logger.error(f"API test failed with error: {response.text}")
+        except Exception as e:
+            logger.error(f"API test connection failed: {e}")
+
+    def _parse_xml_to_dict(self, element):
+        """Рекурсивно преобразует XML элемент в словарь"""
+        result = {}
+        for child in element:
+            if len(child) > 0:
+                if child.tag == 'tours':
+                    result[child.tag] = [self._parse_xml_to_dict(tour) for tour in child]
+                else:
+                    result[child.tag] = self._parse_xml_to_dict(child)
+            else:
+                result[child.tag] = child.text
+        return result
+
+    def create_search_request(self, params, priority=Priority.INTERACTIVE):
+        """Создает поисковый запрос в системе Tourvisor"""
+        try:
+            # Convert and validate dates
+            try:
+                # Parse input dates
+                date_from = datetime.strptime(params['datefrom'], '%Y-%m-%d')
+                date_to = datetime.strptime(params['dateto'], '%Y-%m-%d')
+                
+                # Format dates in simple format (dd.mm.yyyy without URL encoding)
+                date_from_str = f"{date_from.day:02d}.{date_from.month:02d}.{date_from.year}"
+                date_to_str = f"{date_to.day:02d}.{date_to.month:02d}.{date_to.year}"
+                
+                logger.info(f"Converted dates: from {date_from_str} to {date_to_str}")
+            except ValueError as e:
+                logger.error(f"Date parsing error: {e}")
+                return {"error": "Неверный формат даты"}
+            
+            # Construct URL directly without using urlencode
+            url = (
+                f"{self.base_url}/search.php"
+                f"?authlogin={self.auth['authlogin']}"
+                f"&authpass={self.auth['authpass']}"
+                f"&departure={params['departure']}"
+                f"&country={params['country']}"
+                f"&datefrom={date_from_str}"
+                f"&dateto={date_to_str}"
+                f"&nightsfrom={params['nightsfrom']}"
+                f"&nightsto={params['nightsto']}"
+                f"&adults={params['adults']}"
+                f"&child={params['child']}"
+            )
+            # Фильтры (звезды, питание, курорты, цена, рейтинг) применяет сам TourVisor
+            for name in FILTER_FIELDS:
+                if params.get(name) not in (None, ''):
+                    url += f"&{name}={params[name]}"
+            
+            logger.info(f"Sending request to URL: {url}")
+            
+            # Make request
+            response = self._get(url, priority, timeout=SEARCH_TIMEOUT)
+            logger.info(f"Response status code: {response.status_code}")
+            logger.info(f"Response headers: {response.headers}")
+            logger.info(f"Raw response text: {response.text}")
+            
+            if response.status_code != 200:
+                logger.error(f"API returned non-200 status code: {response.status_code}")
+                return None
+            
+            # Check if response is empty
+            if not response.text.strip():
+                logger.error("Empty response received from API")
+                return None
+            
+            # Parse XML response
+            try:
+                root = ET.fromstring(response.text)
+                
+                # Check for error first
+                error_elem = root.find('.//errormessage')
+                if error_elem is not None:
+                    error_text = error_elem.text
+                    logger.error(f"API returned error: {error_text}")
+                    return {"error": error_text}
+                
+                request_id_elem = root.find('.//requestid')
+                if request_id_elem is not None:
+                    request_id = request_id_elem.text
+                    logger.info(f"Successfully parsed request ID from XML: {request_id}")
+                    return {'requestid': request_id}
+                else:
+                    logger.error("No requestid element found in XML response")
+                    return None
+                    
+            except ET.ParseError as e:
+                logger.error(f"Failed to parse XML: {e}")
+                logger.error(f"XML content: {response.text}")
+                return None
+                
+        except CircuitOpenError:
+            logger.warning("TourVisor circuit is open, search request rejected")
+            return {"error": "TourVisor временно недоступен, попробуйте позже"}
+        except requests.exceptions.RequestException as e:
+            logger.error(f"API request error: {e}")
+            logger.error(f"Response content: {response.text if 'response' in locals() else 'No response'}")
+            return None
+        except Exception as e:
+            logger.error(f"Unexpected error: {e}")
+            logger.error(f"Error type: {type(e)}")
+            import traceback
+            logger.error(f"Traceback: {traceback.format_exc()}")
+            return None
+
+    def get_search_results(self, request_id, result_type='result', priority=None):
+        """Получает результаты поиска"""
+        if priority is None:
+            priority = Priority.POLL if result_type == 'status' else Priority.INTERACTIVE
+        url = f"{self.base_url}/result.php"
+        
+        # Format parameters exactly as in example
+        params = {
+            'authlogin': self.auth['authlogin'],
+            'authpass': self.auth['authpass'],
+            'requestid': request_id,
+            'type': result_type,
+            'page': '1',
+            'onpage': '25'
+        }
+        
+        try:
+            # Create URL exactly as in example
+            full_url = f"{url}?{urlencode(params)}"
+            logger.info(f"Getting search results from URL: {full_url}")
+            
+            response = self._get_result_page(full_url, priority)
+            logger.info(f"Response status code: {response.status_code}")
+            logger.info(f"Response headers: {response.headers}")
+            logger.info(f"Raw response text: {response.text}")
+            
+            response.raise_for_status()
+            
+            # Parse XML response
+            try:
+                root = ET.fromstring(response.text)
+                if root.tag != 'data':
+                    logger.error(f"Unexpected root tag: {root.tag}")
+                    return None
+
+                result = {}
+                
+                # Parse status block
+                status_elem = root.find('status')
+                if status_elem is not None:
+                    result['status'] = self._parse_xml_to_dict(status_elem)
+                
+                # Parse result block if present
+                result_elem = root.find('result')
+                if result_elem is not None:
+                    hotels = []
+                    for hotel_elem in result_elem.findall('hotel'):
+                        hotel_data = self._parse_xml_to_dict(hotel_elem)
+                        hotels.append(hotel_data)
+                    result['result'] = {'hotels': hotels}
+                
+                return result
+                
+            except ET.ParseError as e:
+                logger.error(f"Failed to parse XML: {e}")
+                return None
+
+        except CircuitOpenError:
+            logger.warning(f"TourVisor circuit is open, results for {request_id} not requested")
+            return None
+        except Exception as e:
+            logger.error(f"Error getting results: {e}")
+            logger.error(f"Error type: {type(e)}")
+            import traceback
+            logger.error(f"Traceback: {traceback.format_exc()}")
+            return None
+
+    def get_reference_lists(self, types):
+        """Получает справочники (list.php), возвращает XML текст или None"""
+        params = {
+            'authlogin': self.auth['authlogin'],
+            'authpass': self.auth['authpass'],
+            'type': ','.join(types),
+        }
+        url = f"{self.base_url}/list.php?{urlencode(params)}"
+        try:
+            logger.info(f"Fetching reference lists: {','.join(types)}")
+            response = self._get(url, Priority.BACKGROUND, timeout=30)
+            response.raise_for_status()
+            return response.text
+        except Exception as e:
+            logger.error(f"Error fetching reference lists: {e}")
+            return None
+
+    def make_test_request(self, test_params=None):
+        """Make a test request to the API with provided or default parameters"""
+        if test_params is None:
+            now = datetime.now()
+            date_from = f"{now.day:02d}.{now.month:02d}.{now.year}"
+            date_to = (now + timedelta(days=7))
+            date_to = f"{date_to.day:02d}.{date_to.month:02d}.{date_to.year}"
+            
+            url = (
+                f"{self.base_url}/search.php"
+                f"?authlogin={self.auth['authlogin']}"
+                f"&authpass={self.auth['authpass']}"
+                f"&departure=1"  # Moscow
+                f"&country=1"    # Egypt
+                f"&datefrom={date_from}"
+                f"&dateto={date_to}"
+                f"&nightsfrom=7"
+                f"&nightsto=14"
+                f"&adults=2"
+                f"&child=0"
+            )
+        else:
+            url = f"{self.base_url}/search.php?{urlencode(test_params)}"
+        
+        logger.debug(f"Making test request to URL: {url}")
+        
+        try:
+            response = self._get(url, Priority.BACKGROUND, timeout=30)
+            
+            result = {
+                'url': url,
+                'status_code': response.status_code,
+                'headers': dict(response.headers),
+                'text': response.text,
+                'encoding': response.encoding
+            }
+            
+            # Try to parse XML
+            try:
+                root = ET.fromstring(response.text)
+                result['xml_valid'] = True
+                result['xml_root_tag'] = root.tag
+                if root.find('.//error') is not None:
+                    result['xml_error'] = root.find('.//error').text
+                if root.find('.//requestid') is not None:
+                    result['xml_requestid'] = root.find('.//requestid').text
+            except ET.ParseError as e:
+                result['xml_valid'] = False
+                result['xml_error'] = str(e)
+            
+            return result
+            
+        except Exception as e:
+            return {
+                'url': url,
+                'error': str(e),
+                'error_type': type(e).__name__
+            }
@@ -0,0 +1,243 @@
+"""Lightweight tracing spans with a local NDJSON exporter
+
+    with span('tourvisor.search', country=4):
+        ...
+
+The current span lives in a context variable, so nested spans in the same
+task (or in tasks created inside it) become its children. Work that
+continues elsewhere - a queued search job, a messenger relay calling the
+gateway - carries `current_context()` / a `traceparent` header and resumes
+the trace with `span(..., parent=...)`.
+
+Summary of the critical path per stage across the exported traces:
+
+    python tracing.py [data/traces.ndjson] [--top 20]
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+logger = logging.getLogger(__name__)
+
+# Трассировка выключена по умолчанию: span() тогда ничего не делает
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "0") == "1"
+TRACE_FILE = os.getenv(
+    "TRACE_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "traces.ndjson")
+)
+TRACEPARENT_HEADER = "traceparent"
+
+_current_span = ContextVar('current_span', default=None)
+
+
+class Span:
+    __slots__ = ('trace_id', 'span_id', 'parent_id', 'name', 'start', 'duration_ms', 'attrs', 'error', '_started')
+
+    def __init__(self, name, trace_id, parent_id, attrs):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attrs = attrs
+        self.error = None
+        self.start = time.time()
+        self.duration_ms = None
+        self._started = time.perf_counter()
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def finish(self):
+        self.duration_ms = (time.perf_counter() - self._started) * 1000
+
+    def to_dict(self):
+        record = {
+            'trace': self.trace_id,
+            'span': self.span_id,
+            'parent': self.parent_id,
+            'name': self.name,
+            'start': round(self.start, 6),
+            'ms': round(self.duration_ms, 3),
+        }
+        if self.attrs:
+            record['attrs'] = self.attrs
+        if self.error:
+            record['error'] = self.error
+        return record
+
+
+class NDJSONExporter:
+    """Appends finished spans to a local file, one JSON object per line"""
+
+    def __init__(self, path=TRACE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+
+    def export(self, span):
+        line = json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n"
+        try:
+            with self._lock:
+                if self._file is None:
+                    os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                    self._file = open(self.path, 'a', buffering=1, encoding='utf-8')
+                self._file.write(line)
+        except OSError as e:
+            logger.error(f"Failed to export span {span.name}: {e}")
+
+
+exporter = NDJSONExporter()
+
+
+class _NoSpan:
+    """Stand-in when tracing is disabled"""
+
+    def set(self, **attrs):
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+@contextmanager
+def span(name, parent=None, **attrs):
+    """Time a stage; `parent` is a context from current_context() / parse_traceparent()"""
+    if not TRACING_ENABLED:
+        yield _NO_SPAN
+        return
+    current = _current_span.get()
+    if parent:
+        trace_id, parent_id = parent['trace_id'], parent['span_id']
+    elif current is not None:
+        trace_id, parent_id = current.trace_id, current.span_id
+    else:
+        trace_id, parent_id = uuid.uuid4().hex, None
+    record = Span(name, trace_id, parent_id, attrs)
+    token = _current_span.set(record)
+    try:
+        yield record
+    except BaseException as e:
+        record.error = type(e).__name__
+        raise
+    finally:
+        _current_span.reset(token)
+        record.finish()
+        exporter.export(record)
+
+
+def current_context():
+    """{'trace_id', 'span_id'} of the current span, to continue the trace elsewhere"""
+    current = _current_span.get()
+    if current is None:
+        return None
+    return {'trace_id': current.trace_id, 'span_id': current.span_id}
+
+
+def traceparent():
+    """W3C traceparent header value of the current span, or None"""
+    context = current_context()
+    if context is None:
+        return None
+    return f"00-{context['trace_id']}-{context['span_id']}-01"
+
+
+def parse_traceparent(value):
+    parts = (value or '').split('-')
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    return {'trace_id': parts[1], 'span_id': parts[2]}
+
+
+def load_traces(path):
+    traces = defaultdict(list)
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            traces[record['trace']].append(record)
+    return traces
+
+
+def critical_path(spans):
+    """Milliseconds each stage contributes to the critical path of one trace
+
+    From the end of a span, walk back through the child that finished last,
+    then the child that finished last before that one started, and so on;
+    time not covered by such children is the span's own.
+    """
+    def end(record):
+        return record['start'] + record['ms'] / 1000
+
+    children = defaultdict(list)
+    by_id = {record['span']: record for record in spans}
+    roots = []
+    for record in spans:
+        parent = by_id.get(record.get('parent'))
+        # Работа, пережившая родителя (задача поиска после ответа чата), считается отдельно
+        if parent is not None and end(record) <= end(parent) + 0.001:
+            children[parent['span']].append(record)
+        else:
+            roots.append(record)
+
+    stages = defaultdict(float)
+
+    def walk(record):
+        cursor = end(record)
+        own = 0.0
+        for child in sorted(children[record['span']], key=end, reverse=True):
+            if end(child) > cursor + 0.001 or child['start'] < record['start']:
+                continue
+            own += max(cursor - end(child), 0)
+            walk(child)
+            cursor = child['start']
+        own += max(cursor - record['start'], 0)
+        stages[record['name']] += own * 1000
+
+    for root in roots:
+        walk(root)
+    return stages
+
+
+def _percentile(values, share):
+    values = sorted(values)
+    return values[min(int(len(values) * share), len(values) - 1)]
+
+
+def summarize(traces, top=20):
+    """Rows of (stage, traces, p50 ms, p95 ms, share of total critical path)"""
+    per_stage = defaultdict(list)
+    for spans in traces.values():
+        for stage, ms in critical_path(spans).items():
+            per_stage[stage].append(ms)
+    total = sum(sum(values) for values in per_stage.values()) or 1
+    rows = [
+        (stage, len(values), _percentile(values, 0.5), _percentile(values, 0.95), sum(values) / total)
+        for stage, values in per_stage.items()
+    ]
+    return sorted(rows, key=lambda row: row[4], reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Critical-path latency per stage across traces")
+    parser.add_argument('path', nargs='?', default=TRACE_FILE)
+    parser.add_argument('--top', type=int, default=20)
+    args = parser.parse_args()
+
+    traces = load_traces(args.path)
+    print(f"{len(traces)} traces from {args.path}")
+    print(f"{'stage':<32} {'traces':>7} {'p50 ms':>9} {'p95 ms':>9} {'share':>7}")
+    for stage, count, p50, p95, share in summarize(traces, args.top):
+        print(f"{stage:<32} {count:>7} {p50:>9.1f} {p95:>9.1f} {share:>6.1%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+import asyncio
+import logging
+import os
+
+from starlette.websockets import WebSocketDisconnect
+
+from responses import dumps_line
+
+logger = logging.getLogger(__name__)
+
+# Сколько сообщений может ждать отправки одному клиенту
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "32"))
+# Клиент, который столько не читает обязательные сообщения, отключается
+WS_SEND_TIMEOUT_SECONDS = 10
+# Как часто проверять задачу поиска (локальное хранилище, не TourVisor)
+WS_JOB_POLL_SECONDS = 0.25
+# Сколько отелей в одном сообщении с результатами
+WS_HOTEL_BATCH_SIZE = 10
+# Код закрытия для медленного клиента: "попробуйте позже"
+SLOW_CONSUMER_CLOSE_CODE = 1013
+
+
+class SlowConsumerError(Exception):
+    """The client does not read its messages fast enough"""
+
+
+class ChatConnection:
+    """Outgoing side of one WebSocket chat with a bounded send queue
+
+    Replies and hotel batches wait for room in the queue (send); progress
+    events are dropped when the queue is full (offer), since a newer one
+    follows anyway. A client that blocks required messages for longer than
+    the send timeout is disconnected.
+    """
+
+    def __init__(self, websocket, queue_size=WS_SEND_QUEUE_SIZE, send_timeout=WS_SEND_TIMEOUT_SECONDS):
+        self.websocket = websocket
+        self.send_timeout = send_timeout
+        self._queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+
+    @staticmethod
+    def _encode(event):
+        return dumps_line(event).rstrip("\n")
+
+    async def send(self, event):
+        try:
+            await asyncio.wait_for(self._queue.put(self._encode(event)), self.send_timeout)
+        except asyncio.TimeoutError:
+            raise SlowConsumerError(f"send queue full for {self.send_timeout}s")
+
+    def offer(self, event):
+        """Queue an event unless the client is behind; returns whether it was queued"""
+        try:
+            self._queue.put_nowait(self._encode(event))
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+
+    async def run_sender(self):
+        """Write queued messages to the socket until the connection closes"""
+        try:
+            while True:
+                text = await self._queue.get()
+                await self.websocket.send_text(text)
+        except (WebSocketDisconnect, RuntimeError):
+            pass
+
+    async def close_slow(self):
+        logger.warning("Closing WebSocket chat: client is not reading")
+        try:
+            await self.websocket.close(code=SLOW_CONSUMER_CLOSE_CODE)
+        except RuntimeError:
+            pass
+
+
+def hotel_batches(hotels, size=WS_HOTEL_BATCH_SIZE):
+    """Hotels in batches; an empty result is one empty batch"""
+    return [hotels[start:start + size] for start in range(0, len(hotels), size)] or [[]]